@@ -8,9 +8,15 @@ from routes.entries import entries_bp
 from routes.audio import audio_bp
 from routes.insights import insights_bp
 from config import config
+from commands import register_commands
 from models.user_model import User
+from utils.auth_tokens import is_token_revoked
 from flask_cors import CORS
-from mongoengine import connect, disconnect, ValidationError as MongoValidationError
+from mongoengine import ValidationError as MongoValidationError
+from utils.database import connect_database, warm_up_pool, get_readiness_check
+from utils.query_guard import init_query_guard
+from utils.metrics import init_metrics
+from utils.profiler import init_profiling
 
 
 load_dotenv()
@@ -31,6 +37,7 @@ def create_app(config_name=None):
     register_blueprints(app)
     # register_routes(app)
     register_error_handlers(app)
+    register_commands(app)
 
     return app
 
@@ -49,6 +56,17 @@ def init_extentions(app):
         return User.objects(id=user_id).first()
 
 
+    @jwt.token_in_blocklist_loader
+    def check_if_token_revoked(jwt_header,jwt_payload):
+        return is_token_revoked(jwt_payload)
+
+    @jwt.revoked_token_loader
+    def revoked_token_callback(_jwt_header,_jwt_payload):
+        return jsonify({
+            'error':'Token has been revoked',
+            'message':'The token has been revoked'
+        }),401
+
     @jwt.expired_token_loader
     def expired_token_callback(_jwt_header,_jwt_payload):
         return jsonify({
@@ -74,13 +92,13 @@ def init_extentions(app):
 
 
 
-    try:
-        connect(
-            host = app.config['MONGODB_URI'],
-        )
-        app.logger.info(f"Connected to MongoDB: {app.config['MONGODB_DB']}")
-    except Exception as e:
-        app.logger.error(f"Error connecting to MongoDB: {e}")
+    # Nothing here waits on the server, so an error is a bad setting and should stop the boot
+    connect_database(app)
+    app.logger.info(f"MongoDB client configured: {app.config['MONGODB_DB']}")
+    warm_up_pool(app)
+    init_query_guard(app)
+    init_metrics(app)
+    init_profiling(app)
 
 def register_blueprints(app):
     app.register_blueprint(auth_bp,url_prefix='/auth')
@@ -103,6 +121,7 @@ def register_blueprints(app):
                     'login': 'POST /api/auth/login',
                     'me': 'GET /api/auth/me (requires token)',
                     'verify': 'POST /api/auth/verify (requires token)',
+                    'refresh': 'POST /api/auth/refresh (requires refresh token)',
                     'logout': 'POST /api/auth/logout (requires token)'
                 }
             }
@@ -110,23 +129,29 @@ def register_blueprints(app):
 
     @app.route('/health/')
     def health_check():
-        try:
-            user_count = User.objects.count()
-            db_status = 'connected'
-
-        except Exception as e:
-            user_count = None
-            db_status = f"error: {e}"
-
+        readiness = get_readiness_check(app.config.get('HEALTH_READY_CACHE_SECONDS', 5.0)).check()
         return jsonify({
-            'status': 'healthy',
+            'status': 'healthy' if readiness['ready'] else 'degraded',
             'timestamp' : datetime.now().isoformat(),
             'database':{
-                'status':db_status,
-                'users_count':user_count
+                'status':'connected' if readiness['ready'] else f"error: {readiness['error']}",
+                'latency_ms':readiness.get('latency_ms')
             }
         })
 
+    @app.route('/health/live')
+    def liveness_check():
+        # The process is serving requests; dependencies are checked by /health/ready
+        return jsonify({'status': 'alive'})
+
+    @app.route('/health/ready')
+    def readiness_check():
+        readiness = get_readiness_check(app.config.get('HEALTH_READY_CACHE_SECONDS', 5.0)).check()
+        return jsonify({
+            'status': 'ready' if readiness['ready'] else 'not ready',
+            'database': readiness
+        }), 200 if readiness['ready'] else 503
+
     @app.route('/users/',methods = ['GET'])
     def list_users():
         try:
@@ -163,8 +188,15 @@ if __name__=='__main__':
     
     # Start background insight processor
     with app.app_context():
+        from utils.transcription import fail_stale_transcriptions, start_transcription_worker
+        fail_stale_transcriptions(app.config['TRANSCRIPTION_WAIT_TIMEOUT'])
+        start_transcription_worker(app)
+
         from utils.insight_processor import start_insight_processor
         start_insight_processor(app)
         app.logger.info("Background insight processor started")
+
+        from utils.audio_gc import start_audio_gc
+        start_audio_gc(app)
     
     app.run(host='0.0.0.0',port=8000,debug=True)
\ No newline at end of file
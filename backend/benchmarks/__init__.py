@@ -0,0 +1,4 @@
+"""
+Reproducible load tests: a synthetic dataset generator, a local
+OpenAI-compatible stub and scripted scenarios run with `python -m benchmarks`.
+"""
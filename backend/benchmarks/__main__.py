@@ -0,0 +1,172 @@
+"""
+Run the benchmark scenarios against a local mongod and the OpenAI stub.
+
+    python -m benchmarks --users 50 --entries 200 --concurrency 8
+    python -m benchmarks --scenario history_scroll --scenario stats_dashboard
+    python -m benchmarks --save-baseline    # record the current numbers
+
+Each run drops and reloads the benchmark database, so MONGODB_URI must name a
+database containing 'bench'. Results are compared with the baseline file and
+the run fails when a scenario's p95 latency or throughput is worse than the
+baseline by more than --tolerance.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+DEFAULT_MONGODB_URI = 'mongodb://localhost:27017/mood_journal_bench'
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--mongodb-uri', default=os.environ.get('BENCH_MONGODB_URI', DEFAULT_MONGODB_URI))
+    parser.add_argument('--users', type=int, default=20, help='Synthetic users to generate.')
+    parser.add_argument('--entries', type=int, default=100, help='Mood entries per user.')
+    parser.add_argument('--audio-ratio', type=float, default=0.2, help='Share of entries with a voice note.')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--scenario', action='append', dest='scenarios',
+                        help='Scenario to run (repeatable); all of them by default.')
+    parser.add_argument('--requests', type=int, default=500, help='Requests per scenario.')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clients.')
+    parser.add_argument('--backlog', type=int, default=200, help='Entries requeued for the insight drain.')
+    parser.add_argument('--stub-latency', type=float, default=0.3, help='Mean OpenAI stub response time in seconds.')
+    parser.add_argument('--stub-jitter', type=float, default=0.1)
+    parser.add_argument('--stub-error-rate', type=float, default=0.0)
+    parser.add_argument('--stub-rate-limit-rate', type=float, default=0.0)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='Baseline file to compare with or save to.')
+    parser.add_argument('--save-baseline', action='store_true', help='Write this run as the new baseline.')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed regression as a fraction of the baseline.')
+    parser.add_argument('--output', help='Also write the results as JSON to this file.')
+    return parser.parse_args(argv)
+
+
+def configure_environment(args, stub, upload_dir):
+    """Settings for the app under test; must run before the app modules are imported"""
+    os.environ.update({
+        'FLASK_ENV': 'production',
+        'MONGODB_URI': args.mongodb_uri,
+        'MONGODB_WARMUP_CONNECTIONS': '0',
+        'MONGODB_MAX_POOL_SIZE': str(max(100, args.concurrency * 2)),
+        'QUERY_LOG_REQUESTS': 'false',
+        'METRICS_ENABLED': 'true',
+        'UPLOAD_FOLDER': upload_dir,
+        'AUDIO_STORAGE_BACKEND': 'local',
+        'AUDIO_TRANSCODE_ENABLED': 'false',
+        'TRANSCRIPTION_ENABLED': 'false',
+        'OPENAI_API_KEY': 'stub',
+        'OPENAI_BASE_URL': stub.base_url,
+        'AI_USER_DAILY_TOKEN_BUDGET': '0',
+        'AI_GLOBAL_DAILY_TOKEN_BUDGET': '0',
+        'CORS_ORIGINS': '*',
+    })
+    os.environ.setdefault('JWT_SECRET_KEY', 'bench-jwt-secret')
+
+
+def load_dataset(app, args):
+    """Drop the benchmark database, sync the indexes and load the synthetic data"""
+    from mongoengine.connection import get_db
+    from benchmarks.data import generate
+
+    with app.app_context():
+        db = get_db()
+        if 'bench' not in db.name:
+            raise SystemExit(f"Refusing to drop database '{db.name}': benchmark databases must contain 'bench'")
+        db.client.drop_database(db.name)
+
+        result = app.test_cli_runner().invoke(args=['indexes', 'sync'])
+        if result.exit_code != 0:
+            raise SystemExit(f"Index sync failed:\n{result.output or result.exception}")
+
+        started = time.perf_counter()
+        users = generate(args.users, args.entries, audio_ratio=args.audio_ratio, seed=args.seed)
+        print(f"Loaded {args.users} users x {args.entries} entries in {time.perf_counter() - started:.1f}s")
+    return users
+
+
+def compare(results, baseline, tolerance):
+    """Regression messages for results worse than the baseline by more than tolerance"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if base['p95_ms'] and result['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {result['p95_ms']:.1f}ms vs baseline {base['p95_ms']:.1f}ms")
+        if base['throughput'] and result['throughput'] < base['throughput'] * (1 - tolerance):
+            regressions.append(f"{name}: {result['throughput']:.1f} req/s vs baseline {base['throughput']:.1f} req/s")
+    return regressions
+
+
+def print_report(results):
+    print(f"\n{'scenario':<24}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, result in results.items():
+        print(f"{name:<24}{result['requests']:>10}{result['errors']:>8}{result['throughput']:>10.1f}"
+              f"{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}{result['p99_ms']:>10.1f}")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    from benchmarks.openai_stub import OpenAIStub
+
+    stub = OpenAIStub(latency=args.stub_latency, jitter=args.stub_jitter, error_rate=args.stub_error_rate,
+                      rate_limit_rate=args.stub_rate_limit_rate, seed=args.seed).start()
+    upload_dir = tempfile.mkdtemp(prefix='mood-journal-bench-')
+    configure_environment(args, stub, upload_dir)
+
+    from app import create_app
+    from benchmarks.scenarios import SCENARIOS
+
+    unknown = set(args.scenarios or ()) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"Unknown scenario(s): {', '.join(sorted(unknown))}; choose from {', '.join(SCENARIOS)}")
+
+    app = create_app()
+    app.logger.setLevel(logging.WARNING)
+    try:
+        users = load_dataset(app, args)
+        results = {}
+        for name in args.scenarios or SCENARIOS:
+            print(f"Running {name}...")
+            results[name] = SCENARIOS[name](app, users, args).to_dict()
+    finally:
+        stub.stop()
+
+    print_report(results)
+    print(f"\nOpenAI stub: {stub.stats}")
+
+    params = {key: getattr(args, key) for key in ('users', 'entries', 'audio_ratio', 'seed', 'requests', 'concurrency', 'backlog',
+                                                  'stub_latency', 'stub_jitter', 'stub_error_rate', 'stub_rate_limit_rate')}
+    report = {'params': params, 'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No baseline to compare with; run with --save-baseline to record one")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get('params') != params:
+        print("Baseline was recorded with different parameters; comparing anyway")
+    regressions = compare(results, baseline.get('results', {}), args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if not regressions:
+        print(f"No regressions beyond {args.tolerance:.0%} of the baseline")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
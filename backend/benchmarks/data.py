@@ -0,0 +1,148 @@
+"""
+Synthetic benchmark data: users, mood entries with notes, and audio clips.
+Everything is derived from a seed, so two runs with the same arguments load
+the same dataset.
+"""
+
+import hashlib
+import io
+import math
+import os
+import random
+import tempfile
+import uuid
+import wave
+from datetime import datetime, timedelta
+
+from models.audio_model import AudioBlob, AudioFile
+from models.mood_model import Mood, MoodEntry
+from models.user_model import User
+from utils.file_handler import AudioFileHandler
+from utils.password_hasher import get_password_hasher
+from utils.storage import get_temp_dir
+
+PASSWORD = 'Bench-password-1'
+
+EMOTIONS = [('happy', '😊'), ('sad', '😢'), ('neutral', '😐'), ('angry', '😠'), ('anxious', '😰')]
+
+SENTENCES = [
+    "Work was busier than expected and I barely had time for lunch.",
+    "Went for a long walk by the river after dinner.",
+    "Had a difficult conversation with my sister about the holidays.",
+    "Slept badly again, woke up at four and couldn't get back to sleep.",
+    "Finished the project I have been putting off for weeks.",
+    "Felt left out when my friends made plans without me.",
+    "The weather was lovely and I spent the afternoon in the garden.",
+    "Deadline moved up by a week, not sure how we will make it.",
+    "Cooked a new recipe and it actually turned out well.",
+    "Traffic was terrible and I was late for the appointment.",
+    "Called my grandmother, she sounded happier than last time.",
+    "Could not focus at all today, kept checking my phone.",
+]
+
+CLIP_COUNT = 5  # distinct audio payloads; entries share them like repeated uploads would
+
+
+def make_wav(seconds=2.0, frequency=440.0, rate=8000):
+    """A mono 16-bit sine tone as WAV bytes"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(rate)
+        out.writeframes(b''.join(
+            int(12000 * math.sin(2 * math.pi * frequency * i / rate)).to_bytes(2, 'little', signed=True)
+            for i in range(int(seconds * rate))
+        ))
+    return buffer.getvalue()
+
+
+def make_note(rng):
+    return ' '.join(rng.sample(SENTENCES, rng.randint(1, 4)))
+
+
+def _store_clips(rng):
+    """Store the shared audio clips; returns [(content_hash, size, seconds)]"""
+    clips = []
+    for index in range(CLIP_COUNT):
+        seconds = rng.uniform(2, 8)
+        data = make_wav(seconds, frequency=220 + 110 * index)
+        fd, path = tempfile.mkstemp(dir=get_temp_dir(), suffix='.wav')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        content_hash = hashlib.sha256(data).hexdigest()
+        AudioFileHandler.store_blob(path, content_hash, 'audio/wav')
+        clips.append((content_hash, len(data), round(seconds, 2)))
+    return clips
+
+
+def generate(users=20, entries_per_user=50, audio_ratio=0.2, processed_ratio=0.9, seed=1, batch_size=1000):
+    """
+    Load users x entries_per_user entries into the current database.
+    Returns the generated users as [(id, email)]; they all use PASSWORD.
+    """
+    rng = random.Random(seed)
+    # One hash for everyone: hashing is what the login scenario measures, not the loader
+    password_hash = get_password_hasher().hash(PASSWORD)
+    now = datetime.utcnow()
+
+    people = [User(
+        id=str(uuid.UUID(int=rng.getrandbits(128))),
+        email=f'bench{index}@example.com',
+        first_name='Bench',
+        last_name=f'User{index}',
+        password_hash=password_hash,
+        created_at=now - timedelta(days=365),
+    ) for index in range(users)]
+    User.objects.insert(people, load_bulk=False)
+
+    clips = _store_clips(rng)
+    clip_refs = {content_hash: 0 for content_hash, _, _ in clips}
+
+    batch = []
+    for user in people:
+        for _ in range(entries_per_user):
+            emotion, emoji = rng.choice(EMOTIONS)
+            note = make_note(rng)
+            entry_date = now - timedelta(days=rng.uniform(0, 360))
+            entry = MoodEntry(
+                id=str(uuid.UUID(int=rng.getrandbits(128))),
+                user=user,
+                mood=Mood(emoji=emoji, emotion=emotion),
+                text_note=note,
+                entry_date=entry_date,
+                created_at=entry_date,
+                updated_at=entry_date,
+                synced=True,
+            )
+            if rng.random() < audio_ratio:
+                content_hash, size, seconds = rng.choice(clips)
+                clip_refs[content_hash] += 1
+                entry.audio_file = AudioFile(
+                    filename=f'{uuid.UUID(int=rng.getrandbits(128)).hex}.wav',
+                    content_hash=content_hash,
+                    original_filename='voice-note.wav',
+                    file_size=size,
+                    duration=seconds,
+                    content_type='audio/wav',
+                    uploaded_timestamp=entry_date,
+                    transcode_status='skipped',
+                    transcript=note,
+                    transcript_status='done',
+                )
+            if rng.random() < processed_ratio:
+                entry.ai_insight = "Thanks for writing this down; it sounds like a full day."
+                entry.ai_processed = True
+                entry.ai_processed_at = entry_date
+                entry.ai_insight_source = 'llm'
+            batch.append(entry)
+            if len(batch) >= batch_size:
+                MoodEntry.objects.insert(batch, load_bulk=False)
+                batch = []
+    if batch:
+        MoodEntry.objects.insert(batch, load_bulk=False)
+
+    # store_blob took one reference per clip; set the real counts so audio GC stays correct
+    for content_hash, refs in clip_refs.items():
+        AudioBlob.objects(id=content_hash).update_one(set__ref_count=max(refs, 1))
+    return [(user.id, user.email) for user in people]
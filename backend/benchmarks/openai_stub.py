@@ -0,0 +1,147 @@
+"""
+Local OpenAI-compatible chat completions stub.
+Answers POST /v1/chat/completions after a configurable latency, and injects
+server errors and rate limits at configurable rates, so insight generation
+can be load tested offline and without spending tokens.
+
+    python -m benchmarks.openai_stub --port 8089 --latency 0.4 --error-rate 0.02
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubSettings:
+    def __init__(self, latency=0.3, jitter=0.1, error_rate=0.0, rate_limit_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'completions': 0, 'errors': 0, 'rate_limited': 0}
+
+    def draw(self):
+        """Latency and outcome ('ok', 'error' or 'rate_limited') of the next request"""
+        with self.lock:
+            self.stats['requests'] += 1
+            latency = max(0.0, self.random.gauss(self.latency, self.jitter)) if self.jitter else self.latency
+            roll = self.random.random()
+            if roll < self.rate_limit_rate:
+                outcome = 'rate_limited'
+            elif roll < self.rate_limit_rate + self.error_rate:
+                outcome = 'error'
+            else:
+                outcome = 'ok'
+            self.stats[{'ok': 'completions', 'error': 'errors', 'rate_limited': 'rate_limited'}[outcome]] += 1
+        return latency, outcome
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, headers=None):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            return self._send(404, {'error': {'message': 'Not found', 'type': 'invalid_request_error'}})
+
+        latency, outcome = self.server.settings.draw()
+        time.sleep(latency)
+        if outcome == 'rate_limited':
+            return self._send(429, {'error': {'message': 'Rate limit reached', 'type': 'rate_limit_error', 'code': 'rate_limit_exceeded'}},
+                              {'Retry-After': '1'})
+        if outcome == 'error':
+            return self._send(500, {'error': {'message': 'Injected server error', 'type': 'server_error'}})
+
+        prompt = ' '.join(str(message.get('content', '')) for message in request.get('messages', []))
+        max_tokens = request.get('max_tokens') or 200
+        words = ['It', 'sounds', 'like', 'today', 'carried', 'a', 'lot;', 'noticing', 'how', 'you', 'feel', 'is', 'a', 'good', 'first', 'step.']
+        text = ' '.join(words[i % len(words)] for i in range(min(max_tokens, 60)))
+        prompt_tokens = len(prompt.split())
+        completion_tokens = len(text.split())
+        self._send(200, {
+            'id': f'chatcmpl-stub-{time.time_ns()}',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': request.get('model', 'stub'),
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': text}, 'finish_reason': 'stop'}],
+            'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens, 'total_tokens': prompt_tokens + completion_tokens},
+        })
+
+
+class OpenAIStub:
+    """The stub server running on a background thread."""
+
+    def __init__(self, host='127.0.0.1', port=0, **settings):
+        self.server = ThreadingHTTPServer((host, port), StubHandler)
+        self.server.daemon_threads = True
+        self.server.settings = StubSettings(**settings)
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/v1'
+
+    @property
+    def stats(self):
+        with self.server.settings.lock:
+            return dict(self.server.settings.stats)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True, name='openai-stub')
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', type=float, default=0.3, help='Mean response time in seconds.')
+    parser.add_argument('--jitter', type=float, default=0.1, help='Standard deviation of the response time.')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with 500.')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Share of requests answered with 429.')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    stub = OpenAIStub(args.host, args.port, latency=args.latency, jitter=args.jitter,
+                      error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate, seed=args.seed)
+    print(f"OpenAI stub listening on {stub.base_url}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"Served {stub.stats}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+"""
+Scripted load scenarios run against the app with concurrent test clients.
+Each scenario returns a Result with its latencies, so the runner can report
+throughput and percentiles and compare them with the stored baseline.
+"""
+
+import io
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask_jwt_extended import create_access_token
+
+from benchmarks.data import PASSWORD, make_wav
+from models.mood_model import Mood, MoodEntry
+
+
+class Result:
+    def __init__(self, name, latencies, errors, duration):
+        self.name = name
+        self.latencies = sorted(latencies)
+        self.errors = errors
+        self.duration = duration
+
+    @property
+    def requests(self):
+        return len(self.latencies)
+
+    @property
+    def throughput(self):
+        return self.requests / self.duration if self.duration else 0.0
+
+    def percentile(self, p):
+        """Latency in ms at percentile p (nearest rank)"""
+        if not self.latencies:
+            return 0.0
+        index = min(len(self.latencies) - 1, max(0, int(round(p / 100 * len(self.latencies))) - 1))
+        return self.latencies[index] * 1000
+
+    def to_dict(self):
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'throughput': round(self.throughput, 2),
+            'p50_ms': round(self.percentile(50), 2),
+            'p95_ms': round(self.percentile(95), 2),
+            'p99_ms': round(self.percentile(99), 2),
+        }
+
+
+def run_load(name, app, operation, total, concurrency):
+    """
+    Call operation(client, index) for index in range(total) from concurrency
+    threads, each with its own test client. operation returns True on success.
+    """
+    local = threading.local()
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def call(index):
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+        started = time.perf_counter()
+        try:
+            ok = operation(local.client, index)
+        except Exception:
+            ok = False
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            if not ok:
+                errors.append(index)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f'bench-{name}') as executor:
+        list(executor.map(call, range(total)))
+    return Result(name, latencies, len(errors), time.perf_counter() - started)
+
+
+def _auth(tokens, index):
+    return {'Authorization': f'Bearer {tokens[index % len(tokens)]}'}
+
+
+def make_tokens(app, users):
+    with app.app_context():
+        return [create_access_token(identity=user_id) for user_id, _ in users]
+
+
+def login_storm(app, users, args):
+    """Many users logging in at once; dominated by password hashing"""
+    def login(client, index):
+        _, email = users[index % len(users)]
+        return client.post('/auth/login/', json={'email': email, 'password': PASSWORD}).status_code == 200
+    return run_load('login_storm', app, login, args.requests, args.concurrency)
+
+
+def history_scroll(app, users, args):
+    """Paging back through the entry history, 20 entries per page"""
+    tokens = make_tokens(app, users)
+
+    def scroll(client, index):
+        page = (index // len(tokens)) % 5
+        response = client.get(f'/api/entries?limit=20&offset={page * 20}&days=365', headers=_auth(tokens, index))
+        return response.status_code == 200
+    return run_load('history_scroll', app, scroll, args.requests, args.concurrency)
+
+
+def stats_dashboard(app, users, args):
+    """Loading the dashboard: mood stats plus insight status"""
+    tokens = make_tokens(app, users)
+
+    def dashboard(client, index):
+        headers = _auth(tokens, index)
+        stats = client.get('/api/entries/stats?days=30', headers=headers)
+        status = client.get('/api/insights/status', headers=headers)
+        return stats.status_code == 200 and status.status_code == 200
+    return run_load('stats_dashboard', app, dashboard, args.requests, args.concurrency)
+
+
+def audio_upload(app, users, args):
+    """Uploading a voice note to a fresh entry"""
+    tokens = make_tokens(app, users)
+    clip = make_wav(3.0)
+    with app.app_context():
+        # Entries to attach the uploads to; created up front so only the upload is timed
+        entry_ids = []
+        for index in range(args.requests):
+            user_id, _ = users[index % len(users)]
+            entry = MoodEntry(user=user_id, mood=Mood(emoji='😐', emotion='neutral'), entry_date=datetime.utcnow() - timedelta(hours=1))
+            entry.ai_processed = True
+            entry_ids.append(entry.save().id)
+
+    def upload(client, index):
+        response = client.post('/api/audio/upload', headers=_auth(tokens, index), content_type='multipart/form-data', data={
+            'entry_id': entry_ids[index],
+            'audio': (io.BytesIO(clip), f'{uuid.uuid4().hex}.wav', 'audio/wav'),
+        })
+        return response.status_code == 201
+    return run_load('audio_upload', app, upload, args.requests, args.concurrency)
+
+
+def audio_playback(app, users, args):
+    """Streaming the stored voice notes back"""
+    tokens = make_tokens(app, users)
+    with app.app_context():
+        owned = {user_id: index for index, (user_id, _) in enumerate(users)}
+        files = [(owned[entry.user.id], entry.audio_file.filename)
+                 for entry in MoodEntry.objects(audio_file__exists=True, user__in=list(owned)).only('user', 'audio_file').limit(500)]
+    if not files:
+        return Result('audio_playback', [], 0, 0.0)
+
+    def play(client, index):
+        user_index, filename = files[index % len(files)]
+        response = client.get(f'/api/audio/{filename}', headers=_auth(tokens, user_index))
+        response.close()
+        return response.status_code in (200, 206)
+    return run_load('audio_playback', app, play, args.requests, args.concurrency)
+
+
+def insight_backlog_drain(app, users, args):
+    """Draining a backlog of unprocessed entries through the OpenAI stub"""
+    from utils.insight_processor import get_processor
+    from utils.insight_retry import record_insight_failure
+
+    with app.app_context():
+        ids = [entry.id for entry in MoodEntry.objects(ai_processed=True).only('id').limit(args.backlog)]
+        MoodEntry.objects(id__in=ids).update(
+            set__ai_processed=False, set__ai_processing_failed=False, set__ai_priority=MoodEntry.PRIORITY_BACKFILL,
+            set__ai_attempts=0, unset__ai_insight=True, unset__ai_next_attempt_at=True
+        )
+        processor = get_processor(app)
+        entries = MoodEntry.get_unprocessed_entries(limit=args.backlog, transcript_wait=app.config.get('TRANSCRIPTION_WAIT_TIMEOUT'))
+
+    def process(client, index):
+        with app.app_context():
+            entry = entries[index]
+            try:
+                processor.process_entry(entry)
+            except Exception as e:
+                record_insight_failure(entry, e)
+                return False
+            return True
+    return run_load('insight_backlog_drain', app, process, len(entries), args.concurrency)
+
+
+SCENARIOS = {
+    'login_storm': login_storm,
+    'history_scroll': history_scroll,
+    'stats_dashboard': stats_dashboard,
+    'audio_upload': audio_upload,
+    'audio_playback': audio_playback,
+    'insight_backlog_drain': insight_backlog_drain,
+}
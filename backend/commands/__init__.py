@@ -0,0 +1,12 @@
+# Flask CLI command groups
+from commands.audio import audio_cli
+from commands.insights import insights_cli
+from commands.indexes import indexes_cli
+from commands.profile import profile_cli
+
+
+def register_commands(app):
+    app.cli.add_command(audio_cli)
+    app.cli.add_command(insights_cli)
+    app.cli.add_command(indexes_cli)
+    app.cli.add_command(profile_cli)
@@ -0,0 +1,117 @@
+"""
+Audio storage maintenance commands
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from models.mood_model import MoodEntry
+from utils.file_handler import AudioFileHandler
+from utils.storage import get_storage, get_temp_dir
+from utils.audio_gc import build_collector
+
+audio_cli = AppGroup('audio', help='Audio storage maintenance.')
+
+
+def _hash_file(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(AudioFileHandler.HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _move_object(storage, source_key, target_key):
+    """Move a stored object to a new key, dropping it if the target already exists"""
+    if storage.exists(target_key):
+        storage.delete(source_key)
+        return
+    with storage.local_copy(source_key) as path:
+        fd, temp_path = tempfile.mkstemp(dir=get_temp_dir())
+        os.close(fd)
+        shutil.copyfile(path, temp_path)
+    storage.put_file(target_key, temp_path)
+    storage.delete(source_key)
+
+
+@audio_cli.command('migrate-store')
+@click.option('--dry-run', is_flag=True, help='Report what would be migrated without moving files.')
+@click.option('--batch-size', default=500, show_default=True, help='Entries fetched per cursor batch.')
+def migrate_store(dry_run, batch_size):
+    """Move flat-layout audio files into the content-addressed store."""
+    entries = MoodEntry.objects(
+        audio_file__exists=True,
+        audio_file__content_hash=None
+    ).only('id', 'audio_file').batch_size(batch_size)
+
+    storage = get_storage()
+    migrated = deduplicated = missing = 0
+    for entry in entries.no_cache():
+        audio = entry.audio_file
+        legacy_key = AudioFileHandler.get_storage_key(audio.filename)
+        if not storage.exists(legacy_key):
+            click.echo(f"missing: {audio.filename} (entry {entry.id})")
+            missing += 1
+            continue
+
+        with storage.local_copy(legacy_key) as legacy_path:
+            content_hash = _hash_file(legacy_path)
+        blob_key = AudioFileHandler.get_storage_key(content_hash, content_hash)
+        already_stored = storage.exists(blob_key)
+        if dry_run:
+            click.echo(f"would migrate: {audio.filename} -> {content_hash}{' (duplicate)' if already_stored else ''}")
+            migrated += 1
+            deduplicated += int(already_stored)
+            continue
+
+        # Copy into the store; the legacy object is removed once the entry points at the blob
+        with storage.local_copy(legacy_key) as legacy_path:
+            fd, temp_path = tempfile.mkstemp(dir=get_temp_dir())
+            os.close(fd)
+            shutil.copyfile(legacy_path, temp_path)
+        AudioFileHandler.store_blob(temp_path, content_hash, audio.content_type)
+        updates = {'set__audio_file__content_hash': content_hash}
+
+        # Carry the compact rendition over, unless the blob already has one
+        if audio.compact_filename:
+            compact_filename = f"{content_hash}.{audio.compact_filename.split('.', 1)[1]}"
+            legacy_compact_key = AudioFileHandler.get_storage_key(audio.compact_filename)
+            if storage.exists(legacy_compact_key):
+                _move_object(storage, legacy_compact_key, AudioFileHandler.get_storage_key(compact_filename, content_hash))
+            updates['set__audio_file__compact_filename'] = compact_filename
+
+        if not MoodEntry.objects(id=entry.id, audio_file__filename=audio.filename).update_one(**updates):
+            # Entry changed underneath us; give the reference back
+            AudioFileHandler.release_blob(content_hash)
+            continue
+
+        storage.delete(legacy_key)
+        migrated += 1
+        deduplicated += int(already_stored)
+
+    current_app.logger.info(f"Audio store migration: {migrated} migrated, {deduplicated} deduplicated, {missing} missing")
+    click.echo(f"{'Would migrate' if dry_run else 'Migrated'} {migrated} files ({deduplicated} duplicates), {missing} missing")
+
+
+@audio_cli.command('gc')
+@click.option('--dry-run', is_flag=True, default=None, help='Only report orphaned files.')
+@click.option('--quarantine', is_flag=True, default=None, help='Move orphans under quarantine/ instead of deleting them.')
+@click.option('--batch-size', type=int, help='Keys checked against the database per query.')
+@click.option('--rate', type=float, help='Maximum deletions per second.')
+def collect_garbage(dry_run, quarantine, batch_size, rate):
+    """Remove stored audio that no mood entry references."""
+    collector = build_collector(
+        current_app.config,
+        dry_run=dry_run,
+        quarantine=quarantine,
+        batch_size=batch_size,
+        max_deletes_per_second=rate
+    )
+    stats = collector.run()
+    for key, value in stats.items():
+        click.echo(f"{key}: {value}")
@@ -0,0 +1,138 @@
+"""
+Index management commands
+"""
+
+from datetime import datetime, timedelta
+import click
+from flask.cli import AppGroup
+from pymongo.errors import OperationFailure
+
+from models.audio_model import AudioBlob
+from models.backfill_model import BackfillJob
+from models.dead_letter_model import InsightDeadLetter
+from models.mood_model import MoodEntry
+from models.token_model import RefreshToken, RevokedAccessToken
+from models.usage_model import TokenUsage
+from models.user_model import User
+
+indexes_cli = AppGroup('indexes', help='MongoDB index management.')
+
+MODELS = [User, MoodEntry, AudioBlob, RefreshToken, RevokedAccessToken, TokenUsage, InsightDeadLetter, BackfillJob]
+
+
+def _collection(model):
+    # Raw collection, so inspecting it never triggers mongoengine's automatic index build
+    return model._get_db()[model._get_collection_name()]
+
+
+# Index options that change what an index does; an index whose options differ from the declaration is rebuilt
+INDEX_OPTIONS = ('unique', 'sparse', 'expireAfterSeconds', 'partialFilterExpression')
+
+
+def _key(fields):
+    return tuple((name, direction) for name, direction in fields)
+
+
+def _options(spec):
+    """The behaviour-changing options of an index spec or index_information entry, defaults left out"""
+    return {name: spec[name] for name in INDEX_OPTIONS if spec.get(name) is not None and spec.get(name) is not False}
+
+
+def _index_usage(collection):
+    """{index name: accesses document} from $indexStats, or None if the server can't report it"""
+    try:
+        return {stats['name']: stats['accesses'] for stats in collection.aggregate([{'$indexStats': {}}])}
+    except OperationFailure:
+        return None
+
+
+def diff_indexes(model):
+    """
+    Compare a model's declared indexes with the collection's.
+    Returns (missing specs, [(name, spec, existing options)] of indexes whose options changed,
+    [(name, key, accesses)] of undeclared indexes, {name: accesses} of declared ones)
+    """
+    collection = _collection(model)
+    declared = {_key(spec['fields']): spec for spec in model._meta['index_specs']}
+    existing = {_key(info['key']): (name, info) for name, info in collection.index_information().items() if name != '_id_'}
+    usage = _index_usage(collection) or {}
+
+    missing = [spec for key, spec in declared.items() if key not in existing]
+    changed = [(name, declared[key], _options(info)) for key, (name, info) in existing.items()
+               if key in declared and _options(info) != _options(declared[key])]
+    extra = [(name, key, usage.get(name)) for key, (name, _) in existing.items() if key not in declared]
+    used = {name: usage.get(name) for key, (name, _) in existing.items() if key in declared}
+    return missing, changed, extra, used
+
+
+def _describe(key):
+    return ', '.join(f"{name} {direction}" for name, direction in key)
+
+
+def _describe_options(options):
+    return ', '.join(f"{name}={value}" for name, value in options.items()) or 'no options'
+
+
+def _ops(accesses):
+    return '?' if accesses is None else f"{accesses['ops']} ops since {accesses['since']:%Y-%m-%d}"
+
+
+def _is_unused(accesses, unused_days):
+    # No stats means we can't tell, and stats that restarted recently don't prove anything
+    if accesses is None:
+        return False
+    return accesses['ops'] == 0 and accesses['since'] <= datetime.utcnow() - timedelta(days=unused_days)
+
+
+@indexes_cli.command('status')
+def status():
+    """Show declared indexes missing from the database and undeclared ones present."""
+    for model in MODELS:
+        missing, changed, extra, used = diff_indexes(model)
+        click.echo(f"{model._get_collection_name()}:")
+        for spec in missing:
+            click.echo(f"  missing     {_describe(spec['fields'])}")
+        for name, spec, options in changed:
+            click.echo(f"  changed     {name} ({_describe_options(options)} -> {_describe_options(_options(spec))})")
+        for name, key, accesses in extra:
+            click.echo(f"  undeclared  {name} ({_ops(accesses)})")
+        for name, accesses in used.items():
+            if accesses is not None and accesses['ops'] == 0:
+                click.echo(f"  unused      {name} ({_ops(accesses)})")
+        if not (missing or changed or extra):
+            click.echo("  in sync")
+
+
+@indexes_cli.command('sync')
+@click.option('--drop-unused', is_flag=True, help='Drop undeclared indexes that $indexStats shows are unused.')
+@click.option('--unused-days', default=7, show_default=True, help='Only drop indexes without an access for this many days.')
+@click.option('--dry-run', is_flag=True, help='Print what would change without touching the database.')
+def sync(drop_unused, unused_days, dry_run):
+    """Build missing indexes in the background and optionally drop unused ones."""
+    for model in MODELS:
+        collection = _collection(model)
+        missing, changed, extra, _ = diff_indexes(model)
+
+        # An index can't be altered in place, so one with changed options is dropped and built again
+        for name, spec, options in changed:
+            click.echo(f"{collection.name}: rebuilding {name} ({_describe_options(options)} -> {_describe_options(_options(spec))})")
+            if not dry_run:
+                collection.drop_index(name)
+            missing.append(spec)
+
+        for spec in missing:
+            options = {name: value for name, value in spec.items() if name not in ('fields', 'cls')}
+            click.echo(f"{collection.name}: creating {_describe(spec['fields'])}")
+            if not dry_run:
+                # background=True keeps the collection writable while the index builds on older servers
+                collection.create_index(list(spec['fields']), background=True, **options)
+
+        for name, key, accesses in extra:
+            if not drop_unused:
+                click.echo(f"{collection.name}: {name} is not declared ({_ops(accesses)}), keeping it")
+            elif _is_unused(accesses, unused_days):
+                click.echo(f"{collection.name}: dropping unused {name}")
+                if not dry_run:
+                    collection.drop_index(name)
+            else:
+                click.echo(f"{collection.name}: {name} is not declared but may still be in use ({_ops(accesses)}), keeping it")
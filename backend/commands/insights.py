@@ -0,0 +1,269 @@
+"""
+AI insight pipeline commands
+"""
+
+import multiprocessing
+import signal
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from mongoengine import Q
+
+from models.backfill_model import BackfillJob
+from models.mood_model import MoodEntry
+from models.user_model import User
+from utils.ai_service import AIServiceDegradedError
+from utils.insight_processor import get_processor
+from utils.insight_retry import record_insight_failure
+from utils.transcription import fail_stale_transcriptions, start_transcription_worker, stop_transcription_worker
+
+insights_cli = AppGroup('insights', help='AI insight pipeline.')
+
+
+def _run_processor(app, stop_event=None):
+    """Run the insight processor in this process until SIGTERM/SIGINT or stop_event."""
+    with app.app_context():
+        processor = get_processor(app)
+
+    def request_stop(signum=None, frame=None):
+        processor.request_stop()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+    if stop_event is not None:
+        threading.Thread(target=lambda: (stop_event.wait(), request_stop()), daemon=True).start()
+
+    with app.app_context():
+        current_app.logger.info("Insight worker started")
+    # Returns after the entry in progress is finished, so in-flight calls drain
+    processor.run()
+    with app.app_context():
+        current_app.logger.info("Insight worker stopped")
+
+
+def _worker_main(stop_event):
+    """Entry point of a spawned worker process."""
+    from app import create_app
+    _run_processor(create_app(), stop_event)
+
+
+@insights_cli.command('worker')
+@click.option('--concurrency', default=1, show_default=True, help='Worker processes to run.')
+@click.option('--drain-timeout', type=float, help='Seconds to wait for in-flight insights on shutdown.')
+def worker(concurrency, drain_timeout):
+    """Process queued insights and voice note transcriptions outside the web tier."""
+    app = current_app._get_current_object()
+    fail_stale_transcriptions(app.config.get('TRANSCRIPTION_WAIT_TIMEOUT'))
+    # One transcription pool per worker command, in this process, however many insight processes run
+    start_transcription_worker(app)
+    try:
+        _run_workers(app, concurrency, drain_timeout)
+    finally:
+        stop_transcription_worker()
+
+
+def _run_workers(app, concurrency, drain_timeout):
+    if concurrency <= 1:
+        _run_processor(app)
+        return
+
+    if drain_timeout is None:
+        drain_timeout = app.config.get('INSIGHT_WORKER_DRAIN_TIMEOUT', 60)
+    context = multiprocessing.get_context('spawn')
+    stop_event = context.Event()
+
+    def spawn(index):
+        process = context.Process(target=_worker_main, args=(stop_event,), name=f'insight-worker-{index}')
+        process.start()
+        return process
+
+    # Signal handlers only flip a flag; setting the shared event from a handler can deadlock
+    stopping = []
+
+    def request_stop(signum, frame):
+        stopping.append(signum)
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    processes = [spawn(index) for index in range(concurrency)]
+    click.echo(f"Started {concurrency} insight workers")
+
+    # Replace workers that crash until asked to stop
+    while not stopping:
+        time.sleep(1)
+        for index, process in enumerate(processes):
+            if not stopping and not process.is_alive():
+                current_app.logger.warning(f"Insight worker {process.name} exited with {process.exitcode}, restarting")
+                processes[index] = spawn(index)
+
+    click.echo("Draining insight workers...")
+    stop_event.set()
+    deadline = time.monotonic() + drain_timeout
+    for process in processes:
+        process.join(timeout=max(0, deadline - time.monotonic()))
+        if process.is_alive():
+            current_app.logger.warning(f"Insight worker {process.name} did not drain in time, terminating")
+            process.kill()
+            process.join()
+    click.echo("Insight workers stopped")
+
+
+def _format_duration(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600:d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def _backfill_entry(app, processor, entry, enqueue_only):
+    """Queue one entry in the backfill lane and, unless enqueue_only, process it."""
+    with app.app_context():
+        # Reset first: if this run dies, the workers still pick the entry up
+        entry.reset_ai_processing(priority=MoodEntry.PRIORITY_BACKFILL)
+        if enqueue_only:
+            return 'queued'
+        try:
+            return 'processed' if processor.process_entry(entry) else 'skipped'
+        except AIServiceDegradedError:
+            return 'queued'
+        except Exception as e:
+            current_app.logger.error(f"Backfill failed for entry {entry.id}: {e}")
+            return {'retry': 'queued', 'done': 'skipped'}.get(record_insight_failure(entry, e), 'failed')
+
+
+@insights_cli.command('backfill')
+@click.option('--job', 'job_name', required=True, help='Checkpoint name; rerun with the same name to resume.')
+@click.option('--since', type=click.DateTime(), help='Only entries dated on or after this time.')
+@click.option('--until', type=click.DateTime(), help='Only entries dated before this time.')
+@click.option('--emotion', multiple=True, type=click.Choice(['happy', 'sad', 'neutral', 'angry', 'anxious']), help='Only entries with this mood (repeatable).')
+@click.option('--user', 'user_ref', help='Only entries of this user (id or email).')
+@click.option('--failed-only', is_flag=True, help='Only entries whose insight generation failed.')
+@click.option('--concurrency', default=2, show_default=True, help='Entries processed at the same time.')
+@click.option('--rate', default=1.0, show_default=True, help='Maximum entries started per second (0 = unlimited).')
+@click.option('--batch-size', default=100, show_default=True, help='Entries fetched per cursor batch.')
+@click.option('--enqueue-only', is_flag=True, help='Only queue entries in the backfill lane for the workers.')
+@click.option('--dry-run', is_flag=True, help='Count the matching entries and exit.')
+@click.option('--restart', is_flag=True, help='Discard the saved checkpoint and start over.')
+def backfill(job_name, since, until, emotion, user_ref, failed_only, concurrency, rate, batch_size, enqueue_only, dry_run, restart):
+    """Regenerate insights for historical entries, resumably."""
+    query = Q()
+    if since:
+        query &= Q(entry_date__gte=since)
+    if until:
+        query &= Q(entry_date__lt=until)
+    if emotion:
+        query &= Q(mood__emotion__in=list(emotion))
+    if user_ref:
+        user = User.objects(Q(id=user_ref) | Q(email=user_ref.lower())).first()
+        if not user:
+            raise click.BadParameter(f"no user {user_ref}", param_hint='--user')
+        query &= Q(user=user)
+    if failed_only:
+        query &= Q(ai_processing_failed=True)
+
+    filters = {
+        'since': since.isoformat() if since else None,
+        'until': until.isoformat() if until else None,
+        'emotion': sorted(emotion),
+        'user': user_ref,
+        'failed_only': failed_only,
+    }
+    job = BackfillJob.objects(id=job_name).first()
+    if job and restart:
+        job.delete()
+        job = None
+    if job and job.filters != filters:
+        raise click.UsageError(f"Job {job_name} was started with other filters {job.filters}; use --restart or another --job")
+    if job and job.finished_at:
+        click.echo(f"Job {job_name} already finished at {job.finished_at:%Y-%m-%d %H:%M}; use --restart to run it again")
+        return
+
+    if job and job.last_entry_id:
+        query &= Q(id__gt=job.last_entry_id)
+    total = MoodEntry.objects(query).count()
+    if dry_run:
+        click.echo(f"{total} entries to backfill{' (resuming)' if job else ''}")
+        return
+    if job is None:
+        job = BackfillJob(id=job_name, filters=filters).save()
+    click.echo(f"Backfilling {total} entries{' from checkpoint ' + job.last_entry_id if job.last_entry_id else ''}")
+
+    app = current_app._get_current_object()
+    processor = get_processor(app)
+    # Ordered by id so the checkpoint is "everything up to this id is done"
+    entries = MoodEntry.objects(query).order_by('id').batch_size(batch_size).timeout(False).no_cache()
+
+    outcomes = OrderedDict()  # entry id -> outcome, None while running
+    lock = threading.Lock()
+    slots = threading.BoundedSemaphore(concurrency * 2)
+    counts = {'processed': 0, 'queued': 0, 'skipped': 0, 'failed': 0}
+    started = time.monotonic()
+    last_report = last_start = 0.0
+
+    def finished(entry_id, future):
+        try:
+            outcome = future.result()
+        except Exception:
+            outcome = 'failed'
+        with lock:
+            outcomes[entry_id] = outcome
+        slots.release()
+
+    def checkpoint():
+        done = dict.fromkeys(counts, 0)
+        last_id = None
+        with lock:
+            while outcomes and next(iter(outcomes.values())) is not None:
+                last_id, outcome = outcomes.popitem(last=False)
+                done[outcome] += 1
+        if last_id:
+            job.checkpoint(last_id, **done)
+            for name, value in done.items():
+                counts[name] += value
+
+    def report():
+        completed = sum(counts.values())
+        elapsed = time.monotonic() - started
+        throughput = completed / elapsed if elapsed else 0
+        eta = _format_duration((total - completed) / throughput) if throughput else '?'
+        click.echo(f"{completed}/{total} entries ({', '.join(f'{k} {v}' for k, v in counts.items())}), {throughput:.2f}/s, ETA {eta}")
+
+    interrupted = False
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='backfill') as executor:
+        try:
+            for entry in entries:
+                # Hold off while the circuit is open; deferred entries stay queued for the workers
+                while not enqueue_only and processor.ai_service.is_degraded():
+                    checkpoint()
+                    time.sleep(min(30, processor.ai_service.breaker.retry_after()))
+
+                if rate:
+                    wait = last_start + 1.0 / rate - time.monotonic()
+                    if wait > 0:
+                        time.sleep(wait)
+                slots.acquire()
+                last_start = time.monotonic()
+                with lock:
+                    outcomes[entry.id] = None
+                future = executor.submit(_backfill_entry, app, processor, entry, enqueue_only)
+                future.add_done_callback(lambda f, entry_id=entry.id: finished(entry_id, f))
+
+                if time.monotonic() - last_report >= 10:
+                    checkpoint()
+                    report()
+                    last_report = time.monotonic()
+        except KeyboardInterrupt:
+            interrupted = True
+            click.echo("Interrupted, waiting for entries in progress...")
+
+    checkpoint()
+    report()
+    if interrupted:
+        click.echo(f"Stopped; rerun with --job {job_name} to resume")
+        return
+    BackfillJob.objects(id=job.id).update_one(set__finished_at=datetime.utcnow())
+    click.echo(f"Job {job_name} finished in {_format_duration(time.monotonic() - started)}")
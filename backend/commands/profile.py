@@ -0,0 +1,29 @@
+"""
+Profiling commands
+"""
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from utils.profiler import make_profile_token, get_profile_store
+
+profile_cli = AppGroup('profile', help='Request and insight profiling.')
+
+
+@profile_cli.command('token')
+@click.argument('path')
+@click.option('--method', default='GET', show_default=True, help='HTTP method of the request to profile.')
+@click.option('--ttl', default=600, show_default=True, help='Seconds the token stays valid.')
+def token(path, method, ttl):
+    """Print an X-Profile header value that profiles requests to PATH."""
+    secret = current_app.config.get('PROFILE_SECRET')
+    if not secret:
+        raise click.UsageError("PROFILE_SECRET is not set")
+    click.echo(make_profile_token(secret, method, path, ttl))
+
+
+@profile_cli.command('dir')
+def profile_dir():
+    """Print the directory profiles are written to."""
+    click.echo(get_profile_store().directory)
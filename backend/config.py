@@ -1,6 +1,6 @@
-from _pytest.stash import T
 from dotenv import load_dotenv
 from datetime import timedelta
+from importlib.util import find_spec
 import os
 
 load_dotenv()
@@ -10,17 +10,150 @@ class Config:
 
     MONGODB_URI = os.environ.get('MONGODB_URI')
     MONGODB_DB = os.environ.get('MONGODB_DB')
+    # Connection pool and driver timeouts (0 = driver default / no limit)
+    MONGODB_MAX_POOL_SIZE = int(os.environ.get('MONGODB_MAX_POOL_SIZE', 100))
+    MONGODB_MIN_POOL_SIZE = int(os.environ.get('MONGODB_MIN_POOL_SIZE', 0))
+    MONGODB_MAX_IDLE_TIME_MS = int(os.environ.get('MONGODB_MAX_IDLE_TIME_MS', 0))
+    MONGODB_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGODB_CONNECT_TIMEOUT_MS', 5000))
+    MONGODB_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGODB_SERVER_SELECTION_TIMEOUT_MS', 5000))
+    MONGODB_SOCKET_TIMEOUT_MS = int(os.environ.get('MONGODB_SOCKET_TIMEOUT_MS', 0))
+    MONGODB_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGODB_WAIT_QUEUE_TIMEOUT_MS', 0))
+    MONGODB_READ_PREFERENCE = os.environ.get('MONGODB_READ_PREFERENCE', 'primary')  # primary, primaryPreferred, secondary, secondaryPreferred, nearest
+    MONGODB_WRITE_CONCERN = os.environ.get('MONGODB_WRITE_CONCERN')  # e.g. majority or 1; unset = server default
+    MONGODB_JOURNAL = os.environ.get('MONGODB_JOURNAL', 'false').lower() == 'true'
+    # Connections opened in the background when a worker starts (0 = off)
+    MONGODB_WARMUP_CONNECTIONS = int(os.environ.get('MONGODB_WARMUP_CONNECTIONS', 4))
+    # Build missing indexes on first use in each process; off by default, run `flask indexes sync` on deploy
+    MONGODB_AUTO_CREATE_INDEX = os.environ.get('MONGODB_AUTO_CREATE_INDEX', 'false').lower() == 'true'
+    # Per-request query logging; queries slower than MONGODB_SLOW_QUERY_MS are logged as warnings
+    QUERY_LOG_REQUESTS = os.environ.get('QUERY_LOG_REQUESTS', 'true').lower() == 'true'
+    MONGODB_SLOW_QUERY_MS = float(os.environ.get('MONGODB_SLOW_QUERY_MS', 100))
+    # Explain every request's queries and warn on collection scans (costly, meant for tests)
+    QUERY_EXPLAIN = os.environ.get('QUERY_EXPLAIN', 'false').lower() == 'true'
+    # Prometheus metrics at /metrics, for scrapers sending METRICS_TOKEN as a bearer token or connecting
+    # from METRICS_ALLOWED_IPS (addresses or CIDR ranges, comma-separated; as seen by Flask, so mind proxies)
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    METRICS_ALLOWED_IPS = [ip.strip() for ip in os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',') if ip.strip()]
+    # Queue and worker gauges are queried at most this often; scrapes in between reuse them
+    METRICS_COLLECT_CACHE_SECONDS = float(os.environ.get('METRICS_COLLECT_CACHE_SECONDS', 5))
+    # Sampling profiler: requests carrying a valid signed X-Profile header (needs PROFILE_SECRET),
+    # every request to PROFILE_ENDPOINTS (route patterns, comma-separated, * = all) and
+    # 1 in PROFILE_SAMPLE_RATE requests (0 = off) are profiled into PROFILE_DIR
+    PROFILE_SECRET = os.environ.get('PROFILE_SECRET')
+    PROFILE_ENDPOINTS = [rule.strip() for rule in os.environ.get('PROFILE_ENDPOINTS', '').split(',') if rule.strip()]
+    PROFILE_SAMPLE_RATE = int(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+    PROFILE_INSIGHT_SAMPLE_RATE = int(os.environ.get('PROFILE_INSIGHT_SAMPLE_RATE', 0))  # 1 in N insight batches
+    PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', 5))
+    PROFILE_DIR = os.environ.get('PROFILE_DIR')  # default: <tmp>/mood-journal-profiles
+    PROFILE_MAX_FILES = int(os.environ.get('PROFILE_MAX_FILES', 100))
+    PROFILE_MAX_AGE_HOURS = float(os.environ.get('PROFILE_MAX_AGE_HOURS', 24))
+    # How long /health/ready reuses its last ping
+    HEALTH_READY_CACHE_SECONDS = float(os.environ.get('HEALTH_READY_CACHE_SECONDS', 5))
 
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY')
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(minutes=30)
+    JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=int(os.environ.get('JWT_REFRESH_TOKEN_DAYS', 30)))
     JWT_ALGORITHM = 'HS256'
 
+    # Password hashing runs on its own process pool (0 workers = inline)
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')  # e.g. scrypt:32768:8:1, pbkdf2:sha256:600000
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 16))
+    PASSWORD_HASH_QUEUE_TIMEOUT = float(os.environ.get('PASSWORD_HASH_QUEUE_TIMEOUT', 0.5))
+    PASSWORD_HASH_TASK_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TASK_TIMEOUT', 10))
+
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', 'uploads')
     MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))  # 16MB
     MAX_AUDIO_SIZE = int(os.environ.get('MAX_AUDIO_SIZE', 16 * 1024 * 1024))  # 16MB for audio files
 
+    # Audio storage: 'local' (UPLOAD_FOLDER/audio) or 's3' (any S3-compatible service)
+    AUDIO_STORAGE_BACKEND = os.environ.get('AUDIO_STORAGE_BACKEND', 'local')
+    S3_BUCKET = os.environ.get('S3_BUCKET')
+    S3_PREFIX = os.environ.get('S3_PREFIX', 'audio/')
+    S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL')  # e.g. http://localhost:9000 for MinIO
+    S3_REGION = os.environ.get('S3_REGION')
+    AUDIO_PRESIGNED_URL_EXPIRES = int(os.environ.get('AUDIO_PRESIGNED_URL_EXPIRES', 900))
+
+    # Orphaned audio garbage collection (interval 0 disables the background pass)
+    AUDIO_GC_INTERVAL = int(os.environ.get('AUDIO_GC_INTERVAL', 0))
+    AUDIO_GC_DRY_RUN = os.environ.get('AUDIO_GC_DRY_RUN', 'false').lower() == 'true'
+    AUDIO_GC_QUARANTINE = os.environ.get('AUDIO_GC_QUARANTINE', 'false').lower() == 'true'
+    AUDIO_GC_BATCH_SIZE = int(os.environ.get('AUDIO_GC_BATCH_SIZE', 500))
+    AUDIO_GC_GRACE_PERIOD = timedelta(seconds=int(os.environ.get('AUDIO_GC_GRACE_PERIOD', 3600)))
+    AUDIO_GC_MAX_DELETES_PER_SECOND = float(os.environ.get('AUDIO_GC_MAX_DELETES_PER_SECOND', 20))
+
+    # Compact playback rendition (Opus in an Ogg container by default)
+    AUDIO_TRANSCODE_ENABLED = os.environ.get('AUDIO_TRANSCODE_ENABLED', 'true').lower() == 'true'
+    AUDIO_TRANSCODE_FORMAT = os.environ.get('AUDIO_TRANSCODE_FORMAT', 'ogg')
+    AUDIO_TRANSCODE_CODEC = os.environ.get('AUDIO_TRANSCODE_CODEC', 'libopus')
+    AUDIO_TRANSCODE_BITRATE = os.environ.get('AUDIO_TRANSCODE_BITRATE', '24k')
+    AUDIO_TRANSCODE_SAMPLE_RATE = int(os.environ.get('AUDIO_TRANSCODE_SAMPLE_RATE', 16000))
+    AUDIO_TRANSCODE_WORKERS = int(os.environ.get('AUDIO_TRANSCODE_WORKERS', 2))
+
+    # Local speech-to-text for voice notes (faster-whisper on CPU); on by default only where it is installed.
+    # Uploads are only marked pending; `flask insights worker` (or `python app.py`) runs the TRANSCRIPTION_WORKERS pool
+    TRANSCRIPTION_ENABLED = os.environ.get('TRANSCRIPTION_ENABLED', 'true' if find_spec('faster_whisper') else 'false').lower() == 'true'
+    TRANSCRIPTION_MODEL = os.environ.get('TRANSCRIPTION_MODEL', 'base')
+    TRANSCRIPTION_COMPUTE_TYPE = os.environ.get('TRANSCRIPTION_COMPUTE_TYPE', 'int8')
+    TRANSCRIPTION_LANGUAGE = os.environ.get('TRANSCRIPTION_LANGUAGE')  # None = auto-detect
+    TRANSCRIPTION_WORKERS = int(os.environ.get('TRANSCRIPTION_WORKERS', 1))
+    TRANSCRIPTION_CPU_THREADS = int(os.environ.get('TRANSCRIPTION_CPU_THREADS', 2))
+    TRANSCRIPTION_WAIT_TIMEOUT = timedelta(seconds=int(os.environ.get('TRANSCRIPTION_WAIT_TIMEOUT', 600)))
+    TRANSCRIPTION_POLL_INTERVAL = float(os.environ.get('TRANSCRIPTION_POLL_INTERVAL', 5))
+
+    # Buffered bookkeeping writes such as last_login
+    WRITE_BEHIND_FLUSH_INTERVAL = float(os.environ.get('WRITE_BEHIND_FLUSH_INTERVAL', 5))
+    WRITE_BEHIND_MAX_PENDING = int(os.environ.get('WRITE_BEHIND_MAX_PENDING', 1000))
+
     CORS_ORIGINS = os.environ.get('CORS_ORIGINS')
     OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
+
+    # Entries with fewer words (and no voice note) get a templated insight instead of an LLM call
+    INSIGHT_TRIAGE_MIN_WORDS = int(os.environ.get('INSIGHT_TRIAGE_MIN_WORDS', 3))
+    INSIGHT_CACHE_SIZE = int(os.environ.get('INSIGHT_CACHE_SIZE', 1000))
+    INSIGHT_LEASE_TTL = timedelta(seconds=int(os.environ.get('INSIGHT_LEASE_TTL', 60)))
+    INSIGHT_SINGLE_FLIGHT_WAIT = float(os.environ.get('INSIGHT_SINGLE_FLIGHT_WAIT', 30))
+    INSIGHT_BATCH_SIZE = int(os.environ.get('INSIGHT_BATCH_SIZE', 10))
+    # Share of each processing batch per lane: interactive, new, retry, backfill
+    INSIGHT_LANE_SHARES = {
+        0: float(os.environ.get('INSIGHT_SHARE_INTERACTIVE', 0.5)),
+        1: float(os.environ.get('INSIGHT_SHARE_NEW', 0.3)),
+        2: float(os.environ.get('INSIGHT_SHARE_RETRY', 0.1)),
+        3: float(os.environ.get('INSIGHT_SHARE_BACKFILL', 0.1)),
+    }
+    INSIGHT_POLL_INTERVAL = float(os.environ.get('INSIGHT_POLL_INTERVAL', 30))
+    INSIGHT_BATCH_DELAY = float(os.environ.get('INSIGHT_BATCH_DELAY', 10))
+    INSIGHT_WORKER_DRAIN_TIMEOUT = float(os.environ.get('INSIGHT_WORKER_DRAIN_TIMEOUT', 60))
+    # Run the processor inside the web process instead of `flask insights worker`
+    INSIGHT_EMBEDDED_WORKER = os.environ.get('INSIGHT_EMBEDDED_WORKER', 'false').lower() == 'true'
+    INSIGHT_MAX_ATTEMPTS = int(os.environ.get('INSIGHT_MAX_ATTEMPTS', 5))
+    INSIGHT_RETRY_BASE_SECONDS = int(os.environ.get('INSIGHT_RETRY_BASE_SECONDS', 30))
+    INSIGHT_RETRY_MAX_SECONDS = int(os.environ.get('INSIGHT_RETRY_MAX_SECONDS', 3600))
+    INSIGHT_PROMOTE_AFTER = timedelta(minutes=int(os.environ.get('INSIGHT_PROMOTE_AFTER_MINUTES', 10)))
+    OPENAI_TIMEOUT = float(os.environ.get('OPENAI_TIMEOUT', 15))
+    OPENAI_MAX_RETRIES = int(os.environ.get('OPENAI_MAX_RETRIES', 0))
+    OPENAI_MODEL = os.environ.get('OPENAI_MODEL', 'gpt-3.5-turbo')
+    OPENAI_BASE_URL = os.environ.get('OPENAI_BASE_URL')  # OpenAI-compatible endpoint, e.g. the benchmark stub
+    # Local quantized model (llama.cpp GGUF file); routing is off, fallback, simple or always
+    LOCAL_MODEL_PATH = os.environ.get('LOCAL_MODEL_PATH')
+    LOCAL_MODEL_ROUTING = os.environ.get('LOCAL_MODEL_ROUTING', 'fallback')
+    LOCAL_MODEL_SIMPLE_MAX_WORDS = int(os.environ.get('LOCAL_MODEL_SIMPLE_MAX_WORDS', 40))
+    LOCAL_MODEL_WORKERS = int(os.environ.get('LOCAL_MODEL_WORKERS', 1))
+    LOCAL_MODEL_THREADS = int(os.environ.get('LOCAL_MODEL_THREADS', 2))
+    LOCAL_MODEL_CONTEXT = int(os.environ.get('LOCAL_MODEL_CONTEXT', 2048))
+    LOCAL_MODEL_TIMEOUT = float(os.environ.get('LOCAL_MODEL_TIMEOUT', 60))
+    # Daily OpenAI token budgets (0 = unlimited); requests shrink below AI_BUDGET_SHRINK_BELOW of the budget left
+    AI_USER_DAILY_TOKEN_BUDGET = int(os.environ.get('AI_USER_DAILY_TOKEN_BUDGET', 20000))
+    AI_GLOBAL_DAILY_TOKEN_BUDGET = int(os.environ.get('AI_GLOBAL_DAILY_TOKEN_BUDGET', 1000000))
+    AI_BUDGET_SHRINK_BELOW = float(os.environ.get('AI_BUDGET_SHRINK_BELOW', 0.2))
+    AI_CIRCUIT_FAILURE_RATE = float(os.environ.get('AI_CIRCUIT_FAILURE_RATE', 0.5))
+    AI_CIRCUIT_SLOW_CALL_SECONDS = float(os.environ.get('AI_CIRCUIT_SLOW_CALL_SECONDS', 10))
+    AI_CIRCUIT_SLOW_CALL_RATE = float(os.environ.get('AI_CIRCUIT_SLOW_CALL_RATE', 0.5))
+    AI_CIRCUIT_WINDOW = int(os.environ.get('AI_CIRCUIT_WINDOW', 20))
+    AI_CIRCUIT_MIN_CALLS = int(os.environ.get('AI_CIRCUIT_MIN_CALLS', 5))
+    AI_CIRCUIT_OPEN_SECONDS = float(os.environ.get('AI_CIRCUIT_OPEN_SECONDS', 30))
+    AI_CIRCUIT_HALF_OPEN_CALLS = int(os.environ.get('AI_CIRCUIT_HALF_OPEN_CALLS', 2))
     # @staticmethod
     def init_app(app):
         pass
@@ -30,6 +163,7 @@ class DevelopmentConfig(Config):
     TESTING=False
 
     MONGODB_URI = os.environ.get('MONGODB_URI')
+    MONGODB_AUTO_CREATE_INDEX = os.environ.get('MONGODB_AUTO_CREATE_INDEX', 'true').lower() == 'true'
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(days=30)
 
 
@@ -51,6 +185,10 @@ class TestingConfig(Config):
     DEBUG=True
     TESTING=True
 
+    PASSWORD_HASH_WORKERS = 0
+    MONGODB_WARMUP_CONNECTIONS = 0
+    QUERY_EXPLAIN = True
+
     
 config = {
     'development':DevelopmentConfig,
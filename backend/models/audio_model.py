@@ -2,14 +2,56 @@ from mongoengine import Document, EmbeddedDocument, FloatField, IntField,StringF
 from datetime import datetime
 
 
+class AudioBlob(Document):
+    """A stored audio payload, keyed by the SHA-256 of its content and shared by every AudioFile that references it"""
+    id = StringField(primary_key=True)
+    ref_count = IntField(default=0)
+    file_size = IntField()
+    created_at = DateTimeField(default=datetime.utcnow)
+    referenced_at = DateTimeField()  # Last ref_count change; the audio GC only trusts ref_count this recent
+    deleting_since = DateTimeField()  # Set while a deleter removes the stored object, see AudioFileHandler.delete_unreferenced_blob
+
+    meta = {
+        'collection':'audio_blobs'
+    }
+
+    def __str__(self):
+        return f"AudioBlob({self.id[:12]}, refs={self.ref_count})"
+
+
 class AudioFile(EmbeddedDocument):
     filename = StringField(required=True)
+    content_hash = StringField()  # AudioBlob id, None for files stored before deduplication
     original_filename = StringField()
     file_size = IntField()
     duration = FloatField()
     content_type = StringField()
     uploaded_timestamp = DateTimeField()
 
+    # Compact streaming rendition produced by the background transcoder
+    compact_filename = StringField()
+    compact_file_size = IntField()
+    compact_content_type = StringField()
+    transcode_status = StringField(choices=['pending', 'done', 'skipped', 'failed'])
+    transcode_error = StringField()
+    transcoded_at = DateTimeField()
+
+    # Speech-to-text transcript produced by the background transcription stage
+    transcript = StringField()
+    transcript_language = StringField()
+    transcript_status = StringField(choices=['pending', 'done', 'failed', 'unavailable'])
+    transcript_error = StringField()
+    transcript_claimed_at = DateTimeField()  # Set when a transcription worker takes the voice note
+    transcribed_at = DateTimeField()
+
+    def has_compact_rendition(self):
+        """Check if a compact rendition is available for playback"""
+        return self.transcode_status == 'done' and bool(self.compact_filename)
+
+    def is_transcript_pending(self):
+        """Check if the transcript is still being produced"""
+        return self.transcript_status == 'pending'
+
     def to_dict(self):
         return {
             'filename':self.filename,
@@ -18,5 +60,16 @@ class AudioFile(EmbeddedDocument):
             'duration':self.duration,
             'content_type':self.content_type,
             'uploaded_timestamp':self.uploaded_timestamp,
-            'url':f"/api/audio/{self.filename}"
+            'url':f"/api/audio/{self.filename}",
+            'compact':{
+                'available':self.has_compact_rendition(),
+                'status':self.transcode_status,
+                'file_size':self.compact_file_size,
+                'content_type':self.compact_content_type,
+                'compression_ratio':round(self.file_size / self.compact_file_size, 2) if self.file_size and self.compact_file_size else None,
+                'transcoded_at':self.transcoded_at
+            },
+            'transcript':self.transcript,
+            'transcript_status':self.transcript_status,
+            'transcribed_at':self.transcribed_at
         }
@@ -0,0 +1,34 @@
+from mongoengine import Document, StringField, IntField, DateTimeField, DictField
+from datetime import datetime
+
+
+class BackfillJob(Document):
+    """Progress of an insight backfill, so an interrupted run can resume where it stopped."""
+    id = StringField(primary_key=True)  # Job name given on the command line
+    filters = DictField()  # Selection the job was started with
+
+    last_entry_id = StringField()  # Every entry up to this id (in id order) is done
+    processed = IntField(default=0)
+    queued = IntField(default=0)  # Left in the backfill lane for the insight workers
+    skipped = IntField(default=0)
+    failed = IntField(default=0)
+
+    started_at = DateTimeField(default=datetime.utcnow)
+    updated_at = DateTimeField(default=datetime.utcnow)
+    finished_at = DateTimeField()
+
+    meta = {
+        'collection':'backfill_jobs'
+    }
+
+    def checkpoint(self, last_entry_id, **counts):
+        """Persist progress with one atomic update"""
+        updates = {f'inc__{name}': value for name, value in counts.items() if value}
+        BackfillJob.objects(id=self.id).update_one(
+            set__last_entry_id=last_entry_id,
+            set__updated_at=datetime.utcnow(),
+            **updates
+        )
+        self.last_entry_id = last_entry_id
+        for name, value in counts.items():
+            setattr(self, name, getattr(self, name) + value)
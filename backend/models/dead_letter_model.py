@@ -0,0 +1,39 @@
+from mongoengine import Document, StringField, IntField, DateTimeField, BooleanField
+from datetime import datetime
+
+
+class InsightDeadLetter(Document):
+    """An entry whose insight generation was given up on, kept with its error context for requeueing."""
+    id = StringField(primary_key=True)  # MoodEntry id, one letter per entry
+    user_id = StringField(required=True)
+
+    attempts = IntField(default=0)
+    error_type = StringField()
+    error_message = StringField()
+    transient = BooleanField(default=False)  # False = permanent error, True = ran out of retries
+
+    emotion = StringField()
+    has_text = BooleanField(default=False)
+    has_audio = BooleanField(default=False)
+
+    created_at = DateTimeField(default=datetime.utcnow)
+
+    meta = {
+        'collection':'insight_dead_letters',
+        'indexes':[
+            ('user_id','created_at')
+        ]
+    }
+
+    def to_dict(self):
+        return {
+            'entry_id': self.id,
+            'attempts': self.attempts,
+            'error_type': self.error_type,
+            'error_message': self.error_message,
+            'transient': self.transient,
+            'emotion': self.emotion,
+            'has_text': self.has_text,
+            'has_audio': self.has_audio,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+        }
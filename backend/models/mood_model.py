@@ -1,14 +1,22 @@
-from mongoengine import CASCADE, Document, StringField, IntField, ReferenceField, DateTimeField, BooleanField, EmbeddedDocumentField, EmbeddedDocument
+from mongoengine import CASCADE, Q, Document, StringField, IntField, ReferenceField, DateTimeField, BooleanField, EmbeddedDocumentField, EmbeddedDocument
 from datetime import datetime
 import uuid
 from models.user_model import User
 from models.audio_model import AudioFile
+from models.dead_letter_model import InsightDeadLetter
 
 class Mood(EmbeddedDocument):
     emoji = StringField(required=True, max_length=10)
     emotion = StringField(required=True, choices=['happy', 'sad', 'neutral', 'angry', 'anxious'])
 
 class MoodEntry(Document):
+    # Insight queue lanes
+    PRIORITY_INTERACTIVE = 0  # A user is waiting on this entry
+    PRIORITY_NEW = 1
+    PRIORITY_RETRY = 2
+    PRIORITY_BACKFILL = 3
+    PRIORITY_NAMES = {0: 'interactive', 1: 'new', 2: 'retry', 3: 'backfill'}
+
     id = StringField(primary_key=True,default=lambda:str(uuid.uuid4()))
     user = ReferenceField(User,required=True,reverse_delete_rule=CASCADE)
     mood = EmbeddedDocumentField(Mood, required=True)
@@ -21,6 +29,13 @@ class MoodEntry(Document):
     ai_processing_failed = BooleanField(default=False)  # Whether AI processing failed
     ai_error_message = StringField()  # Error message if AI processing failed
     ai_processed_at = DateTimeField()  # When AI processing completed
+    ai_insight_source = StringField(choices=['template', 'cache', 'llm', 'local'])  # Where the insight came from
+    ai_lease_owner = StringField()  # Worker currently generating the insight
+    ai_lease_expires_at = DateTimeField()
+    ai_priority = IntField(default=1)  # Insight queue lane, lower runs first (see PRIORITY_*)
+    ai_queued_at = DateTimeField(default=datetime.utcnow)  # When the entry entered its lane
+    ai_attempts = IntField(default=0)  # Failed generation attempts since the last reset
+    ai_next_attempt_at = DateTimeField()  # Set while a transient failure waits for its retry
 
     entry_date = DateTimeField(required=True)
     created_at = DateTimeField(default=datetime.now)
@@ -32,13 +47,14 @@ class MoodEntry(Document):
     meta = {
         'collection':'mood_entries',
         'indexes':[
-            'user',
-            'entry_date',
-            'created_at',
-            'ai_processed',
             ('user','ai_processed'),
             ('user','entry_date'),
-            ('user','created_at')
+            ('user','created_at'),
+            ('user','updated_at'),
+            {'fields':['audio_file.filename'],'sparse':True},
+            {'fields':['audio_file.content_hash'],'sparse':True},
+            ('ai_processed','ai_processing_failed','ai_priority','ai_queued_at'),
+            ('ai_processed','ai_processing_failed','ai_next_attempt_at')
         ]
     }
 
@@ -60,7 +76,8 @@ class MoodEntry(Document):
             'ai_processing_failed':self.ai_processing_failed,
             'ai_error_message':self.ai_error_message,
             'ai_processed_at':self.ai_processed_at,
-            'ai_insight':self.ai_insight
+            'ai_insight':self.ai_insight,
+            'ai_insight_source':self.ai_insight_source
         }
         if self.audio_file:
             data['audio_file'] = self.audio_file.to_dict()
@@ -73,40 +90,195 @@ class MoodEntry(Document):
         self.updated_at = datetime.now()
         return super().save(*args,**kwargs)
 
+    def update_fields(self,**fields):
+        """Atomically $set (or $unset, for None) only the given fields instead of saving the whole entry"""
+        fields['updated_at'] = datetime.now()
+        updates = {}
+        for name,value in fields.items():
+            setattr(self,name,value)
+            if value is None:
+                updates[f'unset__{name}'] = True
+            else:
+                updates[f'set__{name}'] = value
+        return MoodEntry.objects(id=self.id).update_one(**updates)
+
 
     @classmethod
-    def get_unprocessed_entries(cls, limit=10):
-        """Get entries that need AI processing"""
-        return cls.objects(
-            ai_processed=False,
-            ai_processing_failed=False
-        ).limit(limit)
+    def get_unprocessed_entries(cls, limit=10, transcript_wait=None, shares=None, promote_after=None):
+        """
+        Get entries that need AI processing, most urgent lane first.
+        Entries whose voice note is still being transcribed are held back,
+        unless the upload is older than transcript_wait (a timedelta).
+        shares maps a lane to its fraction of the batch so backlog lanes are
+        never starved; entries older than promote_after (a timedelta) move up
+        one lane per period waited.
+        """
+        ready = Q(audio_file__transcript_status__ne='pending')
+        if transcript_wait:
+            ready = ready | Q(audio_file__uploaded_timestamp__lt=datetime.utcnow() - transcript_wait)
+        due = Q(ai_next_attempt_at=None) | Q(ai_next_attempt_at__lte=datetime.utcnow())
+        pending = Q(ai_processed=False, ai_processing_failed=False) & ready & due
 
-    
-    def mark_ai_processing_complete(self, insight):
-        """Mark entry as AI processed with insight"""
-        self.ai_insight = insight
-        self.ai_processed = True
-        self.ai_processing_failed = False
-        self.ai_error_message = None
-        self.ai_processed_at = datetime.utcnow()
-        self.save()
+        if not shares:
+            return list(cls.objects(pending).order_by('ai_priority', 'ai_queued_at').limit(limit))
+
+        lanes = sorted(cls.PRIORITY_NAMES)
+        entries, seen = [], set()
+
+        def take(lane, count):
+            if count <= 0:
+                return
+            query = pending & cls._lane_query(lane, lanes, promote_after) & Q(id__nin=list(seen))
+            for entry in cls.objects(query).order_by('ai_queued_at').limit(count):
+                seen.add(entry.id)
+                entries.append(entry)
+
+        # Each lane gets its share first, then leftover capacity goes to the most urgent lanes
+        for lane in lanes:
+            if shares.get(lane):
+                take(lane, min(limit - len(entries), max(1, round(limit * shares[lane]))))
+        for lane in lanes:
+            take(lane, limit - len(entries))
+        return entries
+
+    @classmethod
+    def _lane_query(cls, lane, lanes, promote_after=None):
+        """Entries in a lane, including those promoted into it by age"""
+        query = Q(ai_priority=lane)
+        if lane == cls.PRIORITY_NEW:
+            query = query | Q(ai_priority=None)  # Entries created before lanes existed
+        if promote_after:
+            now = datetime.utcnow()
+            for lower in lanes:
+                if lower > lane:
+                    query = query | Q(ai_priority=lower, ai_queued_at__lt=now - promote_after * (lower - lane))
+        return query
+
+    def prioritize_ai(self, priority):
+        """Move the entry to a more urgent insight lane; never demotes"""
+        if self.ai_priority is not None and self.ai_priority <= priority:
+            return False
+        updated = MoodEntry.objects(
+            Q(id=self.id) & (Q(ai_priority=None) | Q(ai_priority__gt=priority))
+        ).update_one(set__ai_priority=priority, set__ai_queued_at=datetime.utcnow())
+        self.ai_priority = priority
+        return bool(updated)
+
+    AI_FIELDS = ('ai_insight', 'ai_insight_source', 'ai_processed', 'ai_processing_failed', 'ai_error_message', 'ai_processed_at',
+                 'ai_attempts', 'ai_next_attempt_at')
+
+    def _transition_ai_state(self, guard, **fields):
+        """
+        Apply an AI status change as one conditional update_one touching only AI fields.
+        If the guard no longer matches (another worker got there first), the AI fields
+        are reloaded instead. Returns True if this call made the transition.
+        """
+        updates = {}
+        for name, value in fields.items():
+            if value is None:
+                updates[f'unset__{name}'] = True
+            else:
+                updates[f'set__{name}'] = value
+
+        if not MoodEntry.objects(Q(id=self.id) & guard).update_one(**updates):
+            self.reload(*self.AI_FIELDS)
+            return False
+
+        for name, value in fields.items():
+            setattr(self, name, value)
+        self._changed_fields = [name for name in self._changed_fields if name not in fields]
+        return True
+
+    def mark_ai_processing_complete(self, insight, source='llm'):
+        """Mark entry as AI processed with insight, unless it already has one"""
+        return self._transition_ai_state(
+            Q(ai_processed=False),
+            ai_insight=insight,
+            ai_insight_source=source,
+            ai_processed=True,
+            ai_processing_failed=False,
+            ai_error_message=None,
+            ai_processed_at=datetime.utcnow(),
+            ai_next_attempt_at=None
+        )
     
     def mark_ai_processing_failed(self, error_message):
-        """Mark entry as AI processing failed"""
-        self.ai_processing_failed = True
-        self.ai_processed = False
-        self.ai_error_message = error_message
-        self.ai_processed_at = datetime.utcnow()
-        self.save()
+        """Mark entry as AI processing failed, without overwriting a completed insight"""
+        return self._transition_ai_state(
+            Q(ai_processed=False),
+            ai_processing_failed=True,
+            ai_processed=False,
+            ai_error_message=error_message,
+            ai_processed_at=datetime.utcnow()
+        )
     
-    def reset_ai_processing(self):
-        """Reset AI processing status for retry"""
-        self.ai_processed = False
-        self.ai_processing_failed = False
-        self.ai_error_message = None
-        self.ai_processed_at = None
-        self.save()
+    def schedule_ai_retry(self, error_message, delay):
+        """Record a transient failure and hold the entry back for delay (a timedelta)"""
+        now = datetime.utcnow()
+        return self._transition_ai_state(
+            Q(ai_processed=False, ai_processing_failed=False),
+            ai_error_message=error_message,
+            ai_attempts=(self.ai_attempts or 0) + 1,
+            ai_next_attempt_at=now + delay,
+            ai_priority=self.PRIORITY_RETRY,
+            ai_queued_at=now
+        )
+
+    def reset_ai_processing(self, priority=PRIORITY_RETRY):
+        """Reset AI processing status for retry, queued in the given lane, clearing any dead letter"""
+        reset = self._transition_ai_state(
+            Q(ai_processed=True) | Q(ai_processing_failed=True),
+            ai_processed=False,
+            ai_processing_failed=False,
+            ai_error_message=None,
+            ai_processed_at=None,
+            ai_attempts=0,
+            ai_next_attempt_at=None,
+            ai_priority=priority,
+            ai_queued_at=datetime.utcnow()
+        )
+        if reset:
+            InsightDeadLetter.objects(id=self.id).delete()
+        return reset
+
+    def acquire_ai_lease(self, owner, ttl):
+        """Claim insight generation for this entry across processes; ttl is a timedelta"""
+        now = datetime.utcnow()
+        return bool(MoodEntry.objects(
+            Q(id=self.id) & (Q(ai_lease_expires_at=None) | Q(ai_lease_expires_at__lt=now))
+        ).update_one(set__ai_lease_owner=owner, set__ai_lease_expires_at=now + ttl))
+
+    def release_ai_lease(self, owner):
+        """Give up a lease taken with acquire_ai_lease"""
+        return bool(MoodEntry.objects(id=self.id, ai_lease_owner=owner).update_one(
+            unset__ai_lease_owner=True, unset__ai_lease_expires_at=True
+        ))
+
+    def get_audio_transcript(self):
+        """Transcript of the voice note for AI prompts, or a placeholder if none is available"""
+        if not self.audio_file:
+            return None
+        if self.audio_file.transcript and self.audio_file.transcript.strip():
+            return self.audio_file.transcript
+        return "[Voice note recorded]"
+
+    def is_waiting_for_transcript(self, wait=None):
+        """
+        Check if AI processing should wait for the voice note transcript.
+        Uploads older than wait (a timedelta) are no longer waited for, as in get_unprocessed_entries.
+        """
+        if not (self.audio_file and self.audio_file.is_transcript_pending()):
+            return False
+        uploaded = self.audio_file.uploaded_timestamp
+        return not (wait and uploaded and uploaded < datetime.utcnow() - wait)
+
+    def is_trivial_for_ai(self, min_words=3):
+        """
+        Check if the entry is too short to be worth an LLM call: its note and voice note
+        transcript together are under min_words. An untranscribed voice note counts as empty.
+        """
+        transcript = self.audio_file.transcript if self.audio_file else None
+        return len((self.text_note or '').split()) + len((transcript or '').split()) < min_words
 
     def has_content_for_ai(self):
         """Check if entry has content suitable for AI analysis"""
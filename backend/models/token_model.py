@@ -0,0 +1,40 @@
+from mongoengine import Document, StringField, DateTimeField, BooleanField
+from datetime import datetime
+
+
+class RefreshToken(Document):
+    """An issued refresh token. Tokens of one login share a family so reuse can revoke the whole chain."""
+    id = StringField(primary_key=True)  # JWT jti
+    user_id = StringField(required=True)
+    family = StringField(required=True)
+
+    used_at = DateTimeField()  # Set once the token has been rotated
+    revoked = BooleanField(default=False)
+
+    created_at = DateTimeField(default=datetime.utcnow)
+    expires_at = DateTimeField(required=True)
+
+    meta = {
+        'collection':'refresh_tokens',
+        'indexes':[
+            'family',
+            {'fields':['expires_at'],'expireAfterSeconds':0}
+        ]
+    }
+
+    def __str__(self):
+        return f"RefreshToken({self.user_id}, family={self.family[:8]})"
+
+
+class RevokedAccessToken(Document):
+    """An access token revoked at logout, denied by every process until it expires"""
+    id = StringField(primary_key=True)  # JWT jti
+    user_id = StringField()
+    expires_at = DateTimeField(required=True)
+
+    meta = {
+        'collection':'revoked_access_tokens',
+        'indexes':[
+            {'fields':['expires_at'],'expireAfterSeconds':0}
+        ]
+    }
@@ -0,0 +1,62 @@
+from mongoengine import Document, StringField, IntField, FloatField, DateTimeField
+from datetime import datetime
+
+GLOBAL_SCOPE = 'global'
+
+
+class TokenUsage(Document):
+    """Daily AI usage counters for one user, or for everyone when scope is 'global'."""
+    id = StringField(primary_key=True)  # "<day>:<scope>"
+    day = StringField(required=True)  # YYYY-MM-DD (UTC)
+    scope = StringField(required=True)  # User id or GLOBAL_SCOPE
+
+    prompt_tokens = IntField(default=0)  # OpenAI tokens, counted against budgets
+    completion_tokens = IntField(default=0)
+    calls = IntField(default=0)
+    local_calls = IntField(default=0)  # Calls served by the local model, free of budget
+    latency_seconds = FloatField(default=0.0)
+
+    updated_at = DateTimeField(default=datetime.utcnow)
+
+    meta = {
+        'collection':'token_usage',
+        'indexes':[
+            ('scope','day')
+        ]
+    }
+
+    @property
+    def total_tokens(self):
+        return (self.prompt_tokens or 0) + (self.completion_tokens or 0)
+
+    @classmethod
+    def record(cls, day, scope, completion):
+        """Add one completion to the counters of a scope, creating the day's document if needed"""
+        if completion.provider == 'local':
+            updates = {'inc__local_calls': 1}
+        else:
+            updates = {
+                'inc__prompt_tokens': completion.prompt_tokens,
+                'inc__completion_tokens': completion.completion_tokens,
+                'inc__calls': 1,
+            }
+        cls.objects(id=f"{day}:{scope}").update_one(
+            upsert=True,
+            set_on_insert__day=day,
+            set_on_insert__scope=scope,
+            inc__latency_seconds=completion.latency,
+            set__updated_at=datetime.utcnow(),
+            **updates
+        )
+
+    def to_dict(self):
+        calls = (self.calls or 0) + (self.local_calls or 0)
+        return {
+            'day': self.day,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'total_tokens': self.total_tokens,
+            'calls': self.calls,
+            'local_calls': self.local_calls,
+            'avg_latency_seconds': round(self.latency_seconds / calls, 3) if calls else None,
+        }
@@ -1,6 +1,7 @@
 from datetime import datetime
 from mongoengine import IntField, ReferenceField, StringField,EmailField,DateTimeField,BooleanField,Document
-from werkzeug.security import generate_password_hash,check_password_hash
+from utils.password_hasher import get_password_hasher
+from utils.write_behind import get_write_buffer
 import uuid
 class User(Document):
     id = StringField(primary_key=True,default=lambda:str(uuid.uuid4()))
@@ -21,10 +22,26 @@ class User(Document):
     }
 
     def set_password(self,password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = get_password_hasher().hash(password)
 
     def check_password(self,password):
-        return check_password_hash(self.password_hash,password)
+        return get_password_hasher().verify(self.password_hash,password)
+
+    def password_needs_rehash(self):
+        """Check if the stored hash predates the configured hash parameters"""
+        return get_password_hasher().needs_rehash(self.password_hash)
+
+    def record_login(self):
+        """Buffer the last_login bump instead of writing the user document on every login"""
+        self.last_login = datetime.now()
+        get_write_buffer().set(User, self.id, last_login=self.last_login)
+
+    def update_fields(self,**fields):
+        """Atomically $set only the given fields instead of saving the whole document"""
+        fields['updated_at'] = datetime.now()
+        for name,value in fields.items():
+            setattr(self,name,value)
+        return User.objects(id=self.id).update_one(**{f'set__{name}':value for name,value in fields.items()})
 
     def to_dict(self):
         return {
@@ -42,6 +59,17 @@ class User(Document):
         self.updated_at  = datetime.now()
         return super().save(*args,**kwargs)
 
+    def delete(self,*args,**kwargs):
+        """Delete the user; their entries go with the CASCADE, so release the audio they referenced afterwards"""
+        from models.mood_model import MoodEntry
+        from utils.file_handler import AudioFileHandler
+
+        audio_files = [entry.audio_file for entry in MoodEntry.objects(user=self.id, audio_file__exists=True).only('audio_file')]
+        result = super().delete(*args,**kwargs)
+        for audio_file in audio_files:
+            AudioFileHandler.delete_audio_renditions(audio_file)
+        return result
+
     def __str__(self):
         return f"User({self.email})"
 
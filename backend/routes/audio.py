@@ -2,8 +2,8 @@
 Step 5: Audio file upload and management routes
 """
 
-import os
-from flask import Blueprint, request, jsonify, send_file, current_app
+from datetime import datetime
+from flask import Blueprint, request, jsonify, send_file, redirect, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from werkzeug.exceptions import RequestEntityTooLarge
 from mongoengine import DoesNotExist
@@ -12,6 +12,8 @@ from models.user_model import User
 from models.mood_model import MoodEntry
 from models.audio_model import AudioFile
 from utils.file_handler import AudioFileHandler, FileUploadError
+from utils.audio_transcoder import queue_audio_transcode
+from utils.storage import get_storage, stream_response
 
 # Create Blueprint for audio routes
 audio_bp = Blueprint('audio', __name__)
@@ -97,10 +99,14 @@ def upload_audio():
         # Create audio file document
         audio_doc = AudioFile(
             filename=file_info['filename'],
+            content_hash=file_info['content_hash'],
             original_filename=file_info['original_filename'],
             file_size=file_info['file_size'],
             content_type=file_info['content_type'],
-            duration=file_info.get('duration')
+            duration=file_info.get('duration'),
+            uploaded_timestamp=datetime.utcnow(),
+            transcode_status='pending' if current_app.config.get('AUDIO_TRANSCODE_ENABLED', True) else None,
+            transcript_status='pending' if current_app.config.get('TRANSCRIPTION_ENABLED', False) else None
         )
         
         # Override duration if provided by client (for cases where server can't calculate it)
@@ -111,12 +117,29 @@ def upload_audio():
             except ValueError:
                 pass  # Ignore invalid duration
         
-        # Update mood entry with audio file
+        # Attach the audio only if no concurrent upload attached one since the check above
+        try:
+            attached = MoodEntry.objects(id=entry.id, audio_file=None).update_one(
+                set__audio_file=audio_doc, set__updated_at=datetime.now()
+            )
+        except Exception:
+            # Don't leave the stored file behind without a referencing entry
+            AudioFileHandler.release_blob(audio_doc.content_hash)
+            raise
+
+        if not attached:
+            AudioFileHandler.release_blob(audio_doc.content_hash)
+            return jsonify({
+                'error': 'Audio Exists',
+                'message': 'This mood entry already has an audio file. Delete it first or use update.'
+            }), 409
         entry.audio_file = audio_doc
-        entry.save()
-        
+
         current_app.logger.info(f"Audio uploaded for entry: {entry_id}, file: {file_info['filename']}")
         
+        # Produce the compact playback rendition in the background; the insight worker picks up the pending transcript
+        queue_audio_transcode(entry.id)
+        
         return jsonify({
             'message': 'Audio uploaded successfully',
             'audio_file': audio_doc.to_dict(),
@@ -141,7 +164,8 @@ def get_audio(filename):
     """
     Serve audio file
     
-    Returns the actual audio file for streaming/download
+    Returns the compact rendition when one is available, otherwise the original.
+    Pass ?original=true to always get the uploaded file.
     """
     
     try:
@@ -171,21 +195,44 @@ def get_audio(filename):
                 'message': 'You can only access your own audio files'
             }), 403
         
-        # Check if file exists on disk
-        file_path = AudioFileHandler.get_audio_file_path(filename)
-        if not os.path.exists(file_path):
+        audio = entry.audio_file
+        storage = get_storage()
+        want_original = request.args.get('original', 'false').lower() == 'true'
+        
+        # Prefer the compact rendition for playback
+        key, mimetype, download_name = AudioFileHandler.get_stored_key(audio), audio.content_type, audio.original_filename
+        if not want_original and audio.has_compact_rendition():
+            compact_key = AudioFileHandler.get_compact_key(audio)
+            if storage.exists(compact_key):
+                key, mimetype, download_name = compact_key, audio.compact_content_type, audio.compact_filename
+        
+        # Check if file exists in storage
+        if not storage.exists(key):
             return jsonify({
                 'error': 'File Not Found',
                 'message': 'Audio file not found on server'
             }), 404
         
+        # Let clients fetch straight from object storage when asked to
+        if request.args.get('redirect', 'false').lower() == 'true' and storage.supports_presigned_urls:
+            return redirect(storage.presigned_url(
+                key,
+                expires_in=current_app.config.get('AUDIO_PRESIGNED_URL_EXPIRES', 900),
+                content_type=mimetype,
+                filename=download_name
+            ))
+        
         # Serve file
-        return send_file(
-            file_path,
-            mimetype=entry.audio_file.content_type,
-            as_attachment=False,  # Stream instead of download
-            download_name=entry.audio_file.original_filename
-        )
+        file_path = storage.local_path(key)
+        if file_path:
+            return send_file(
+                file_path,
+                mimetype=mimetype,
+                as_attachment=False,  # Stream instead of download
+                download_name=download_name,
+                conditional=True
+            )
+        return stream_response(storage, key, mimetype, request.range)
         
     except Exception as e:
         current_app.logger.error(f"Audio serving error: {e}")
@@ -194,6 +241,72 @@ def get_audio(filename):
             'message': 'Unable to serve audio file'
         }), 500
 
+@audio_bp.route('/<filename>/url', methods=['GET'])
+@jwt_required()
+def get_audio_url(filename):
+    """
+    Get a time-limited direct download URL for an audio file
+    
+    Only available when audio is kept in object storage; clients then
+    fetch the bytes without going through the API workers.
+    """
+    
+    try:
+        # Get current user
+        user_id = get_jwt_identity()
+        user = User.objects(id=user_id).first()
+        
+        if not user:
+            return jsonify({
+                'error': 'User Not Found',
+                'message': 'User account not found'
+            }), 404
+        
+        # Find mood entry with this audio file
+        entry = MoodEntry.objects(audio_file__filename=filename).first()
+        
+        if not entry:
+            return jsonify({
+                'error': 'Audio Not Found',
+                'message': 'Audio file not found'
+            }), 404
+        
+        # Check ownership
+        if entry.user.id != user.id:
+            return jsonify({
+                'error': 'Access Denied',
+                'message': 'You can only access your own audio files'
+            }), 403
+        
+        storage = get_storage()
+        if not storage.supports_presigned_urls:
+            return jsonify({
+                'error': 'Not Supported',
+                'message': 'Direct audio URLs are not available with this storage backend',
+                'url': entry.audio_file.to_dict()['url']
+            }), 501
+        
+        audio = entry.audio_file
+        want_original = request.args.get('original', 'false').lower() == 'true'
+        if not want_original and audio.has_compact_rendition():
+            key, mimetype, download_name = AudioFileHandler.get_compact_key(audio), audio.compact_content_type, audio.compact_filename
+        else:
+            key, mimetype, download_name = AudioFileHandler.get_stored_key(audio), audio.content_type, audio.original_filename
+        
+        expires_in = current_app.config.get('AUDIO_PRESIGNED_URL_EXPIRES', 900)
+        return jsonify({
+            'url': storage.presigned_url(key, expires_in=expires_in, content_type=mimetype, filename=download_name),
+            'content_type': mimetype,
+            'expires_in': expires_in
+        }), 200
+        
+    except Exception as e:
+        current_app.logger.error(f"Audio URL error: {e}")
+        return jsonify({
+            'error': 'URL Failed',
+            'message': 'Unable to create audio URL'
+        }), 500
+
 @audio_bp.route('/<filename>', methods=['DELETE'])
 @jwt_required()
 def delete_audio(filename):
@@ -226,12 +339,11 @@ def delete_audio(filename):
                 'message': 'You can only delete your own audio files'
             }), 403
         
-        # Delete file from disk
-        AudioFileHandler.delete_audio_file(filename)
+        # Delete file and its renditions from disk
+        AudioFileHandler.delete_audio_renditions(entry.audio_file)
         
         # Remove audio file from entry
-        entry.audio_file = None
-        entry.save()
+        entry.update_fields(audio_file=None)
         
         current_app.logger.info(f"Audio deleted: {filename}")
         
@@ -288,12 +400,11 @@ def delete_entry_audio(entry_id):
                 'message': 'This mood entry has no audio file'
             }), 404
         
-        # Delete file from disk
-        AudioFileHandler.delete_audio_file(entry.audio_file.filename)
+        # Delete file and its renditions from disk
+        AudioFileHandler.delete_audio_renditions(entry.audio_file)
         
         # Remove audio file from entry
-        entry.audio_file = None
-        entry.save()
+        entry.update_fields(audio_file=None)
         
         current_app.logger.info(f"Audio deleted for entry: {entry_id}")
         
@@ -349,7 +460,7 @@ def get_audio_info(filename):
         return jsonify({
             'audio_file': entry.audio_file.to_dict(),
             'entry_id': entry.id,
-            'file_exists': AudioFileHandler.file_exists(filename)
+            'file_exists': AudioFileHandler.file_exists(entry.audio_file)
         }), 200
         
     except Exception as e:
@@ -1,14 +1,26 @@
-from datetime import datetime
 from flask import Blueprint,request,jsonify,request,current_app
-from flask_jwt_extended import create_access_token, get_jwt_identity, jwt_required
+from flask_jwt_extended import get_jwt, get_jwt_identity, jwt_required
 from marshmallow import ValidationError as MarshmallowValidationError
 from models.user_model import User
 from schemas.auth_schemas import UserLoginSchema, UserRegistrationSchema
 from mongoengine import NotUniqueError,ValidationError as MongoValidationError
+from utils.password_hasher import HashingBusyError
+from utils.auth_tokens import (
+    issue_tokens, rotate_refresh_token, revoke_access_token, revoke_refresh_token,
+    TokenReuseError, TokenRevokedError
+)
 
 
 auth_bp = Blueprint('auth',__name__)
 
+def hashing_busy_response(error):
+    response = jsonify({
+        'error':'Service Busy',
+        'message':'Too many authentication requests, please retry shortly'
+    })
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response,503
+
 @auth_bp.route('/signup',methods = ['POST'])
 def signup():
     try:
@@ -40,13 +52,12 @@ def signup():
         user.set_password(user.password_hash)
         user.save()
 
-        access_token = create_access_token(identity=user.id)
+        tokens = issue_tokens(user.id)
         current_app.logger.info(f"New user registered: {user.email}")
         return jsonify({
             'message':'User created successfully',
             'user':user.to_dict(),
-            'access_token':access_token,
-            'expires_in':current_app.config['JWT_ACCESS_TOKEN_EXPIRES'].total_seconds()
+            **tokens
         }),201
 
     except NotUniqueError as e:
@@ -55,6 +66,9 @@ def signup():
             'message':'User with this email already exists'
         }),409
 
+    except HashingBusyError as e:
+        return hashing_busy_response(e)
+
     except Exception as e:
         current_app.logger.error(f"Error registering user: {e}")
         return jsonify({
@@ -88,18 +102,24 @@ def login():
                 'message':'User is not active'
             }),403
         
-        user.last_login = datetime.now()
-        user.save()
+        # Upgrade hashes made with older parameters while we have the plain password
+        if user.password_needs_rehash():
+            user.set_password(data['password'])
+            user.update_fields(password_hash=user.password_hash)
+
+        user.record_login()
 
-        access_token = create_access_token(identity=user.id)
+        tokens = issue_tokens(user.id)
         current_app.logger.info(f"User logged in: {user.email}")
         return jsonify({
             'message':'Login successful',
             'user':user.to_dict(),
-            'access_token':access_token,
-            'expires_in':current_app.config['JWT_ACCESS_TOKEN_EXPIRES'].total_seconds()
+            **tokens
         }),200
 
+    except HashingBusyError as e:
+        return hashing_busy_response(e)
+
     except Exception as e:
         current_app.logger.error(f"Error logging in user: {e}")
         return jsonify({
@@ -131,11 +151,49 @@ def get_current_user_info():
             'message':str(e)
         }),401
 
+@auth_bp.route('/refresh',methods = ['POST'])
+@jwt_required(refresh=True)
+def refresh():
+    try:
+        user_id = get_jwt_identity()
+        user = User.objects(id=user_id).only('is_active').first()
+        if not user or not user.is_active:
+            return jsonify({
+                'error':'Authentication Error',
+                'message':'User not found or is inactive'
+            }),401
+
+        tokens = rotate_refresh_token(get_jwt())
+        return jsonify({
+            'message':'Token refreshed',
+            **tokens
+        }),200
+
+    except (TokenReuseError,TokenRevokedError) as e:
+        return jsonify({
+            'error':'Token Revoked',
+            'message':str(e)
+        }),401
+
+    except Exception as e:
+        current_app.logger.error(f"Error refreshing token: {e}")
+        return jsonify({
+            'error':'Token Error',
+            'message':str(e)
+        }),500
+
 @auth_bp.route('/logout/',methods = ['POST'])
 @jwt_required()
 def logout():
     try:
         user_id = get_jwt_identity()
+        revoke_access_token(get_jwt())
+
+        # Revoke the refresh token chain too, when the client sends it
+        data = request.get_json(silent=True) or {}
+        if data.get('refresh_token'):
+            revoke_refresh_token(data['refresh_token'],user_id)
+
         current_app.logger.info(f"User logged out: {user_id}")
         return jsonify({
             'message':'Logout successful'
@@ -147,6 +205,3 @@ def logout():
             'error':'Database Error',
             'message':str(e)
         }),500
-    
-
-
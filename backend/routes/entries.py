@@ -6,6 +6,8 @@ from mongoengine import DoesNotExist, ValidationError as MongoValidationError
 
 from models.user_model import User
 from models.mood_model import MoodEntry
+from models.dead_letter_model import InsightDeadLetter
+from utils.file_handler import AudioFileHandler
 from schemas.mood_entry_schema import (
     MoodEntryCreateSchema, MoodEntryUpdateSchema, 
     MoodEntryQuerySchema, MoodEntryResponseSchema
@@ -165,6 +167,10 @@ def get_entry(entry_id):
                 'message': 'You can only access your own mood entries'
             }), 403
 
+        # The user is looking at this entry, so its insight jumps the backlog
+        if not entry.ai_processed and not entry.ai_processing_failed:
+            entry.prioritize_ai(MoodEntry.PRIORITY_INTERACTIVE)
+
         return jsonify({
             'entry': entry.to_dict()
         }), 200
@@ -266,8 +272,12 @@ def delete_entry(entry_id):
                 'message': 'You can only delete your own mood entries'
             }), 403
         
-        # Delete the entry
+        # Delete the entry, then release its audio so the file does not linger
+        audio_file = entry.audio_file
         entry.delete()
+        InsightDeadLetter.objects(id=entry_id).delete()
+        if audio_file:
+            AudioFileHandler.delete_audio_renditions(audio_file)
         
         current_app.logger.info(f"Mood entry deleted: {entry_id}")
         
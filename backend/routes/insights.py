@@ -9,11 +9,51 @@ from datetime import datetime, timedelta
 
 from models.user_model import User
 from models.mood_model import MoodEntry
-from utils.ai_service import MoodInsightAI, AIServiceError
+from utils.ai_service import MoodInsightAI, AIServiceError, AIServiceDegradedError, AIBudgetExceededError
+from utils.circuit_breaker import get_ai_breaker_stats
+from utils.transcription import get_transcription_stats
+from utils.insight_processor import get_processor, get_processor_stats
+from utils.single_flight import get_single_flight, get_single_flight_stats
+from utils.token_budget import get_token_budget
+from utils.insight_retry import record_insight_failure, requeue_dead_letters
+from models.dead_letter_model import InsightDeadLetter
 
 # Create Blueprint for insights routes
 insights_bp = Blueprint('insights', __name__)
 
+def pending_insight_response(entry, retry_after=None):
+    """
+    Response for an entry whose insight is being generated elsewhere, or is
+    queued until the AI service recovers (retry_after is then set).
+    """
+    entry.prioritize_ai(MoodEntry.PRIORITY_INTERACTIVE)
+    if entry.ai_processing_failed:
+        return jsonify({
+            'insight': None,
+            'processed': False,
+            'failed': True,
+            'error_message': entry.ai_error_message,
+            'entry_id': str(entry.id)
+        }), 200
+    response = jsonify({
+        'insight': None,
+        'processed': False,
+        'pending': True,
+        'degraded': retry_after is not None,
+        'message': 'Insight is being generated, please retry shortly',
+        'entry_id': str(entry.id)
+    })
+    if retry_after is not None:
+        response.headers['Retry-After'] = str(retry_after)
+    return response, 202
+
+def budget_exceeded_response(error):
+    """429 for a spent daily token budget"""
+    return jsonify({
+        'error': 'AI Budget Exceeded',
+        'message': str(error)
+    }), 429
+
 @insights_bp.route('/entry/<entry_id>', methods=['GET'])
 @jwt_required()
 def get_entry_insight(entry_id):
@@ -67,6 +107,17 @@ def get_entry_insight(entry_id):
                 'entry_id': entry_id
             }), 200
         
+        # Wait for the voice note transcript before generating
+        if entry.is_waiting_for_transcript(current_app.config.get('TRANSCRIPTION_WAIT_TIMEOUT')):
+            entry.prioritize_ai(MoodEntry.PRIORITY_INTERACTIVE)
+            return jsonify({
+                'insight': None,
+                'processed': False,
+                'pending': True,
+                'message': 'Voice note is still being transcribed',
+                'entry_id': entry_id
+            }), 202
+        
         # Check if entry has content for AI analysis
         if not entry.has_content_for_ai():
             return jsonify({
@@ -85,29 +136,64 @@ def get_entry_insight(entry_id):
                     'message': 'AI insights are currently unavailable. Please try again later.'
                 }), 503
             
-            # Generate the insight
-            insight = ai_service.generate_insight(
-                mood_emotion=entry.mood.emotion if entry.mood else "neutral",
-                mood_emoji=entry.mood.emoji if entry.mood else "😐",
-                text_note=entry.text_note,
-                audio_transcript="[Voice note recorded]" if entry.audio_file else None
-            )
+            # While OpenAI is failing, answer from templates or the cache, or leave it queued
+            if ai_service.is_degraded():
+                if get_processor().resolve_locally(entry):
+                    return jsonify({
+                        'insight': entry.ai_insight,
+                        'processed': True,
+                        'processed_at': entry.ai_processed_at.isoformat(),
+                        'entry_id': entry_id
+                    }), 200
+                return pending_insight_response(entry, retry_after=ai_service.breaker.retry_after())
             
-            # Save the insight
-            entry.mark_ai_processing_complete(insight)
+            def generate():
+                # Another request may have finished while we waited for the lease
+                entry.reload(*MoodEntry.AI_FIELDS)
+                if entry.ai_processed:
+                    return
+                insight = ai_service.generate_insight(
+                    mood_emotion=entry.mood.emotion if entry.mood else "neutral",
+                    mood_emoji=entry.mood.emoji if entry.mood else "😐",
+                    text_note=entry.text_note,
+                    audio_transcript=entry.get_audio_transcript(),
+                    user_id=user.id
+                )
+                # Save the insight; if another worker finished first, theirs is kept
+                entry.mark_ai_processing_complete(insight, source=ai_service.last_source)
+                current_app.logger.info(f"AI insight generated for entry: {entry_id}")
             
-            current_app.logger.info(f"AI insight generated for entry: {entry_id}")
+            # Concurrent requests for this entry share a single generation
+            get_single_flight().run(entry, generate)
+            entry.reload(*MoodEntry.AI_FIELDS)
+            
+            if not entry.ai_processed:
+                return pending_insight_response(entry)
             
             return jsonify({
-                'insight': insight,
+                'insight': entry.ai_insight,
                 'processed': True,
                 'processed_at': entry.ai_processed_at.isoformat(),
                 'entry_id': entry_id
             }), 200
             
+        except AIServiceDegradedError as e:
+            return pending_insight_response(entry, retry_after=e.retry_after)
+        except AIBudgetExceededError as e:
+            return budget_exceeded_response(e)
         except AIServiceError as e:
-            # Mark as failed and return error
-            entry.mark_ai_processing_failed(str(e))
+            # Transient errors are retried by the processor; others mark the entry failed
+            outcome = record_insight_failure(entry, e)
+            if outcome == 'retry':
+                return pending_insight_response(entry)
+            if outcome == 'done':
+                # Another worker finished the insight while this call was failing
+                return jsonify({
+                    'insight': entry.ai_insight,
+                    'processed': True,
+                    'processed_at': entry.ai_processed_at.isoformat() if entry.ai_processed_at else None,
+                    'entry_id': entry_id
+                }), 200
             
             return jsonify({
                 'error': 'AI Processing Failed',
@@ -174,31 +260,55 @@ def regenerate_entry_insight(entry_id):
                     'message': 'AI insights are currently unavailable'
                 }), 503
             
-            # Reset processing status and regenerate
-            entry.reset_ai_processing()
+            # Queue the regeneration for when the circuit recovers
+            if ai_service.is_degraded():
+                entry.reset_ai_processing(priority=MoodEntry.PRIORITY_INTERACTIVE)
+                return pending_insight_response(entry, retry_after=ai_service.breaker.retry_after())
             
-            insight = ai_service.generate_insight(
-                mood_emotion=entry.mood.emotion if entry.mood else "neutral",
-                mood_emoji=entry.mood.emoji if entry.mood else "😐",
-                text_note=entry.text_note,
-                audio_transcript="[Voice note recorded]" if entry.audio_file else None
-            )
+            def generate():
+                # Reset processing status and regenerate
+                entry.reset_ai_processing(priority=MoodEntry.PRIORITY_INTERACTIVE)
+                insight = ai_service.generate_insight(
+                    mood_emotion=entry.mood.emotion if entry.mood else "neutral",
+                    mood_emoji=entry.mood.emoji if entry.mood else "😐",
+                    text_note=entry.text_note,
+                    audio_transcript=entry.get_audio_transcript(),
+                    user_id=user.id
+                )
+                # Save the new insight
+                entry.mark_ai_processing_complete(insight, source=ai_service.last_source)
+                current_app.logger.info(f"AI insight regenerated for entry: {entry_id}")
             
-            # Save the new insight
-            entry.mark_ai_processing_complete(insight)
+            # A regeneration already in flight counts for this request too
+            get_single_flight().run(entry, generate)
+            entry.reload(*MoodEntry.AI_FIELDS)
             
-            current_app.logger.info(f"AI insight regenerated for entry: {entry_id}")
+            if not entry.ai_processed:
+                return pending_insight_response(entry)
             
             return jsonify({
-                'insight': insight,
+                'insight': entry.ai_insight,
                 'processed': True,
                 'processed_at': entry.ai_processed_at.isoformat(),
                 'regenerated': True,
                 'entry_id': entry_id
             }), 200
             
+        except AIServiceDegradedError as e:
+            return pending_insight_response(entry, retry_after=e.retry_after)
+        except AIBudgetExceededError as e:
+            return budget_exceeded_response(e)
         except AIServiceError as e:
-            entry.mark_ai_processing_failed(str(e))
+            outcome = record_insight_failure(entry, e)
+            if outcome == 'retry':
+                return pending_insight_response(entry)
+            if outcome == 'done':
+                return jsonify({
+                    'insight': entry.ai_insight,
+                    'processed': True,
+                    'processed_at': entry.ai_processed_at.isoformat() if entry.ai_processed_at else None,
+                    'entry_id': entry_id
+                }), 200
             
             return jsonify({
                 'error': 'AI Processing Failed',
@@ -259,7 +369,7 @@ def get_weekly_summary():
                 }), 503
             
             # Generate weekly summary
-            summary = ai_service.generate_weekly_summary(list(entries))
+            summary = ai_service.generate_weekly_summary(list(entries), user_id=user.id)
             
             return jsonify({
                 'summary': summary,
@@ -268,6 +378,15 @@ def get_weekly_summary():
                 'generated_at': datetime.utcnow().isoformat()
             }), 200
             
+        except AIBudgetExceededError as e:
+            return budget_exceeded_response(e)
+        except AIServiceDegradedError as e:
+            response = jsonify({
+                'error': 'AI Service Degraded',
+                'message': 'Weekly summaries are temporarily unavailable, please retry later'
+            })
+            response.headers['Retry-After'] = str(e.retry_after)
+            return response, 503
         except AIServiceError as e:
             return jsonify({
                 'error': 'AI Processing Failed',
@@ -388,6 +507,10 @@ def get_ai_status():
                 'available': ai_available,
                 'status': ai_message
             },
+            'transcription': get_transcription_stats(),
+            'insight_sources': get_processor_stats(),
+            'single_flight': get_single_flight_stats(),
+            'circuit': get_ai_breaker_stats(),
             'user_stats': {
                 'total_entries': total_entries,
                 'processed_insights': processed_entries,
@@ -402,4 +525,104 @@ def get_ai_status():
         return jsonify({
             'error': 'Status Check Failed',
             'message': 'Unable to check AI service status'
-        }), 500
\ No newline at end of file
+        }), 500
+
+@insights_bp.route('/usage', methods=['GET'])
+@jwt_required()
+def get_token_usage():
+    """Get the user's AI token consumption against their daily budget"""
+    
+    try:
+        # Get current user
+        user_id = get_jwt_identity()
+        user = User.objects(id=user_id).first()
+        
+        if not user:
+            return jsonify({
+                'error': 'User Not Found',
+                'message': 'User account not found'
+            }), 404
+        
+        days = min(request.args.get('days', 7, type=int), 90)
+        
+        return jsonify({
+            'usage': get_token_budget().report(user.id, days=days)
+        }), 200
+        
+    except Exception as e:
+        current_app.logger.error(f"Token usage error: {e}")
+        return jsonify({
+            'error': 'Usage Failed',
+            'message': 'Unable to get token usage'
+        }), 500
+
+@insights_bp.route('/dead-letters', methods=['GET'])
+@jwt_required()
+def get_dead_letters():
+    """List the user's entries whose insight generation was given up on"""
+    
+    try:
+        # Get current user
+        user_id = get_jwt_identity()
+        user = User.objects(id=user_id).first()
+        
+        if not user:
+            return jsonify({
+                'error': 'User Not Found',
+                'message': 'User account not found'
+            }), 404
+        
+        letters = InsightDeadLetter.objects(user_id=str(user.id)).order_by('-created_at').limit(100)
+        
+        return jsonify({
+            'dead_letters': [letter.to_dict() for letter in letters],
+            'total': InsightDeadLetter.objects(user_id=str(user.id)).count()
+        }), 200
+        
+    except Exception as e:
+        current_app.logger.error(f"Dead letters error: {e}")
+        return jsonify({
+            'error': 'Query Failed',
+            'message': 'Unable to get failed insights'
+        }), 500
+
+@insights_bp.route('/dead-letters/requeue', methods=['POST'])
+@jwt_required()
+def requeue_failed_insights():
+    """Requeue failed insights; all of the user's unless entry_ids is given"""
+    
+    try:
+        # Get current user
+        user_id = get_jwt_identity()
+        user = User.objects(id=user_id).first()
+        
+        if not user:
+            return jsonify({
+                'error': 'User Not Found',
+                'message': 'User account not found'
+            }), 404
+        
+        entry_ids = (request.get_json(silent=True) or {}).get('entry_ids')
+        if entry_ids is not None and not isinstance(entry_ids, list):
+            return jsonify({
+                'error': 'Invalid Request',
+                'message': 'entry_ids must be an array'
+            }), 400
+        
+        letters = InsightDeadLetter.objects(user_id=str(user.id))
+        if entry_ids is not None:
+            letters = letters.filter(id__in=entry_ids)
+        requeued = requeue_dead_letters(letters)
+        
+        current_app.logger.info(f"Requeued {requeued} failed insights for user: {user.email}")
+        
+        return jsonify({
+            'requeued': requeued
+        }), 200
+        
+    except Exception as e:
+        current_app.logger.error(f"Requeue error: {e}")
+        return jsonify({
+            'error': 'Requeue Failed',
+            'message': 'Unable to requeue failed insights'
+        }), 500
@@ -0,0 +1,15 @@
+import pytest
+
+
+@pytest.fixture
+def mongo(monkeypatch):
+    """Point mongoengine at an in-memory mongomock database for tests that need documents"""
+    mongomock = pytest.importorskip('mongomock')
+    from mongoengine import connect, disconnect
+
+    # Apps created by the test keep the in-memory connection instead of configuring a real one
+    monkeypatch.setattr('app.connect_database', lambda app: None)
+    disconnect()
+    connect('mood_journal_test', mongo_client_class=mongomock.MongoClient)
+    yield
+    disconnect()
@@ -0,0 +1,94 @@
+import pytest
+from flask import Flask
+from utils.ai_service import MoodInsightAI, AIServiceError, AIBudgetExceededError
+from utils.circuit_breaker import CircuitBreaker
+from utils.llm_providers import Completion
+from utils.token_budget import BudgetPlan
+
+
+class FakeProvider:
+    def __init__(self, name, fail=False):
+        self.name = name
+        self.fail = fail
+        self.calls = 0
+
+    def is_available(self):
+        return True
+
+    def complete(self, messages, max_tokens, temperature=0.7):
+        self.calls += 1
+        if self.fail:
+            raise RuntimeError('upstream down')
+        return Completion(f'{self.name} insight', self.name, 10, 5, 0.01)
+
+
+class FakeBudget:
+    def __init__(self, detail='full', exhausted=False):
+        self.detail = detail
+        self.exhausted = exhausted
+        self.recorded = []
+
+    def plan(self, user_id, max_tokens):
+        return BudgetPlan(max_tokens // 2 if self.detail != 'full' else max_tokens, self.detail, self.exhausted)
+
+    def record(self, user_id, completion):
+        self.recorded.append((user_id, completion.provider))
+
+
+@pytest.fixture
+def ai():
+    app = Flask(__name__)
+    app.config.update(OPENAI_API_KEY=None, LOCAL_MODEL_ROUTING='fallback')
+    with app.app_context():
+        service = MoodInsightAI()
+        service.breaker = CircuitBreaker('test')
+        service.budget = FakeBudget()
+        service.client = object()
+        service.openai = FakeProvider('openai')
+        service.local = FakeProvider('local')
+        yield service
+
+
+def test_uses_openai_when_healthy(ai):
+    assert ai.generate_insight('happy', text_note='a long day') == 'openai insight'
+    assert ai.last_source == 'llm'
+
+
+def test_falls_back_to_local_model_on_failure(ai):
+    ai.openai.fail = True
+    assert ai.generate_insight('sad', text_note='a long day') == 'local insight'
+    assert ai.last_source == 'local'
+
+
+def test_simple_routing_sends_short_entries_to_local_model(ai):
+    ai.routing = 'simple'
+    ai.generate_insight('happy', text_note='good day')
+    assert ai.local.calls == 1 and ai.openai.calls == 0
+    ai.generate_insight('happy', text_note='word ' * 100)
+    assert ai.openai.calls == 1
+
+
+def test_no_fallback_without_local_model(ai):
+    ai.local = None
+    ai.openai.fail = True
+    with pytest.raises(AIServiceError):
+        ai.generate_insight('happy', text_note='a long day')
+
+
+def test_records_usage_per_user(ai):
+    ai.generate_insight('happy', text_note='a long day', user_id='u1')
+    assert ai.budget.recorded == [('u1', 'openai')]
+
+
+def test_spent_budget_uses_local_model_only(ai):
+    ai.budget.exhausted = True
+    assert ai.generate_insight('happy', text_note='a long day') == 'local insight'
+    assert ai.openai.calls == 0
+    ai.local = None
+    with pytest.raises(AIBudgetExceededError):
+        ai.generate_insight('happy', text_note='a long day')
+
+
+def test_brief_prompt_truncates_reflection(ai):
+    prompt = ai.build_prompt('sad', text_note='x' * 1000, user_context='ctx', detail='brief')
+    assert 'x' * 281 not in prompt and 'ctx' not in prompt
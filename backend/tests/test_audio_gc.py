@@ -0,0 +1,98 @@
+import hashlib
+import os
+import time
+from datetime import datetime, timedelta
+import pytest
+from flask import Flask
+
+from models.audio_model import AudioBlob, AudioFile
+from models.mood_model import Mood, MoodEntry
+from models.user_model import User
+from utils.audio_gc import AudioGarbageCollector
+from utils.file_handler import AudioFileHandler
+from utils.storage import get_storage, get_temp_dir
+
+
+@pytest.fixture
+def app(mongo, tmp_path):
+    app = Flask(__name__)
+    app.config['UPLOAD_FOLDER'] = str(tmp_path)
+    with app.app_context():
+        yield app
+
+
+def store(data):
+    content_hash = hashlib.sha256(data).hexdigest()
+    path = os.path.join(get_temp_dir(), f'{content_hash}.part')
+    with open(path, 'wb') as f:
+        f.write(data)
+    AudioFileHandler.store_blob(path, content_hash)
+    return content_hash
+
+
+def stored(content_hash):
+    return get_storage().exists(AudioFileHandler.get_storage_key(content_hash, content_hash))
+
+
+def add_entry(user, content_hash):
+    audio = AudioFile(filename=f'{content_hash[:8]}.wav', content_hash=content_hash)
+    return MoodEntry(user=user, mood=Mood(emoji='😐', emotion='neutral'), entry_date=datetime.now(), audio_file=audio).save()
+
+
+def age(content_hash, referenced=True):
+    """Move the stored object, and optionally the blob's last reference change, out of the grace period"""
+    day_ago = datetime.utcnow() - timedelta(days=1)
+    path = get_storage()._path(AudioFileHandler.get_storage_key(content_hash, content_hash))
+    os.utime(path, (time.time() - 86400,) * 2)
+    if referenced:
+        AudioBlob.objects(id=content_hash).update_one(set__referenced_at=day_ago)
+
+
+def collector():
+    return AudioGarbageCollector(grace=timedelta(hours=1), max_deletes_per_second=0)
+
+
+def test_blob_orphaned_by_user_cascade_is_collected(app):
+    user = User(email='gc@example.com', password_hash='x', first_name='G', last_name='C').save()
+    content_hash = store(b'orphaned by cascade')
+    add_entry(user, content_hash)
+
+    # A queryset delete skips User.delete, so the CASCADE leaves the blob's reference behind
+    User.objects(id=user.id).delete()
+    assert MoodEntry.objects.count() == 0
+    assert AudioBlob.objects.get(id=content_hash).ref_count == 1
+    age(content_hash)
+
+    stats = collector().run()
+    assert stats['refs_repaired'] == 1 and stats['removed'] == 1
+    assert not stored(content_hash)
+    assert not AudioBlob.objects(id=content_hash).count()
+
+
+def test_recent_dedup_reference_keeps_the_blob(app):
+    user = User(email='gc@example.com', password_hash='x', first_name='G', last_name='C').save()
+    content_hash = store(b'shared voice note')
+    add_entry(user, content_hash)
+    # A second upload of the same content, whose entry isn't saved yet
+    store(b'shared voice note')
+    age(content_hash, referenced=False)
+    MoodEntry.objects.delete()
+
+    stats = collector().run()
+    assert stats['referenced'] == 1 and stats['removed'] == 0
+    assert stored(content_hash)
+    assert AudioBlob.objects.get(id=content_hash).ref_count == 2
+
+
+def test_user_delete_releases_their_audio(app):
+    user = User(email='gc@example.com', password_hash='x', first_name='G', last_name='C').save()
+    other = User(email='other@example.com', password_hash='x', first_name='O', last_name='T').save()
+    content_hash = store(b'voice note')
+    add_entry(user, content_hash)
+    add_entry(other, store(b'voice note'))
+
+    user.delete()
+    assert AudioBlob.objects.get(id=content_hash).ref_count == 1
+    other.delete()
+    assert not stored(content_hash)
+    assert not AudioBlob.objects(id=content_hash).count()
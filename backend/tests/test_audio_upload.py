@@ -0,0 +1,89 @@
+import hashlib
+import io
+from datetime import datetime
+import pytest
+from flask_jwt_extended import create_access_token
+
+from app import create_app
+from models.audio_model import AudioBlob
+from models.mood_model import Mood, MoodEntry
+from models.user_model import User
+from utils.file_handler import AudioFileHandler
+from utils.storage import get_storage
+
+CLIP = b'RIFF' + bytes(64)
+
+
+@pytest.fixture
+def app(mongo, tmp_path):
+    app = create_app('testing')
+    app.config.update({
+        'JWT_SECRET_KEY': 'test-secret',
+        'UPLOAD_FOLDER': str(tmp_path),
+        'AUDIO_TRANSCODE_ENABLED': False,
+        'TRANSCRIPTION_ENABLED': False,
+    })
+    with app.app_context():
+        yield app
+
+
+@pytest.fixture
+def user(app):
+    return User(email='audio@example.com', password_hash='x', first_name='A', last_name='U').save()
+
+
+@pytest.fixture
+def headers(app, user):
+    return {'Authorization': f'Bearer {create_access_token(identity=user.id)}'}
+
+
+def new_entry(user):
+    return MoodEntry(user=user, mood=Mood(emoji='😐', emotion='neutral'), entry_date=datetime.now()).save()
+
+
+def upload(app, headers, entry, data=CLIP):
+    return app.test_client().post('/api/audio/upload', headers=headers, content_type='multipart/form-data', data={
+        'entry_id': entry.id,
+        'audio': (io.BytesIO(data), 'note.wav', 'audio/wav'),
+    })
+
+
+def blob(content):
+    content_hash = hashlib.sha256(content).hexdigest()
+    return AudioBlob.objects(id=content_hash).first(), get_storage().exists(AudioFileHandler.get_storage_key(content_hash, content_hash))
+
+
+def test_identical_uploads_share_one_blob(app, user, headers):
+    first, second = new_entry(user), new_entry(user)
+    assert upload(app, headers, first).status_code == 201
+    assert upload(app, headers, second).status_code == 201
+    shared, exists = blob(CLIP)
+    assert shared.ref_count == 2 and exists
+
+    client = app.test_client()
+    assert client.delete(f'/api/audio/entry/{first.id}', headers=headers).status_code == 200
+    shared, exists = blob(CLIP)
+    assert shared.ref_count == 1 and exists
+
+    assert client.delete(f'/api/audio/entry/{second.id}', headers=headers).status_code == 200
+    shared, exists = blob(CLIP)
+    assert shared is None and not exists
+
+
+def test_concurrent_upload_to_the_same_entry_is_rejected(app, user, headers, monkeypatch):
+    entry = new_entry(user)
+    save_audio_file = AudioFileHandler.save_audio_file
+
+    def racing_save(file):
+        # Another upload attaches its audio while this one is being stored
+        monkeypatch.setattr(AudioFileHandler, 'save_audio_file', save_audio_file)
+        assert upload(app, headers, entry, b'RIFF other upload').status_code == 201
+        return save_audio_file(file)
+
+    monkeypatch.setattr(AudioFileHandler, 'save_audio_file', racing_save)
+    response = upload(app, headers, entry)
+    assert response.status_code == 409
+
+    # The winner keeps the entry and the loser's reference is given back
+    assert MoodEntry.objects.get(id=entry.id).audio_file.content_hash == blob(b'RIFF other upload')[0].id
+    assert blob(CLIP) == (None, False)
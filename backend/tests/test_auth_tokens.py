@@ -0,0 +1,44 @@
+from datetime import timedelta
+import pytest
+from flask_jwt_extended import create_access_token, create_refresh_token
+from app import create_app
+from models.user_model import User
+from utils.auth_tokens import RevocationSet
+
+
+@pytest.fixture
+def app(mongo):
+    app = create_app('testing')
+    app.config['JWT_SECRET_KEY'] = 'test-secret'
+    with app.app_context():
+        User(id='user-1', email='tokens@example.com', password_hash='x', first_name='T', last_name='K').save()
+    return app
+
+
+@pytest.mark.parametrize('refresh_claims, expires', [
+    ({'fam': 'family'}, timedelta(seconds=-1)),  # expired
+    ({}, timedelta(days=1)),  # issued before refresh token families
+])
+def test_logout_with_unusable_refresh_token_succeeds(app, refresh_claims, expires):
+    with app.app_context():
+        access_token = create_access_token(identity='user-1')
+        refresh_token = create_refresh_token(identity='user-1', expires_delta=expires, additional_claims=refresh_claims)
+
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {access_token}'}
+    response = client.post('/auth/logout/', headers=headers, json={'refresh_token': refresh_token})
+    assert response.status_code == 200
+    assert client.post('/auth/logout/', headers=headers).status_code == 401
+
+
+def test_logged_out_token_is_rejected_by_other_processes(app, monkeypatch):
+    with app.app_context():
+        access_token = create_access_token(identity='user-1')
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {access_token}'}
+    assert client.get('/auth/me/', headers=headers).status_code == 200
+    assert client.post('/auth/logout/', headers=headers).status_code == 200
+
+    # Another worker never saw the logout in its own memory
+    monkeypatch.setattr('utils.auth_tokens.revoked_tokens', RevocationSet())
+    assert client.get('/auth/me/', headers=headers).status_code == 401
@@ -0,0 +1,88 @@
+import time
+import pytest
+from flask import Flask
+from utils.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+
+@pytest.fixture(autouse=True)
+def app_context():
+    with Flask(__name__).app_context():
+        yield
+
+
+def fail():
+    raise RuntimeError('upstream down')
+
+
+def test_opens_on_failure_rate_and_rejects():
+    breaker = CircuitBreaker('test', failure_rate=0.5, window_size=4, min_calls=4, open_seconds=60)
+    breaker.call(lambda: 'ok')
+    for _ in range(3):
+        with pytest.raises(RuntimeError):
+            breaker.call(fail)
+    assert breaker.is_open()
+    with pytest.raises(CircuitOpenError):
+        breaker.call(lambda: 'ok')
+    assert breaker.get_stats()['rejected'] == 1
+
+
+def test_opens_on_slow_calls():
+    breaker = CircuitBreaker('test', slow_call_seconds=0.01, slow_call_rate=0.5, window_size=2, min_calls=2)
+    breaker.call(time.sleep, 0.02)
+    breaker.call(time.sleep, 0.02)
+    assert breaker.get_stats()['state'] == CircuitBreaker.OPEN
+
+
+def test_half_open_probes_close_the_circuit():
+    breaker = CircuitBreaker('test', window_size=2, min_calls=2, open_seconds=0.05, half_open_calls=2)
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            breaker.call(fail)
+    time.sleep(0.06)
+    assert not breaker.is_open()
+    breaker.call(lambda: 'ok')
+    breaker.call(lambda: 'ok')
+    assert breaker.get_stats()['state'] == CircuitBreaker.CLOSED
+
+
+def test_failed_probe_reopens():
+    breaker = CircuitBreaker('test', window_size=2, min_calls=2, open_seconds=0.05)
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            breaker.call(fail)
+    time.sleep(0.06)
+    with pytest.raises(RuntimeError):
+        breaker.call(fail)
+    assert breaker.is_open()
+    assert breaker.get_stats()['opened'] == 2
+
+
+def test_half_open_with_probes_in_flight_asks_to_retry_later():
+    breaker = CircuitBreaker('test', window_size=2, min_calls=2, open_seconds=0.05, half_open_calls=1)
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            breaker.call(fail)
+    time.sleep(0.06)
+
+    def probe():
+        # The only probe is in flight, so other callers are turned away for now
+        seen.append((breaker.is_open(), breaker.retry_after()))
+        return 'ok'
+
+    seen = []
+    breaker.call(probe)
+    assert seen == [(True, 1)]
+    assert breaker.retry_after() == 0
+
+
+def test_errors_that_are_not_failures_do_not_trip():
+    breaker = CircuitBreaker('test', window_size=2, min_calls=2, is_failure=lambda e: not isinstance(e, ValueError))
+
+    def bad_request():
+        raise ValueError('malformed prompt')
+
+    for _ in range(4):
+        with pytest.raises(ValueError):
+            breaker.call(bad_request)
+    assert breaker.get_stats()['state'] == CircuitBreaker.CLOSED
+    assert breaker.get_stats()['failures'] == 0
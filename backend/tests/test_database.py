@@ -0,0 +1,30 @@
+import pytest
+from pymongo import ReadPreference
+from utils.database import connection_settings, ReadinessCheck
+
+
+def test_connection_settings_from_config():
+    settings = connection_settings({
+        'MONGODB_MAX_POOL_SIZE': 20,
+        'MONGODB_SOCKET_TIMEOUT_MS': 0,
+        'MONGODB_READ_PREFERENCE': 'secondaryPreferred',
+        'MONGODB_WRITE_CONCERN': 'majority',
+    })
+    assert settings['maxPoolSize'] == 20
+    assert settings['socketTimeoutMS'] is None
+    assert settings['read_preference'] == ReadPreference.SECONDARY_PREFERRED
+    assert settings['w'] == 'majority'
+    assert connection_settings({'MONGODB_WRITE_CONCERN': '1'})['w'] == 1
+
+
+def test_unknown_read_preference_is_rejected():
+    with pytest.raises(ValueError):
+        connection_settings({'MONGODB_READ_PREFERENCE': 'fastest'})
+
+
+def test_readiness_is_cached():
+    check = ReadinessCheck(cache_seconds=60)
+    pings = []
+    check._ping = lambda: pings.append(1) or {'ready': True}
+    assert check.check()['ready'] and check.check()['ready']
+    assert len(pings) == 1
@@ -0,0 +1,43 @@
+import pytest
+
+from app import create_app
+from commands.indexes import _collection, diff_indexes
+from models.mood_model import MoodEntry
+
+
+@pytest.fixture
+def app(mongo, monkeypatch):
+    # mongomock has no $indexStats
+    monkeypatch.setattr('commands.indexes._index_usage', lambda collection: None)
+    return create_app('testing')
+
+
+@pytest.fixture
+def entries(app):
+    """mood_entries with every declared index, but audio_file.filename built before it was sparse, plus an old one"""
+    collection = _collection(MoodEntry)
+    for spec in MoodEntry._meta['index_specs']:
+        built_before_sparse = spec['fields'] == [('audio_file.filename', 1)]
+        collection.create_index(list(spec['fields']), sparse=bool(spec.get('sparse')) and not built_before_sparse)
+    collection.create_index([('entry_date', 1)])
+    return collection
+
+
+def test_diff_reports_changed_options(entries):
+    missing, changed, extra, _ = diff_indexes(MoodEntry)
+    assert not missing
+    assert [(name, options) for name, _, options in changed] == [('audio_file.filename_1', {})]
+    assert [name for name, _, _ in extra] == ['entry_date_1']
+
+
+def test_sync_rebuilds_indexes_whose_options_changed(app, entries):
+    runner = app.test_cli_runner()
+    dry_run = runner.invoke(args=['indexes', 'sync', '--dry-run'])
+    assert 'mood_entries: rebuilding audio_file.filename_1 (no options -> sparse=True)' in dry_run.output
+    assert not entries.index_information()['audio_file.filename_1'].get('sparse')
+
+    assert runner.invoke(args=['indexes', 'sync']).exit_code == 0
+    assert entries.index_information()['audio_file.filename_1']['sparse']
+    missing, changed, extra, _ = diff_indexes(MoodEntry)
+    assert not (missing or changed)
+    assert 'mood_entries:\n  undeclared  entry_date_1 (?)\n' in runner.invoke(args=['indexes', 'status']).output
@@ -0,0 +1,117 @@
+from datetime import datetime
+import pytest
+
+from app import create_app
+from models.audio_model import AudioFile
+from models.mood_model import Mood, MoodEntry
+from models.user_model import User
+from utils.insight_processor import InsightProcessor
+from utils.insight_templates import TEMPLATE_INSIGHTS, InsightCache
+
+
+class FakeAI:
+    last_source = 'llm'
+
+    def __init__(self, generate=None):
+        self.calls = []
+        self.generate = generate
+
+    def is_available(self):
+        return True
+
+    def is_degraded(self):
+        return False
+
+    def generate_insight(self, **kwargs):
+        self.calls.append(kwargs)
+        if self.generate:
+            self.generate()
+        return 'a generated insight'
+
+
+@pytest.fixture
+def app(mongo):
+    app = create_app('testing')
+    with app.app_context():
+        yield app
+
+
+@pytest.fixture
+def user(app):
+    return User(email='processor@example.com', password_hash='x', first_name='P', last_name='R').save()
+
+
+def new_entry(user, text_note='a long and difficult day at work', emotion='sad', **fields):
+    return MoodEntry(user=user, mood=Mood(emoji='😢', emotion=emotion), text_note=text_note,
+                     entry_date=datetime.now(), **fields).save()
+
+
+def processor_with(ai):
+    processor = InsightProcessor()
+    processor.ai_service = ai
+    return processor
+
+
+def test_insight_finished_elsewhere_is_kept_and_not_counted(user):
+    entry = new_entry(user)
+    processor = processor_with(FakeAI(lambda: MoodEntry.objects.get(id=entry.id).mark_ai_processing_complete('from a request')))
+
+    assert processor.process_entry(entry)
+    assert MoodEntry.objects.get(id=entry.id).ai_insight == 'from a request'
+    assert processor.get_stats()['llm'] == 0
+
+
+@pytest.mark.parametrize('text_note, transcript, trivial', [
+    (None, None, True),  # mood only
+    ('ok', None, True),
+    ('  fine  today ', None, True),
+    (None, '', True),  # voice note that couldn't be transcribed
+    (None, 'walked by the river after work', False),
+    ('tired', 'long meeting again', False),  # note and transcript together
+    ('a long and difficult day', None, False),
+])
+def test_trivial_entries(text_note, transcript, trivial):
+    audio = AudioFile(filename='note.wav', transcript=transcript) if transcript is not None else None
+    entry = MoodEntry(mood=Mood(emoji='😐', emotion='neutral'), text_note=text_note, audio_file=audio)
+    assert entry.is_trivial_for_ai(min_words=3) is trivial
+
+
+@pytest.mark.parametrize('fields', [
+    {'text_note': None},
+    {'text_note': 'meh'},
+    {'text_note': None, 'audio_file': AudioFile(filename='note.wav', transcript_status='unavailable')},
+])
+def test_empty_and_trivial_entries_never_reach_the_llm(user, fields):
+    ai = FakeAI()
+    processor = processor_with(ai)
+    entry = new_entry(user, **fields)
+
+    processor.process_entry(entry)
+    stored = MoodEntry.objects.get(id=entry.id)
+    assert not ai.calls
+    assert stored.ai_processed and stored.ai_insight_source == 'template'
+    assert stored.ai_insight in TEMPLATE_INSIGHTS['sad']
+    assert processor.get_stats()['template'] == 1
+
+
+def test_repeated_content_is_answered_from_the_cache(user):
+    ai = FakeAI()
+    processor = processor_with(ai)
+    first = new_entry(user, text_note='Long day at work, feeling drained')
+    repeat = new_entry(user, text_note='  long day at WORK,   feeling drained ')
+    other_mood = new_entry(user, text_note='Long day at work, feeling drained', emotion='angry')
+
+    for entry in (first, repeat, other_mood):
+        processor.process_entry(entry)
+
+    assert len(ai.calls) == 2
+    assert [MoodEntry.objects.get(id=entry.id).ai_insight_source for entry in (first, repeat, other_mood)] == ['llm', 'cache', 'llm']
+    assert processor.get_stats() == {'template': 0, 'cache': 1, 'llm': 2, 'local': 0, 'failed': 0}
+    assert processor.insight_cache.get_stats() == {'size': 2, 'hits': 1, 'misses': 2}
+
+
+def test_cache_key_ignores_case_and_whitespace_only():
+    key = InsightCache.make_key('sad', 'Long  day', 'at work')
+    assert key == InsightCache.make_key('sad', 'long day ', ' AT WORK')
+    assert key != InsightCache.make_key('happy', 'long day', 'at work')
+    assert key != InsightCache.make_key('sad', 'long day at work')
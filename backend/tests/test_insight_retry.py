@@ -0,0 +1,89 @@
+from datetime import timedelta
+from types import SimpleNamespace
+import httpx
+import openai
+import pytest
+from flask import Flask
+from utils.ai_service import AIServiceError, AIServiceDegradedError
+from utils.insight_retry import is_transient_error, retry_delay, record_insight_failure
+
+
+def openai_error(error_class, status):
+    request = httpx.Request('POST', 'https://api.openai.com/v1/chat/completions')
+    return error_class('failed', response=httpx.Response(status, request=request), body=None)
+
+
+def wrapped(error):
+    try:
+        raise AIServiceError('generation failed') from error
+    except AIServiceError as e:
+        return e
+
+
+@pytest.mark.parametrize('error, transient', [
+    (openai_error(openai.RateLimitError, 429), True),
+    (openai_error(openai.InternalServerError, 500), True),
+    (TimeoutError(), True),
+    (AIServiceDegradedError('circuit open'), True),
+    (openai_error(openai.BadRequestError, 400), False),
+    (openai_error(openai.AuthenticationError, 401), False),
+    (ValueError('bad data'), False),
+])
+def test_transient_and_permanent_errors(error, transient):
+    assert is_transient_error(error) is transient
+    if not isinstance(error, AIServiceError):
+        # Provider errors usually arrive as the cause of an AIServiceError
+        assert is_transient_error(wrapped(error)) is transient
+
+
+def test_retry_delay_backs_off_with_jitter_up_to_max():
+    for attempt, ceiling in [(1, 30), (2, 60), (3, 120), (10, 3600)]:
+        delay = retry_delay(attempt, base_seconds=30, max_seconds=3600)
+        assert timedelta(seconds=ceiling / 2) <= delay <= timedelta(seconds=ceiling)
+
+
+class FakeEntry:
+    def __init__(self, attempts):
+        self.id = 'entry-1'
+        self.user = SimpleNamespace(id='user-1')
+        self.mood = SimpleNamespace(emotion='sad')
+        self.text_note = 'A long day'
+        self.audio_file = None
+        self.ai_attempts = attempts
+        self.ai_processed = False
+        self.calls = []
+
+    def schedule_ai_retry(self, error_message, delay):
+        self.calls.append('retry')
+        return True
+
+    def mark_ai_processing_failed(self, error_message):
+        self.calls.append('failed')
+        return True
+
+
+@pytest.fixture
+def dead_letters(monkeypatch):
+    saved = []
+    monkeypatch.setattr('utils.insight_retry.InsightDeadLetter.save', lambda letter: saved.append(letter))
+    app = Flask(__name__)
+    app.config['INSIGHT_MAX_ATTEMPTS'] = 3
+    with app.app_context():
+        yield saved
+
+
+def test_transient_failures_retry_until_max_attempts(dead_letters):
+    error = TimeoutError('slow')
+    assert record_insight_failure(FakeEntry(attempts=1), error) == 'retry'
+
+    entry = FakeEntry(attempts=2)
+    assert record_insight_failure(entry, error) == 'dead'
+    assert entry.calls == ['failed']
+    assert dead_letters[0].attempts == 3 and dead_letters[0].transient
+
+
+def test_permanent_failure_is_dead_lettered_at_once(dead_letters):
+    entry = FakeEntry(attempts=0)
+    assert record_insight_failure(entry, wrapped(openai_error(openai.BadRequestError, 400))) == 'dead'
+    assert entry.calls == ['failed']
+    assert dead_letters[0].error_type == 'BadRequestError' and not dead_letters[0].transient
@@ -0,0 +1,55 @@
+from flask import Flask
+from utils.metrics import MetricsRegistry, init_metrics, registry
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = MetricsRegistry()
+    latency = registry.histogram('request_seconds', 'Latency.', ['endpoint'], buckets=(0.1, 1.0))
+    latency.observe(0.05, endpoint='/a')
+    latency.observe(0.5, endpoint='/a')
+    latency.observe(5, endpoint='/a')
+    text = registry.render()
+    assert '# TYPE request_seconds histogram' in text
+    assert 'request_seconds_bucket{endpoint="/a",le="0.1"} 1' in text
+    assert 'request_seconds_bucket{endpoint="/a",le="1.0"} 2' in text
+    assert 'request_seconds_bucket{endpoint="/a",le="+Inf"} 3' in text
+    assert 'request_seconds_count{endpoint="/a"} 3' in text
+
+
+def test_counter_and_label_escaping():
+    registry = MetricsRegistry()
+    requests = registry.counter('requests_total', 'Requests.', ['path'])
+    requests.inc(path='/say "hi"')
+    requests.inc(2, path='/say "hi"')
+    assert 'requests_total{path="/say \\"hi\\""} 3' in registry.render()
+
+
+def test_collectors_are_cached_between_scrapes():
+    registry = MetricsRegistry()
+    runs = []
+
+    @registry.collector
+    def collect():
+        runs.append(1)
+        return []
+
+    with Flask(__name__).app_context():
+        registry.render(cache_seconds=60)
+        registry.render(cache_seconds=60)
+        assert len(runs) == 1
+        registry.render(cache_seconds=0)
+        assert len(runs) == 2
+
+
+def test_metrics_endpoint_needs_token_or_allowed_address(monkeypatch):
+    monkeypatch.setattr(registry, 'collectors', [])
+    app = Flask(__name__)
+    app.config.update(METRICS_TOKEN='scrape-secret', METRICS_ALLOWED_IPS=['10.0.0.0/8'])
+    init_metrics(app)
+    client = app.test_client()
+
+    outside = {'REMOTE_ADDR': '203.0.113.9'}
+    assert client.get('/metrics', environ_base=outside).status_code == 403
+    assert client.get('/metrics', environ_base=outside, headers={'Authorization': 'Bearer wrong'}).status_code == 403
+    assert client.get('/metrics', environ_base=outside, headers={'Authorization': 'Bearer scrape-secret'}).status_code == 200
+    assert client.get('/metrics', environ_base={'REMOTE_ADDR': '10.1.2.3'}).status_code == 200
@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta
+import pytest
+from flask import Flask
+
+from models.dead_letter_model import InsightDeadLetter
+from models.mood_model import Mood, MoodEntry
+from models.user_model import User
+from utils.insight_retry import record_insight_failure
+
+
+@pytest.fixture
+def app(mongo):
+    app = Flask(__name__)
+    with app.app_context():
+        yield app
+
+
+@pytest.fixture
+def user(app):
+    return User(email='model@example.com', password_hash='x', first_name='M', last_name='E').save()
+
+
+def new_entry(user, **fields):
+    return MoodEntry(user=user, mood=Mood(emoji='😢', emotion='sad'), text_note='a hard day at work',
+                     entry_date=datetime.now(), **fields).save()
+
+
+@pytest.fixture
+def processed_elsewhere(user):
+    """An entry as loaded by a slow writer, completed by another worker after it was read"""
+    stale = new_entry(user)
+    assert MoodEntry.objects.get(id=stale.id).mark_ai_processing_complete('the winning insight')
+    return stale
+
+
+def test_late_failure_does_not_overwrite_an_insight(processed_elsewhere):
+    assert processed_elsewhere.mark_ai_processing_failed('timed out') is False
+    # The loser sees the winner's state instead of its own write
+    assert processed_elsewhere.ai_processed and processed_elsewhere.ai_insight == 'the winning insight'
+
+    stored = MoodEntry.objects.get(id=processed_elsewhere.id)
+    assert stored.ai_processed and not stored.ai_processing_failed and stored.ai_error_message is None
+
+
+def test_late_retry_does_not_requeue_a_processed_entry(processed_elsewhere):
+    assert processed_elsewhere.schedule_ai_retry('rate limited', timedelta(minutes=1)) is False
+
+    stored = MoodEntry.objects.get(id=processed_elsewhere.id)
+    assert stored.ai_processed and stored.ai_next_attempt_at is None and stored.ai_attempts == 0
+    assert stored.ai_priority == MoodEntry.PRIORITY_NEW
+
+
+@pytest.mark.parametrize('error', [TimeoutError('slow'), ValueError('bad data')])
+def test_late_failure_is_reported_as_done(processed_elsewhere, error):
+    assert record_insight_failure(processed_elsewhere, error) == 'done'
+    assert not InsightDeadLetter.objects(id=processed_elsewhere.id).count()
+
+
+def test_second_completion_keeps_the_first_insight(user):
+    entry = new_entry(user)
+    stale = MoodEntry.objects.get(id=entry.id)
+    assert entry.mark_ai_processing_complete('first', source='llm')
+    assert stale.mark_ai_processing_complete('second', source='cache') is False
+    assert MoodEntry.objects.get(id=entry.id).ai_insight == 'first'
+
+
+SHARES = {0: 0.5, 1: 0.3, 2: 0.1, 3: 0.1}
+PROMOTE_AFTER = timedelta(minutes=10)
+
+
+@pytest.fixture
+def lanes(user):
+    """Twenty queued entries per lane, plus a backfill entry waiting long enough to be promoted"""
+    now = datetime.utcnow()
+    for lane in MoodEntry.PRIORITY_NAMES:
+        for index in range(20):
+            new_entry(user, ai_priority=lane, ai_queued_at=now - timedelta(seconds=index))
+    return new_entry(user, ai_priority=MoodEntry.PRIORITY_BACKFILL, ai_queued_at=now - PROMOTE_AFTER * 4)
+
+
+def test_batch_gives_every_lane_its_share(lanes):
+    batch = MoodEntry.get_unprocessed_entries(limit=10, shares=SHARES, promote_after=PROMOTE_AFTER)
+    assert len(batch) == 10
+    # The aged backfill entry is promoted into the interactive lane and goes first
+    assert batch[0].id == lanes.id
+
+    lane_counts = {lane: sum(1 for entry in batch if entry.ai_priority == lane) for lane in MoodEntry.PRIORITY_NAMES}
+    assert lane_counts == {0: 4, 1: 3, 2: 1, 3: 2}
+
+
+def test_no_lane_starves_while_urgent_lanes_are_busy(lanes):
+    seen = set()
+    for _ in range(3):
+        batch = MoodEntry.get_unprocessed_entries(limit=10, shares=SHARES, promote_after=PROMOTE_AFTER)
+        seen.update(entry.ai_priority for entry in batch)
+        # Keep the interactive lane full, as a busy web tier would
+        for entry in batch:
+            entry.mark_ai_processing_complete('done')
+            new_entry(entry.user, ai_priority=MoodEntry.PRIORITY_INTERACTIVE)
+    assert seen == set(MoodEntry.PRIORITY_NAMES)
+
+
+def test_without_shares_the_most_urgent_lane_goes_first(lanes):
+    batch = MoodEntry.get_unprocessed_entries(limit=10)
+    assert {entry.ai_priority for entry in batch} == {MoodEntry.PRIORITY_INTERACTIVE}
+
+
+def test_lane_query_is_indexed():
+    fields = [[key for key, _ in spec['fields']] for spec in MoodEntry._meta['index_specs']]
+    assert ['ai_processed', 'ai_processing_failed', 'ai_priority', 'ai_queued_at'] in fields
@@ -0,0 +1,26 @@
+import openai
+import pytest
+from benchmarks.openai_stub import OpenAIStub
+
+
+def complete(stub):
+    client = openai.OpenAI(base_url=stub.base_url, api_key='stub', max_retries=0)
+    return client.chat.completions.create(model='gpt-3.5-turbo', max_tokens=20,
+                                          messages=[{'role': 'user', 'content': 'I feel tired today'}])
+
+
+def test_stub_answers_like_openai():
+    with OpenAIStub(latency=0, jitter=0) as stub:
+        response = complete(stub)
+    assert response.choices[0].message.content
+    assert response.usage.total_tokens == response.usage.prompt_tokens + response.usage.completion_tokens
+    assert stub.stats['completions'] == 1
+
+
+def test_stub_injects_rate_limits_and_errors():
+    with OpenAIStub(latency=0, jitter=0, rate_limit_rate=1.0) as stub:
+        with pytest.raises(openai.RateLimitError):
+            complete(stub)
+    with OpenAIStub(latency=0, jitter=0, error_rate=1.0) as stub:
+        with pytest.raises(openai.InternalServerError):
+            complete(stub)
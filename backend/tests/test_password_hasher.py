@@ -0,0 +1,56 @@
+import threading
+import pytest
+from utils.password_hasher import PasswordHasher, HashingBusyError
+
+
+def test_hash_and_verify_inline():
+    hasher = PasswordHasher(method='pbkdf2:sha256:1000', workers=0)
+    password_hash = hasher.hash('Secret123!')
+    assert password_hash.startswith('pbkdf2:sha256:1000$')
+    assert hasher.verify(password_hash, 'Secret123!')
+    assert not hasher.verify(password_hash, 'wrong')
+
+
+def test_hash_on_process_pool():
+    hasher = PasswordHasher(method='pbkdf2:sha256:1000', workers=1)
+    assert hasher.verify(hasher.hash('Secret123!'), 'Secret123!')
+
+
+def test_needs_rehash_when_parameters_change():
+    old = PasswordHasher(method='pbkdf2:sha256:1000', workers=0)
+    new = PasswordHasher(method='pbkdf2', workers=0)
+    password_hash = old.hash('Secret123!')
+    assert not old.needs_rehash(password_hash)
+    assert new.needs_rehash(password_hash)
+
+
+def test_rejects_when_saturated(monkeypatch):
+    hasher = PasswordHasher(method='pbkdf2:sha256:1000', workers=0, max_pending=1, queue_timeout=0.01)
+    release = threading.Event()
+    started = threading.Event()
+
+    def slow(*args):
+        started.set()
+        release.wait(5)
+        return 'hash'
+
+    monkeypatch.setattr('utils.password_hasher.generate_password_hash', slow)
+    worker = threading.Thread(target=hasher.hash, args=('Secret123!',))
+    worker.start()
+    started.wait(5)
+    with pytest.raises(HashingBusyError):
+        hasher.verify('hash', 'Secret123!')
+    release.set()
+    worker.join()
+    assert hasher.get_stats()['rejected'] == 1
+
+
+def test_timed_out_task_keeps_its_slot():
+    hasher = PasswordHasher(method='pbkdf2:sha256:2000000', workers=1, max_pending=1, queue_timeout=0.01, task_timeout=0.05)
+    with pytest.raises(HashingBusyError):
+        hasher.hash('Secret123!')
+    # The abandoned hash is still running in the pool, so there is no room for another
+    with pytest.raises(HashingBusyError):
+        hasher.hash('Secret123!')
+    assert hasher.get_stats()['rejected'] == 1
+    hasher.executor.shutdown(wait=True)
@@ -0,0 +1,32 @@
+import time
+from utils.profiler import SamplingProfiler, ProfileStore, make_profile_token, verify_profile_token
+
+
+def test_profile_token_is_bound_to_request_and_expires():
+    token = make_profile_token('secret', 'get', '/api/entries/stats')
+    assert verify_profile_token('secret', token, 'GET', '/api/entries/stats')
+    assert not verify_profile_token('secret', token, 'GET', '/api/entries/')
+    assert not verify_profile_token('other', token, 'GET', '/api/entries/stats')
+    assert not verify_profile_token('secret', make_profile_token('secret', 'GET', '/', ttl_seconds=-1), 'GET', '/')
+    assert not verify_profile_token('secret', 'garbage', 'GET', '/')
+
+
+def busy(seconds):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        sum(range(100))
+
+
+def test_profiles_are_folded_and_pruned(tmp_path):
+    store = ProfileStore(str(tmp_path), max_files=2)
+    for _ in range(3):
+        profiler = SamplingProfiler(interval=0.001).start()
+        busy(0.03)
+        store.write('request', 'GET /api/entries/<entry_id>', profiler.stop())
+
+    files = sorted(tmp_path.iterdir())
+    assert len(files) == 2
+    assert files[0].name.endswith('.folded') and '-request-GET_api_entries_entry_id-' in files[0].name
+    lines = files[-1].read_text().splitlines()
+    assert any('busy (test_profiler.py' in line for line in lines)
+    assert all(line.rsplit(' ', 1)[1].isdigit() for line in lines)
@@ -0,0 +1,46 @@
+from datetime import timedelta
+import pytest
+from pymongo import monitoring
+from utils.query_guard import QueryListener, plan_stages
+
+
+def send(listener, request_id, command, duration=timedelta(milliseconds=1.5)):
+    name = next(iter(command))
+    listener.started(monitoring.CommandStartedEvent(command, 'journal', request_id, ('localhost', 27017), request_id))
+    listener.succeeded(monitoring.CommandSucceededEvent(duration, {'ok': 1}, name, request_id, ('localhost', 27017), request_id))
+
+
+def test_records_queries_of_active_trace_only():
+    listener = QueryListener()
+    send(listener, 1, {'find': 'mood_entries', 'filter': {}})
+    trace = listener.start_trace()
+    send(listener, 2, {'hello': 1})
+    send(listener, 3, {'find': 'mood_entries', 'filter': {'user': 'u1'}})
+    send(listener, 4, {'getMore': 42, 'collection': 'mood_entries'})
+    listener.end_trace(trace)
+    send(listener, 5, {'find': 'users', 'filter': {}})
+
+    assert [(q.command_name, q.collection) for q in trace.queries] == [('find', 'mood_entries'), ('getMore', 'mood_entries')]
+    assert trace.queries[0].command == {'find': 'mood_entries', 'filter': {'user': 'u1'}}
+    assert trace.total_ms == 3.0
+    trace.assert_max_queries(2)
+    with pytest.raises(AssertionError):
+        trace.assert_max_queries(1)
+
+
+def test_detects_collection_scan_in_winning_plan():
+    find_plan = {'queryPlanner': {'winningPlan': {'stage': 'FETCH', 'inputStage': {'stage': 'IXSCAN'}},
+                                  'rejectedPlans': [{'stage': 'COLLSCAN'}]}}
+    aggregate_plan = {'stages': [{'$cursor': {'queryPlanner': {'winningPlan': {'stage': 'COLLSCAN'}}}}]}
+    assert plan_stages(find_plan) == ['FETCH', 'IXSCAN']
+    assert 'COLLSCAN' in plan_stages(aggregate_plan)
+
+
+def test_assert_no_collscan():
+    listener = QueryListener()
+    trace = listener.start_trace()
+    send(listener, 1, {'find': 'mood_entries', 'filter': {'audio_file.filename': 'a.mp3'}})
+    listener.end_trace(trace)
+    trace._plans = [(trace.queries[0], ['COLLSCAN'])]
+    with pytest.raises(AssertionError, match='find on mood_entries'):
+        trace.assert_no_collscan()
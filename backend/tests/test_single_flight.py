@@ -0,0 +1,170 @@
+import threading
+import time
+from datetime import datetime, timedelta
+import pytest
+from flask_jwt_extended import create_access_token
+
+import routes.insights
+from app import create_app
+from models.mood_model import Mood, MoodEntry
+from models.user_model import User
+from utils.ai_service import AIServiceError
+from utils.single_flight import InsightSingleFlight
+
+
+@pytest.fixture
+def app(mongo, monkeypatch):
+    app = create_app('testing')
+    app.config['JWT_SECRET_KEY'] = 'test-secret'
+    monkeypatch.setattr('utils.single_flight._single_flight', InsightSingleFlight(wait_timeout=5.0, poll_interval=0.05))
+    with app.app_context():
+        yield app
+
+
+@pytest.fixture
+def entry(app):
+    user = User(email='flight@example.com', password_hash='x', first_name='S', last_name='F').save()
+    return MoodEntry(user=user, mood=Mood(emoji='😊', emotion='happy'), text_note='a long enough day to reflect on',
+                     entry_date=datetime.now()).save()
+
+
+def fetch(entry):
+    return MoodEntry.objects.get(id=entry.id)
+
+
+def run_concurrently(app, target, count=5):
+    results, errors = [], []
+
+    def call():
+        with app.app_context():
+            try:
+                results.append(target())
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+def test_concurrent_runs_share_one_generation(app, entry):
+    flight = InsightSingleFlight()
+    calls = []
+
+    def generate():
+        calls.append(1)
+        time.sleep(0.2)
+        fetch(entry).mark_ai_processing_complete('insight')
+
+    results, errors = run_concurrently(app, lambda: flight.run(fetch(entry), generate))
+    assert len(calls) == 1 and not errors
+    assert sorted(results) == [False] * 4 + [True]
+    assert flight.get_stats()['coalesced_local'] == 4
+
+
+def test_followers_do_not_see_the_leaders_error(app, entry):
+    flight = InsightSingleFlight()
+
+    def generate():
+        time.sleep(0.2)
+        raise AIServiceError('provider failed')
+
+    results, errors = run_concurrently(app, lambda: flight.run(fetch(entry), generate))
+    assert len(errors) == 1 and results == [False] * 4
+
+
+def test_lease_held_by_another_process_is_waited_for(app, entry):
+    flight = InsightSingleFlight(wait_timeout=5.0, poll_interval=0.05)
+    assert fetch(entry).acquire_ai_lease('other-process', timedelta(seconds=60))
+    threading.Timer(0.2, lambda: fetch(entry).mark_ai_processing_complete('from elsewhere')).start()
+
+    started = time.monotonic()
+    assert flight.run(fetch(entry), lambda: pytest.fail('generated under a foreign lease')) is False
+    assert time.monotonic() - started < 2
+    assert flight.get_stats()['coalesced_remote'] == 1
+
+
+def test_expired_lease_is_taken_over(app, entry):
+    flight = InsightSingleFlight()
+    assert fetch(entry).acquire_ai_lease('crashed-process', timedelta(seconds=-1))
+    calls = []
+    assert flight.run(fetch(entry), lambda: calls.append(1)) is True
+    assert calls and fetch(entry).ai_lease_owner is None
+
+
+class FakeAI:
+    """Stands in for MoodInsightAI, counting provider calls"""
+    calls = []
+    error = None
+    last_source = 'llm'
+    breaker = None
+
+    def is_available(self):
+        return True
+
+    def is_degraded(self):
+        return False
+
+    def generate_insight(self, **kwargs):
+        FakeAI.calls.append(kwargs)
+        time.sleep(0.2)
+        if FakeAI.error:
+            raise FakeAI.error
+        return 'a generated insight'
+
+
+@pytest.fixture
+def fake_ai(monkeypatch):
+    monkeypatch.setattr('routes.insights.MoodInsightAI', FakeAI)
+    monkeypatch.setattr(FakeAI, 'calls', [])
+    return FakeAI
+
+
+def get_insight(app, entry):
+    token = create_access_token(identity=entry.user.id)
+    response = app.test_client().get(f'/api/insights/entry/{entry.id}', headers={'Authorization': f'Bearer {token}'})
+    return response.status_code, response.get_json()
+
+
+def test_concurrent_insight_requests_make_one_provider_call(app, entry, fake_ai):
+    results, errors = run_concurrently(app, lambda: get_insight(app, entry))
+    assert len(fake_ai.calls) == 1 and not errors
+    assert {status for status, _ in results} == {200}
+    assert {body['insight'] for _, body in results} == {'a generated insight'}
+
+
+def test_leader_failure_is_recorded_once(app, entry, fake_ai, monkeypatch):
+    error = AIServiceError('provider timed out')
+    error.__cause__ = TimeoutError()  # transient, so the entry is rescheduled rather than dead-lettered
+    monkeypatch.setattr(fake_ai, 'error', error)
+    recorded = []
+    record_insight_failure = routes.insights.record_insight_failure
+    monkeypatch.setattr('routes.insights.record_insight_failure', lambda *args: recorded.append(1) or record_insight_failure(*args))
+
+    results, errors = run_concurrently(app, lambda: get_insight(app, entry))
+    assert len(fake_ai.calls) == 1 and not errors
+    assert {status for status, _ in results} == {202}
+    assert len(recorded) == 1 and fetch(entry).ai_attempts == 1
+
+
+def test_generation_in_another_process_returns_pending(app, entry, fake_ai, monkeypatch):
+    assert fetch(entry).acquire_ai_lease('other-process', timedelta(seconds=60))
+    monkeypatch.setattr('utils.single_flight._single_flight.wait_timeout', 0.1)
+
+    status, body = get_insight(app, entry)
+    assert status == 202 and body['pending']
+    assert not fake_ai.calls
+
+
+def test_failure_after_another_worker_finished_returns_its_insight(app, entry, fake_ai, monkeypatch):
+    def finish_elsewhere_then_fail(**kwargs):
+        fetch(entry).mark_ai_processing_complete('from the worker')
+        raise AIServiceError('bad request')
+
+    monkeypatch.setattr(fake_ai, 'generate_insight', lambda self, **kwargs: finish_elsewhere_then_fail(**kwargs))
+    status, body = get_insight(app, entry)
+    assert status == 200 and body['insight'] == 'from the worker'
+    assert fetch(entry).ai_processed and not fetch(entry).ai_processing_failed
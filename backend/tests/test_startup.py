@@ -0,0 +1,42 @@
+import os
+import subprocess
+import sys
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Regression budget for `import app`, in ms; wall-clock, so only checked where STARTUP_IMPORT_BUDGET_MS is set
+IMPORT_BUDGET_MS = os.environ.get('STARTUP_IMPORT_BUDGET_MS')
+
+# Only needed once the matching feature is used, never at worker boot
+LAZY_MODULES = {'openai', 'httpx', 'magic', 'pydub', 'llama_cpp', 'faster_whisper', 'boto3', '_pytest'}
+
+
+def import_times(module):
+    """Run `python -X importtime -c "import module"` and return {module: cumulative microseconds}"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=BACKEND_DIR, capture_output=True, text=True, timeout=60,
+        env={**os.environ, 'CORS_ORIGINS': os.environ.get('CORS_ORIGINS', '*')},
+    )
+    assert result.returncode == 0, result.stderr
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_heavy_dependencies_are_not_imported_at_startup():
+    loaded = {name.split('.')[0] for name in import_times('app')}
+    assert not loaded & LAZY_MODULES
+
+
+@pytest.mark.skipif(not IMPORT_BUDGET_MS, reason='set STARTUP_IMPORT_BUDGET_MS to check the import time budget')
+def test_app_import_time_within_budget():
+    budget = float(IMPORT_BUDGET_MS)
+    # Best of three, so one slow run on a busy machine doesn't fail the suite
+    best = min(import_times('app')['app'] for _ in range(3)) / 1000
+    assert best <= budget, f"import app took {best:.0f} ms (budget {budget:.0f} ms)"
@@ -0,0 +1,92 @@
+import pytest
+from flask import Flask
+from werkzeug.datastructures import Range
+from utils.storage import LocalStorage, S3Storage, StorageBackend, StorageError, stream_response
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config['UPLOAD_FOLDER'] = str(tmp_path)
+    return app
+
+
+@pytest.fixture(params=['local', 's3'])
+def storage(request, tmp_path):
+    if request.param == 'local':
+        yield LocalStorage(str(tmp_path / 'audio'))
+        return
+
+    moto = pytest.importorskip('moto')
+    boto3 = pytest.importorskip('boto3')
+    with moto.mock_aws():
+        client = boto3.client('s3', region_name='us-east-1')
+        client.create_bucket(Bucket='audio-test')
+        yield S3Storage('audio-test', prefix='audio/', client=client)
+
+
+def _put(storage, tmp_path, key, data):
+    source = tmp_path / 'source.bin'
+    source.write_bytes(data)
+    storage.put_file(key, str(source), content_type='audio/wav')
+    assert not source.exists()
+
+
+def test_put_get_delete(app, storage, tmp_path):
+    _put(storage, tmp_path, 'ab/cd/abcd', b'0123456789')
+
+    assert storage.exists('ab/cd/abcd')
+    assert storage.size('ab/cd/abcd') == 10
+    assert storage.get_range('ab/cd/abcd', 2, 5) == b'234'
+    with storage.open('ab/cd/abcd') as body:
+        assert body.read() == b'0123456789'
+    with app.app_context(), storage.local_copy('ab/cd/abcd') as path:
+        assert open(path, 'rb').read() == b'0123456789'
+
+    assert storage.delete('ab/cd/abcd')
+    assert not storage.exists('ab/cd/abcd')
+    assert not storage.delete('ab/cd/abcd')
+
+
+def test_iter_keys_by_prefix(storage, tmp_path):
+    for key in ['ab/cd/abcd', 'ab/cd/abcd.compact.ogg', 'ab/ef/abef']:
+        _put(storage, tmp_path, key, b'x')
+
+    assert sorted(storage.iter_keys('ab/cd/abcd.')) == ['ab/cd/abcd.compact.ogg']
+    assert sorted(storage.iter_keys()) == ['ab/cd/abcd', 'ab/cd/abcd.compact.ogg', 'ab/ef/abef']
+
+
+def test_presigned_url(storage, tmp_path):
+    _put(storage, tmp_path, 'ab/cd/abcd', b'x')
+    url = storage.presigned_url('ab/cd/abcd', expires_in=60, content_type='audio/ogg')
+    if storage.supports_presigned_urls:
+        assert 'audio/ab/cd/abcd' in url
+    else:
+        assert url is None
+
+
+def test_stream_response_range(app, storage, tmp_path):
+    _put(storage, tmp_path, 'clip', b'0123456789')
+    with app.test_request_context():
+        response = stream_response(storage, 'clip', 'audio/ogg', Range('bytes', [(4, 8)]))
+        assert response.status_code == 206
+        assert response.get_data() == b'4567'
+        assert response.headers['Content-Range'] == 'bytes 4-7/10'
+
+        response = stream_response(storage, 'clip', 'audio/ogg')
+        assert response.get_data() == b'0123456789'
+
+
+def test_local_storage_rejects_escaping_keys(tmp_path):
+    storage = LocalStorage(str(tmp_path / 'audio'))
+    with pytest.raises(StorageError):
+        storage.exists('../secret')
+
+
+def test_incomplete_backend_cannot_be_created():
+    class WriteOnlyStorage(StorageBackend):
+        def put_file(self, key, source_path, content_type=None):
+            pass
+
+    with pytest.raises(TypeError):
+        WriteOnlyStorage()
@@ -0,0 +1,87 @@
+import io
+from datetime import datetime, timedelta
+import pytest
+from flask_jwt_extended import create_access_token
+
+from app import create_app
+from models.audio_model import AudioFile
+from models.mood_model import Mood, MoodEntry
+from models.user_model import User
+from utils.transcription import TranscriptionService, fail_stale_transcriptions
+
+WAIT = timedelta(minutes=10)
+
+
+@pytest.fixture
+def app(mongo, tmp_path):
+    app = create_app('testing')
+    app.config.update({
+        'JWT_SECRET_KEY': 'test-secret',
+        'UPLOAD_FOLDER': str(tmp_path),
+        'AUDIO_TRANSCODE_ENABLED': False,
+        'TRANSCRIPTION_ENABLED': True,
+        'TRANSCRIPTION_WAIT_TIMEOUT': WAIT,
+    })
+    with app.app_context():
+        yield app
+
+
+@pytest.fixture
+def user(app):
+    return User(email='voice@example.com', password_hash='x', first_name='V', last_name='N').save()
+
+
+def voice_entry(user, uploaded_ago=timedelta(0), status='pending'):
+    audio = AudioFile(filename=f'{datetime.utcnow().timestamp()}.wav', transcript_status=status,
+                      uploaded_timestamp=datetime.utcnow() - uploaded_ago)
+    return MoodEntry(user=user, mood=Mood(emoji='😐', emotion='neutral'), entry_date=datetime.now(), audio_file=audio).save()
+
+
+def test_upload_only_marks_the_transcript_pending(app, user, monkeypatch):
+    monkeypatch.setattr(TranscriptionService, 'queue', lambda *args: pytest.fail('transcribed in the web tier'))
+    entry = MoodEntry(user=user, mood=Mood(emoji='😐', emotion='neutral'), entry_date=datetime.now()).save()
+    response = app.test_client().post(
+        '/api/audio/upload', content_type='multipart/form-data',
+        headers={'Authorization': f'Bearer {create_access_token(identity=user.id)}'},
+        data={'entry_id': entry.id, 'audio': (io.BytesIO(b'RIFF' + bytes(64)), 'note.wav', 'audio/wav')},
+    )
+    assert response.status_code == 201
+    assert MoodEntry.objects.get(id=entry.id).audio_file.transcript_status == 'pending'
+
+
+def test_each_pending_note_is_claimed_by_one_worker(app, user, monkeypatch):
+    fresh = [voice_entry(user) for _ in range(3)]
+    voice_entry(user, uploaded_ago=WAIT * 2)  # left for fail_stale_transcriptions
+    voice_entry(user, status='done')
+
+    queued = []
+    monkeypatch.setattr(TranscriptionService, 'queue', lambda self, entry_id, audio_file: queued.append(entry_id))
+    workers = [TranscriptionService(app, max_workers=1) for _ in range(2)]
+
+    assert workers[0].queue_pending(WAIT) == 2  # two in flight per pool worker
+    assert workers[1].queue_pending(WAIT) == 1
+    assert workers[0].queue_pending(WAIT) == 0
+    assert sorted(queued) == sorted(entry.id for entry in fresh)
+
+
+def test_stale_pending_transcripts_fail(app, user):
+    stale = voice_entry(user, uploaded_ago=WAIT * 2)
+    recent = voice_entry(user)
+
+    assert fail_stale_transcriptions(WAIT) == 1
+    assert MoodEntry.objects.get(id=stale.id).audio_file.transcript_status == 'failed'
+    assert MoodEntry.objects.get(id=recent.id).audio_file.transcript_status == 'pending'
+
+
+def test_insights_wait_for_recent_transcripts_only(app, user):
+    recent = voice_entry(user)
+    overdue = voice_entry(user, uploaded_ago=WAIT * 2)
+
+    assert recent.is_waiting_for_transcript(WAIT)
+    assert not overdue.is_waiting_for_transcript(WAIT)
+    assert [entry.id for entry in MoodEntry.get_unprocessed_entries(transcript_wait=WAIT)] == [overdue.id]
+
+    response = app.test_client().get(f'/api/insights/entry/{recent.id}',
+                                     headers={'Authorization': f'Bearer {create_access_token(identity=user.id)}'})
+    assert response.status_code == 202
+    assert response.get_json()['message'] == 'Voice note is still being transcribed'
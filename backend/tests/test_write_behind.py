@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+import pytest
+
+from models.user_model import User
+from utils.write_behind import WriteBehindBuffer
+
+
+@pytest.fixture
+def users(mongo):
+    return [User(email=f'user{index}@example.com', password_hash='x', first_name='W', last_name='B').save() for index in range(2)]
+
+
+@pytest.fixture
+def buffer():
+    buffer = WriteBehindBuffer(flush_interval=3600)
+    yield buffer
+    buffer.stop()
+
+
+def last_login(user):
+    return User.objects.get(id=user.id).last_login
+
+
+def test_updates_are_coalesced_per_document(users, buffer):
+    first, second = users
+    later = datetime(2024, 5, 2, 9, 30)
+    buffer.set(User, first.id, last_login=datetime(2024, 5, 1))
+    buffer.set(User, first.id, last_login=later)
+    buffer.set(User, second.id, last_login=later)
+
+    assert last_login(first) is None
+    assert buffer.flush() == 2
+    assert last_login(first) == later and last_login(second) == later
+    assert buffer.flush() == 0
+
+
+def test_stop_flushes_pending_updates(users, buffer):
+    login = datetime(2024, 5, 1, 8, 0)
+    buffer.set(User, users[0].id, last_login=login)
+    buffer.stop()
+    assert last_login(users[0]) == login
+
+
+def test_failed_flush_keeps_newer_values(users, buffer, monkeypatch):
+    user = users[0]
+    login = datetime(2024, 5, 1, 8, 0)
+    buffer.set(User, user.id, last_login=login)
+
+    collection = User._get_collection()
+
+    class Unavailable:
+        def bulk_write(self, operations, ordered=True):
+            # A login arrives while the failing write is in flight
+            buffer.set(User, user.id, last_login=login + timedelta(hours=1))
+            raise ConnectionError('primary unavailable')
+
+    monkeypatch.setattr(User, '_get_collection', classmethod(lambda cls: Unavailable()))
+    assert buffer.flush() == 0 and buffer.stats['errors'] == 1
+
+    monkeypatch.setattr(User, '_get_collection', classmethod(lambda cls: collection))
+    assert buffer.flush() == 1
+    assert last_login(user) == login + timedelta(hours=1)
@@ -1,34 +1,139 @@
-import openai
+import sys
+import threading
+import time
 from flask import current_app
 from datetime import datetime
 import json
 
+from utils.circuit_breaker import CircuitOpenError, get_ai_breaker
+from utils.llm_providers import ProviderError, get_local_provider, get_openai_provider
+from utils.metrics import observe_ai_completion, record_ai_time
+from utils.token_budget import get_token_budget
+
+# Longest reflection/transcript excerpt sent per prompt detail level (None = no limit)
+DETAIL_LIMITS = {'full': None, 'brief': 280, 'minimal': 100}
+
 class AIServiceError(Exception):
     pass
 
+class AIBudgetExceededError(AIServiceError):
+    """Raised when today's token budget is spent and there is no local model"""
+    pass
+
+class AIServiceDegradedError(AIServiceError):
+    """Raised without calling OpenAI while the circuit breaker is open and no local model is set up"""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _is_rate_limit(error):
+    # openai is imported lazily; if it isn't loaded yet the error cannot be one of its own
+    openai = sys.modules.get('openai')
+    return openai is not None and isinstance(error, openai.RateLimitError)
+
+
 class MoodInsightAI:
 
     def __init__(self):
-        self.client = None
-        api_key = current_app.config['OPENAI_API_KEY']
-        if api_key:
-            self.client = openai.OpenAI(api_key=api_key)
+        self.breaker = get_ai_breaker()
+        self.budget = get_token_budget()
+        self.openai = get_openai_provider()
+        self.client = self.openai.client
+        self.routing = current_app.config.get('LOCAL_MODEL_ROUTING', 'fallback')
+        self.local = get_local_provider() if self.routing != 'off' else None
+        if self.local and not self.local.is_available():
+            current_app.logger.warning("local model is configured but llama-cpp-python or the model file is missing")
+            self.local = None
+        self._local_state = threading.local()  # last completion per thread; workers share one instance
 
-        else:
+        if not self.client:
             current_app.logger.warning("open api key is not set")
 
     
     def is_available(self):
-        return self.client is not None
+        return self.client is not None or self.local is not None
+
+    def is_degraded(self):
+        """True while OpenAI calls are short-circuited and there is no local model to fall back to"""
+        return self.local is None and self.breaker.is_open()
+
+    @property
+    def last_completion(self):
+        return getattr(self._local_state, 'completion', None)
 
-    def generate_insight(self, mood_emotion, mood_emoji=None, text_note=None, audio_transcript=None, user_context=None):
+    @property
+    def last_source(self):
+        """Insight source of the last completion: 'local' or 'llm'"""
+        return 'local' if self.last_completion and self.last_completion.provider == 'local' else 'llm'
+
+    def is_simple_entry(self, text_note=None, audio_transcript=None):
+        """Short entries the local model handles as well as OpenAI"""
+        words = len(f"{text_note or ''} {audio_transcript or ''}".split())
+        return words <= current_app.config.get('LOCAL_MODEL_SIMPLE_MAX_WORDS', 40)
+
+    def _complete(self, messages, max_tokens, temperature=0.7, simple=False, user_id=None, local_only=False):
+        """
+        Run a chat completion on OpenAI (through the circuit breaker) or the local model.
+        Routing: 'off' never uses the local model, 'fallback' uses it when OpenAI is
+        unavailable or failing, 'simple' also sends simple entries to it, 'always' uses it only.
+        local_only is set once the token budget is spent. Usage is recorded in the ledger.
+        """
+        started = time.monotonic()
+        try:
+            return self._route(messages, max_tokens, temperature, simple, user_id, local_only)
+        finally:
+            record_ai_time(time.monotonic() - started)
+
+    def _route(self, messages, max_tokens, temperature, simple, user_id, local_only):
+        if self.local and (local_only or self.routing == 'always' or (self.routing == 'simple' and simple)):
+            return self._complete_local(messages, max_tokens, temperature, user_id)
+        if local_only:
+            raise AIBudgetExceededError("Daily AI token budget is used up, try again tomorrow")
+        if self.client is None:
+            if self.local:
+                return self._complete_local(messages, max_tokens, temperature, user_id)
+            raise AIServiceError("OpenAI client is not available")
+
+        try:
+            completion = self.breaker.call(self.openai.complete, messages, max_tokens, temperature)
+        except CircuitOpenError as e:
+            if self.local:
+                return self._complete_local(messages, max_tokens, temperature, user_id)
+            raise AIServiceDegradedError(str(e), retry_after=e.retry_after)
+        except Exception as e:
+            if self.local:
+                current_app.logger.warning(f"OpenAI call failed, using local model: {e}")
+                return self._complete_local(messages, max_tokens, temperature, user_id)
+            raise
+        return self._record(completion, user_id)
+
+    def _complete_local(self, messages, max_tokens, temperature, user_id=None):
+        try:
+            completion = self.local.complete(messages, max_tokens, temperature)
+        except ProviderError as e:
+            raise AIServiceError(str(e)) from e
+        return self._record(completion, user_id)
+
+    def _record(self, completion, user_id):
+        self._local_state.completion = completion
+        observe_ai_completion(completion)
+        try:
+            self.budget.record(user_id, completion)
+        except Exception as e:
+            current_app.logger.error(f"Failed to record token usage: {e}")
+        return completion
+
+    def generate_insight(self, mood_emotion, mood_emoji=None, text_note=None, audio_transcript=None, user_context=None, user_id=None):
         if not self.is_available():
             raise AIServiceError("OpenAI client is not available")
 
         try:
-            prompt = self.build_prompt(mood_emotion, mood_emoji, text_note, audio_transcript, user_context)
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
+            # Shrink the request as the user's or the global daily budget runs low
+            plan = self.budget.plan(user_id, 200)
+            prompt = self.build_prompt(mood_emotion, mood_emoji, text_note, audio_transcript, user_context, detail=plan.detail)
+            completion = self._complete(
                 messages=[
                     {"role": "system", "content": self._get_system_prompt()},
                     {
@@ -36,19 +141,23 @@ class MoodInsightAI:
                         'content' : prompt
                     }
                     ],
-                max_tokens=200,
+                max_tokens=plan.max_tokens,
                 temperature=0.7,
+                simple=self.is_simple_entry(text_note, audio_transcript),
+                user_id=user_id,
+                local_only=plan.exhausted,
             )
 
-            insight = response.choices[0].message.content.strip()
-            current_app.logger.info(f"AI insight generated successfully, length: {len(insight)} chars")
+            insight = completion.text
+            current_app.logger.info(f"AI insight generated successfully by {completion.provider}, length: {len(insight)} chars")
             return insight
-        except openai.RateLimitError as e:
-            error_msg = f"Rate limit exceeded. Please try again later. {e}"
-            current_app.logger.warning(f"OpenAI rate limit: {e}")
-            raise AIServiceError(error_msg)
+        except AIServiceError:
+            raise
         except Exception as e:
-            raise AIServiceError(f"Error generating insight: {e}")
+            if _is_rate_limit(e):
+                current_app.logger.warning(f"OpenAI rate limit: {e}")
+                raise AIServiceError(f"Rate limit exceeded. Please try again later. {e}") from e
+            raise AIServiceError(f"Error generating insight: {e}") from e
 
     def _get_system_prompt(self):
        return """You are a compassionate AI assistant specializing in emotional well-being and mental health support. Your role is to provide gentle, supportive insights about mood patterns and emotional experiences.
@@ -65,7 +174,7 @@ Guidelines:
 
 Remember: You're providing supportive insights, not therapy or medical advice.""" 
 
-    def _build_insight_prompt(self, mood_emotion, mood_emoji=None, text_note=None, audio_transcript=None, user_context=None):
+    def _build_insight_prompt(self, mood_emotion, mood_emoji=None, text_note=None, audio_transcript=None, user_context=None, detail='full'):
         mood_descriptions = {
             "happy": "Feeling joyful and positive",
             "sad": "Experiencing sadness or melancholy", 
@@ -85,17 +194,17 @@ Remember: You're providing supportive insights, not therapy or medical advice.""
         # Add text reflection if provided
         if text_note and text_note.strip():
             prompt_parts.extend([
-                f"Reflection: {text_note.strip()}"
+                f"Reflection: {text_note.strip()[:DETAIL_LIMITS[detail]]}"
             ])
         
         # Add audio transcript if provided
         if audio_transcript and audio_transcript.strip():
             prompt_parts.extend([
-                f"Voice Note: {audio_transcript.strip()}"
+                f"Voice Note: {audio_transcript.strip()[:DETAIL_LIMITS[detail]]}"
             ])
         
         # Add user context if provided (for future personalization)
-        if user_context:
+        if user_context and detail == 'full':
             prompt_parts.extend([
                 f"Context: {user_context}"
             ])
@@ -108,11 +217,11 @@ Remember: You're providing supportive insights, not therapy or medical advice.""
         
         return "\n".join(prompt_parts)
     
-    def build_prompt(self, mood_emotion, mood_emoji=None, text_note=None, audio_transcript=None, user_context=None):
+    def build_prompt(self, mood_emotion, mood_emoji=None, text_note=None, audio_transcript=None, user_context=None, detail='full'):
         """Main method that delegates to _build_insight_prompt for backwards compatibility"""
-        return self._build_insight_prompt(mood_emotion, mood_emoji, text_note, audio_transcript, user_context)
+        return self._build_insight_prompt(mood_emotion, mood_emoji, text_note, audio_transcript, user_context, detail)
 
-    def generate_weekly_summary(self, entries):
+    def generate_weekly_summary(self, entries, user_id=None):
         
         if not self.is_available():
             raise AIServiceError('AI service not configured')
@@ -121,21 +230,23 @@ Remember: You're providing supportive insights, not therapy or medical advice.""
             return "No mood entries this week to analyze."
 
         try:
+            plan = self.budget.plan(user_id, 300)
+            note_limit = {'full': 100, 'brief': 40, 'minimal': 0}[plan.detail]
+
             # Prepare data for weekly analysis
             mood_data = []
             for entry in entries:
                 entry_data = {
                     'date': entry.entry_date.strftime('%A, %B %d'),
                     'mood': f"{entry.mood.emotion} {entry.mood.emoji}" if entry.mood else "neutral 😐",
-                    'note': entry.text_note[:100] if entry.text_note else None  # Truncate for API limits
+                    'note': entry.text_note[:note_limit] if entry.text_note and note_limit else None  # Truncate for API limits
                 }
                 mood_data.append(entry_data)
             
             # Build weekly prompt
             prompt = self._build_weekly_prompt(mood_data)
             
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
+            completion = self._complete(
                 messages=[
                     {
                         "role": "system",
@@ -146,17 +257,21 @@ Remember: You're providing supportive insights, not therapy or medical advice.""
                         "content": prompt
                     }
                 ],
-                max_tokens=300,
-                temperature=0.7
+                max_tokens=plan.max_tokens,
+                temperature=0.7,
+                user_id=user_id,
+                local_only=plan.exhausted
             )
-            summary = response.choices[0].message.content.strip()
+            summary = completion.text
             current_app.logger.info(f"Weekly summary generated, length: {len(summary)} chars")
             
             return summary
             
+        except (AIServiceDegradedError, AIBudgetExceededError):
+            raise
         except Exception as e:
             current_app.logger.error(f"Weekly summary error: {e}")
-            raise AIServiceError("Failed to generate weekly summary")
+            raise AIServiceError("Failed to generate weekly summary") from e
 
 
 
@@ -187,21 +302,22 @@ Remember: You're providing supportive insights, not therapy or medical advice.""
         return "\n".join(prompt_parts)
 
     def test_connection(self):
-        """Test OpenAI API connection"""
+        """Test the connection to the configured provider"""
         if not self.is_available():
             return False, "API key not configured"
         
         try:
             # Make a simple test request
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
+            completion = self._complete(
                 messages=[
                     {"role": "user", "content": "Say 'Hello' if you can hear me."}
                 ],
                 max_tokens=10
             )
             
-            return True, "Connection successful"
+            return True, f"Connection successful ({completion.provider})"
             
+        except AIServiceDegradedError as e:
+            return False, f"Circuit open: {e}"
         except Exception as e:
             return False, f"Connection failed: {str(e)}"
\ No newline at end of file
@@ -0,0 +1,223 @@
+"""
+Garbage collection of orphaned audio files.
+Streams the audio store in batches, checks each key against the entries that
+reference it and deletes (or quarantines) objects no entry points at.
+"""
+
+import os
+import re
+import shutil
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from flask import current_app
+from mongoengine import Q
+
+from models.audio_model import AudioBlob
+from models.mood_model import MoodEntry
+from utils.file_handler import AudioFileHandler
+from utils.storage import get_storage, get_temp_dir
+
+# ab/cd/<sha256> or ab/cd/<sha256>.<rendition>
+BLOB_KEY_PATTERN = re.compile(r'^[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})(\..+)?$')
+
+QUARANTINE_PREFIX = 'quarantine/'
+
+
+class AudioGarbageCollector:
+    """Finds and removes stored audio that no mood entry references."""
+
+    def __init__(self, dry_run=False, quarantine=False, batch_size=500, grace=timedelta(hours=1), max_deletes_per_second=20):
+        self.dry_run = dry_run
+        self.quarantine = quarantine
+        self.batch_size = batch_size
+        self.grace = grace
+        self.max_deletes_per_second = max_deletes_per_second
+        self._last_delete = 0.0
+
+    def run(self, should_stop=None):
+        """Run one full pass over the store and return counters."""
+        storage = get_storage()
+        cutoff = datetime.now(timezone.utc) - self.grace
+        stats = {'scanned': 0, 'young': 0, 'referenced': 0, 'orphaned': 0, 'removed': 0, 'bytes_removed': 0, 'temp_removed': 0,
+                 'refs_repaired': 0}
+
+        batch = []
+        for obj in storage.iter_objects():
+            if should_stop and should_stop():
+                break
+            if obj.key.startswith(QUARANTINE_PREFIX):
+                continue
+            stats['scanned'] += 1
+            # Uploads are stored before their entry is saved, so leave recent objects alone
+            if obj.modified_at > cutoff:
+                stats['young'] += 1
+                continue
+            batch.append(obj)
+            if len(batch) >= self.batch_size:
+                self._collect_batch(storage, batch, stats, cutoff)
+                batch = []
+        if batch:
+            self._collect_batch(storage, batch, stats, cutoff)
+
+        stats['temp_removed'] = self._clean_temp_dir(cutoff)
+        return stats
+
+    def _collect_batch(self, storage, batch, stats, cutoff):
+        hashes, names = set(), set()
+        for obj in batch:
+            match = BLOB_KEY_PATTERN.match(obj.key)
+            if match:
+                hashes.add(match.group(1))
+            else:
+                names.add(obj.key)
+
+        referenced_hashes = self._referenced_hashes(hashes, stats, cutoff) if hashes else set()
+
+        referenced_names = set()
+        if names:
+            for entry in MoodEntry.objects(
+                Q(audio_file__filename__in=list(names)) | Q(audio_file__compact_filename__in=list(names))
+            ).only('audio_file.filename', 'audio_file.compact_filename'):
+                referenced_names.update([entry.audio_file.filename, entry.audio_file.compact_filename])
+
+        for obj in batch:
+            match = BLOB_KEY_PATTERN.match(obj.key)
+            if match:
+                is_referenced = match.group(1) in referenced_hashes
+            else:
+                is_referenced = obj.key in referenced_names
+
+            if is_referenced:
+                stats['referenced'] += 1
+                continue
+
+            stats['orphaned'] += 1
+            if self.dry_run:
+                current_app.logger.info(f"Audio GC (dry run): would remove {obj.key} ({obj.size} bytes)")
+                continue
+
+            self._throttle()
+            if match and not match.group(2):
+                # Claims the blob so an upload taking a reference meanwhile stores its own copy
+                if not AudioFileHandler.delete_unreferenced_blob(match.group(1), lambda: self._remove(storage, obj.key)):
+                    stats['orphaned'] -= 1
+                    stats['referenced'] += 1
+                    continue
+            else:
+                self._remove(storage, obj.key)
+            stats['removed'] += 1
+            stats['bytes_removed'] += obj.size
+            current_app.logger.info(f"Audio GC: {'quarantined' if self.quarantine else 'removed'} {obj.key}")
+
+    def _referenced_hashes(self, hashes, stats, cutoff):
+        """
+        Content hashes still in use.
+        A blob's ref_count is only trusted if it changed within the grace period, since a
+        deduplicated upload holds a reference before its entry is saved. Older counts are
+        rebuilt from the entries: entries removed without releasing their audio (the user
+        CASCADE, a failed release) leave references that would otherwise never drop.
+        """
+        counts = {row['_id']: row['count'] for row in MoodEntry.objects(audio_file__content_hash__in=list(hashes)).aggregate([
+            {'$group': {'_id': '$audio_file.content_hash', 'count': {'$sum': 1}}}
+        ])}
+        referenced = set(counts)
+
+        recent = cutoff.replace(tzinfo=None)
+        for blob in AudioBlob.objects(id__in=list(hashes)).only('ref_count', 'referenced_at'):
+            if blob.referenced_at and blob.referenced_at > recent:
+                if blob.ref_count > 0:
+                    referenced.add(blob.id)
+                continue
+
+            actual = counts.get(blob.id, 0)
+            if blob.ref_count == actual or self.dry_run:
+                continue
+            # Only if nothing took or dropped a reference since the blob was read
+            if AudioBlob.objects(id=blob.id, ref_count=blob.ref_count, referenced_at=blob.referenced_at).update_one(set__ref_count=actual):
+                stats['refs_repaired'] += 1
+                current_app.logger.warning(f"Audio GC: repaired ref_count of {blob.id} from {blob.ref_count} to {actual}")
+            else:
+                referenced.add(blob.id)
+        return referenced
+
+    def _remove(self, storage, key):
+        if self.quarantine:
+            self._move_to_quarantine(storage, key)
+        else:
+            storage.delete(key)
+
+    def _throttle(self):
+        if not self.max_deletes_per_second:
+            return
+        wait = self._last_delete + 1.0 / self.max_deletes_per_second - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        self._last_delete = time.monotonic()
+
+    def _move_to_quarantine(self, storage, key):
+        with storage.local_copy(key) as path:
+            temp_path = os.path.join(get_temp_dir(), f"quarantine-{os.getpid()}-{threading.get_ident()}")
+            shutil.copyfile(path, temp_path)
+        storage.put_file(f"{QUARANTINE_PREFIX}{key}", temp_path)
+        storage.delete(key)
+
+    def _clean_temp_dir(self, cutoff):
+        """Remove abandoned upload temp files"""
+        removed = 0
+        temp_dir = get_temp_dir()
+        for name in os.listdir(temp_dir):
+            path = os.path.join(temp_dir, name)
+            try:
+                if datetime.fromtimestamp(os.path.getmtime(path), timezone.utc) > cutoff:
+                    continue
+                if not self.dry_run:
+                    os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+
+def build_collector(config, **overrides):
+    """Create a collector configured from the app config"""
+    options = {
+        'dry_run': config.get('AUDIO_GC_DRY_RUN', False),
+        'quarantine': config.get('AUDIO_GC_QUARANTINE', False),
+        'batch_size': config.get('AUDIO_GC_BATCH_SIZE', 500),
+        'grace': config.get('AUDIO_GC_GRACE_PERIOD', timedelta(hours=1)),
+        'max_deletes_per_second': config.get('AUDIO_GC_MAX_DELETES_PER_SECOND', 20),
+    }
+    options.update({key: value for key, value in overrides.items() if value is not None})
+    return AudioGarbageCollector(**options)
+
+
+# Background collector thread
+_gc_thread = None
+_gc_stop = threading.Event()
+
+def start_audio_gc(app):
+    """Run the collector periodically in a daemon thread."""
+    global _gc_thread
+    interval = app.config.get('AUDIO_GC_INTERVAL', 0)
+    if not interval or (_gc_thread and _gc_thread.is_alive()):
+        return
+
+    def loop():
+        while not _gc_stop.wait(interval):
+            with app.app_context():
+                try:
+                    stats = build_collector(app.config).run(should_stop=_gc_stop.is_set)
+                    current_app.logger.info(f"Audio GC pass finished: {stats}")
+                except Exception as e:
+                    current_app.logger.error(f"Audio GC pass failed: {e}")
+
+    _gc_stop.clear()
+    _gc_thread = threading.Thread(target=loop, daemon=True, name='audio-gc')
+    _gc_thread.start()
+
+def stop_audio_gc():
+    """Stop the background collector."""
+    _gc_stop.set()
+    if _gc_thread:
+        _gc_thread.join(timeout=5)
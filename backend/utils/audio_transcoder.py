@@ -0,0 +1,183 @@
+"""
+Background transcoding of uploaded voice notes.
+Produces a normalized, low-bitrate rendition that is served for playback
+instead of the (possibly uncompressed) original upload.
+"""
+
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from flask import current_app
+
+from models.mood_model import MoodEntry
+from utils.file_handler import AudioFileHandler
+from utils.storage import get_storage, get_temp_dir
+
+
+class TranscodeError(Exception):
+    pass
+
+
+class AudioTranscoder:
+    """Transcodes stored audio files on a small background thread pool."""
+
+    CONTENT_TYPES = {
+        'ogg': 'audio/ogg',
+        'webm': 'audio/webm',
+        'mp4': 'audio/mp4',
+        'm4a': 'audio/mp4',
+        'mp3': 'audio/mpeg',
+    }
+
+    def __init__(self, app, max_workers=2):
+        self.app = app
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='audio-transcode')
+        self.stats = {'queued': 0, 'done': 0, 'skipped': 0, 'failed': 0, 'bytes_in': 0, 'bytes_out': 0}
+        self._lock = threading.Lock()
+
+    def queue(self, entry_id):
+        """Schedule transcoding of the audio attached to an entry."""
+        self._bump('queued')
+        return self.executor.submit(self._run, entry_id)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats['bytes_saved'] = stats['bytes_in'] - stats['bytes_out']
+        return stats
+
+    def _bump(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def _run(self, entry_id):
+        with self.app.app_context():
+            entry = MoodEntry.objects(id=entry_id).first()
+            if not entry or not entry.audio_file:
+                current_app.logger.warning(f"Transcode skipped, no audio for entry: {entry_id}")
+                return None
+
+            filename = entry.audio_file.filename
+            try:
+                result = self.transcode_file(entry.audio_file)
+            except TranscodeError as e:
+                current_app.logger.warning(f"Audio transcode failed for {filename}: {e}")
+                self._bump('failed')
+                self._update_entry(entry_id, filename, transcode_status='failed', transcode_error=str(e))
+                return None
+
+            if result is None:
+                self._bump('skipped')
+                self._update_entry(entry_id, filename, transcode_status='skipped')
+                return None
+
+            self._bump('done')
+            self._bump('bytes_in', entry.audio_file.file_size or 0)
+            self._bump('bytes_out', result['file_size'])
+            updated = self._update_entry(
+                entry_id, filename,
+                transcode_status='done',
+                compact_filename=result['filename'],
+                compact_file_size=result['file_size'],
+                compact_content_type=result['content_type'],
+            )
+            if not updated and not entry.audio_file.content_hash:
+                # The audio was replaced or removed while we were working
+                AudioFileHandler.delete_audio_file(result['filename'])
+                return None
+
+            current_app.logger.info(
+                f"Audio transcoded: {filename} -> {result['filename']} "
+                f"({entry.audio_file.file_size} -> {result['file_size']} bytes)"
+            )
+            return result
+
+    def _update_entry(self, entry_id, filename, **fields):
+        """Set rendition fields only if the entry still references the same audio file."""
+        updates = {f'set__audio_file__{key}': value for key, value in fields.items()}
+        updates['set__audio_file__transcoded_at'] = datetime.utcnow()
+        return MoodEntry.objects(id=entry_id, audio_file__filename=filename).update_one(**updates)
+
+    @staticmethod
+    def transcode_file(audio_file):
+        """
+        Transcode a stored audio file into the configured compact format.
+        Returns rendition info, or None if the compact rendition would not be smaller.
+        Content-addressed files share one rendition, so an existing one is reused.
+        """
+        try:
+            from pydub import AudioSegment, effects
+        except ImportError:
+            raise TranscodeError("pydub not installed")
+
+        config = current_app.config
+        storage = get_storage()
+        fmt = config.get('AUDIO_TRANSCODE_FORMAT', 'ogg')
+        source_key = AudioFileHandler.get_stored_key(audio_file)
+        if not storage.exists(source_key):
+            raise TranscodeError("Source file not found")
+
+        stem = audio_file.content_hash or audio_file.filename.rsplit('.', 1)[0]
+        compact_filename = f"{stem}.compact.{fmt}"
+        compact_key = AudioFileHandler.get_storage_key(compact_filename, audio_file.content_hash)
+        content_type = AudioTranscoder.CONTENT_TYPES.get(fmt, f'audio/{fmt}')
+
+        if audio_file.content_hash and storage.exists(compact_key):
+            return {
+                'filename': compact_filename,
+                'file_size': storage.size(compact_key),
+                'content_type': content_type,
+            }
+
+        fd, compact_path = tempfile.mkstemp(suffix=f'.{fmt}', dir=get_temp_dir())
+        os.close(fd)
+        try:
+            with storage.local_copy(source_key) as source_path:
+                source_size = os.path.getsize(source_path)
+                segment = AudioSegment.from_file(source_path)
+            segment = segment.set_channels(1).set_frame_rate(config.get('AUDIO_TRANSCODE_SAMPLE_RATE', 16000))
+            segment = effects.normalize(segment)
+            segment.export(
+                compact_path,
+                format=fmt,
+                codec=config.get('AUDIO_TRANSCODE_CODEC') or None,
+                bitrate=config.get('AUDIO_TRANSCODE_BITRATE', '24k'),
+            )
+
+            compact_size = os.path.getsize(compact_path)
+            if compact_size >= source_size:
+                return None
+
+            storage.put_file(compact_key, compact_path, content_type)
+        except Exception as e:
+            raise TranscodeError(str(e))
+        finally:
+            if os.path.exists(compact_path):
+                os.remove(compact_path)
+
+        return {
+            'filename': compact_filename,
+            'file_size': compact_size,
+            'content_type': content_type,
+        }
+
+
+# Global transcoder instance
+_transcoder = None
+
+def get_transcoder(app=None):
+    """Get the global audio transcoder instance."""
+    global _transcoder
+    if _transcoder is None:
+        app = app or current_app._get_current_object()
+        _transcoder = AudioTranscoder(app, max_workers=app.config.get('AUDIO_TRANSCODE_WORKERS', 2))
+    return _transcoder
+
+def queue_audio_transcode(entry_id):
+    """Queue the audio of an entry for background transcoding."""
+    if not current_app.config.get('AUDIO_TRANSCODE_ENABLED', True):
+        return None
+    current_app.logger.info(f"Entry {entry_id} queued for audio transcoding")
+    return get_transcoder().queue(entry_id)
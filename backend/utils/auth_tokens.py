@@ -0,0 +1,135 @@
+"""
+Access/refresh token issuing, refresh token rotation and revocation.
+Access tokens revoked at logout go on a deny list in MongoDB shared by every
+process, with a local cache in front so repeat checks stay in memory.
+"""
+
+import threading
+import time
+import uuid
+from datetime import datetime
+from flask import current_app
+from flask_jwt_extended import create_access_token, create_refresh_token, decode_token
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt.exceptions import PyJWTError
+
+from models.token_model import RefreshToken, RevokedAccessToken
+
+
+class TokenReuseError(Exception):
+    pass
+
+
+class TokenRevokedError(Exception):
+    pass
+
+
+class RevocationSet:
+    """In-memory set of revoked token ids, pruned as the tokens expire. Caches the shared deny list."""
+
+    def __init__(self):
+        self._revoked = {}
+        self._lock = threading.Lock()
+        self._next_prune = 0
+
+    def add(self, jti, expires_at):
+        with self._lock:
+            self._revoked[jti] = expires_at
+            self._prune()
+
+    def __contains__(self, jti):
+        return jti in self._revoked
+
+    def __len__(self):
+        return len(self._revoked)
+
+    def _prune(self):
+        now = time.time()
+        if now < self._next_prune:
+            return
+        self._revoked = {jti: exp for jti, exp in self._revoked.items() if exp > now}
+        self._next_prune = now + 60
+
+
+revoked_tokens = RevocationSet()
+
+
+def issue_tokens(user_id, family=None):
+    """Create an access token and a refresh token, recording the refresh token"""
+    family = family or uuid.uuid4().hex
+    access_token = create_access_token(identity=user_id)
+    refresh_token = create_refresh_token(identity=user_id, additional_claims={'fam': family})
+
+    claims = decode_token(refresh_token)
+    RefreshToken(
+        id=claims['jti'],
+        user_id=user_id,
+        family=family,
+        expires_at=datetime.utcfromtimestamp(claims['exp'])
+    ).save(force_insert=True)
+
+    return {
+        'access_token':access_token,
+        'refresh_token':refresh_token,
+        'expires_in':current_app.config['JWT_ACCESS_TOKEN_EXPIRES'].total_seconds(),
+        'refresh_expires_in':current_app.config['JWT_REFRESH_TOKEN_EXPIRES'].total_seconds()
+    }
+
+
+def rotate_refresh_token(claims):
+    """
+    Exchange a refresh token for a new token pair.
+    Presenting an already rotated token revokes its whole family.
+    """
+    jti = claims['jti']
+    rotated = RefreshToken.objects(id=jti, used_at=None, revoked=False).modify(set__used_at=datetime.utcnow(), new=True)
+    if rotated is None:
+        token = RefreshToken.objects(id=jti).first()
+        if token is None or token.revoked:
+            raise TokenRevokedError("Refresh token has been revoked")
+        revoke_family(token.family)
+        current_app.logger.warning(f"Refresh token reuse detected for user {token.user_id}, family revoked")
+        raise TokenReuseError("Refresh token has already been used")
+
+    return issue_tokens(rotated.user_id, family=rotated.family)
+
+
+def revoke_family(family):
+    return RefreshToken.objects(family=family).update(set__revoked=True)
+
+
+def revoke_access_token(claims):
+    """Deny an access token in every process until it expires"""
+    RevokedAccessToken.objects(id=claims['jti']).update_one(
+        upsert=True,
+        set__user_id=claims.get('sub'),
+        set__expires_at=datetime.utcfromtimestamp(claims['exp'])
+    )
+    revoked_tokens.add(claims['jti'], claims['exp'])
+
+
+def revoke_refresh_token(encoded_token, user_id):
+    """
+    Revoke the family of a refresh token presented at logout.
+    Returns False for tokens that are already unusable (expired, malformed, someone else's)
+    or were issued before families existed and so were never recorded.
+    """
+    try:
+        claims = decode_token(encoded_token)
+    except (PyJWTError, JWTExtendedException):
+        return False
+    if claims.get('type') != 'refresh' or claims.get('sub') != user_id or not claims.get('fam'):
+        return False
+    revoke_family(claims['fam'])
+    return True
+
+
+def is_token_revoked(jwt_payload):
+    """Check the local cache, then the deny list shared with the other workers"""
+    jti = jwt_payload['jti']
+    if jti in revoked_tokens:
+        return True
+    if RevokedAccessToken.objects(id=jti).only('id').first() is None:
+        return False
+    revoked_tokens.add(jti, jwt_payload['exp'])
+    return True
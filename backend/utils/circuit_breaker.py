@@ -0,0 +1,164 @@
+"""
+Circuit breaker for calls to the AI provider.
+Trips on a high failure rate or too many slow calls over a rolling window,
+fails fast while open, and lets a few probe calls through once the cool-down
+has passed to decide whether to close again.
+"""
+
+import threading
+import time
+from collections import deque
+from flask import current_app
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the provider while the circuit is open"""
+
+    def __init__(self, name, retry_after=1):
+        super().__init__(f"{name} is temporarily unavailable, retry later")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker over a rolling window of recent calls."""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_rate=0.5, slow_call_seconds=10.0, slow_call_rate=0.5,
+                 window_size=20, min_calls=5, open_seconds=30.0, half_open_calls=2, is_failure=None):
+        self.name = name
+        self.is_failure = is_failure  # predicate on a raised exception; None counts every exception
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.state = self.CLOSED
+        self._window = deque(maxlen=window_size)  # (failed, slow) per call
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probe_successes = 0
+        self._lock = threading.Lock()
+        self.stats = {'calls': 0, 'failures': 0, 'slow_calls': 0, 'rejected': 0, 'opened': 0}
+
+    def retry_after(self):
+        """Seconds until the breaker may let a call through; 0 while it would now"""
+        with self._lock:
+            self._maybe_half_open()
+            return self._retry_after() if self._rejecting() else 0
+
+    def is_open(self):
+        """True while calls would be rejected without reaching the provider"""
+        with self._lock:
+            self._maybe_half_open()
+            return self._rejecting()
+
+    def _rejecting(self):
+        return self.state == self.OPEN or (self.state == self.HALF_OPEN and self._probes >= self.half_open_calls)
+
+    def _retry_after(self):
+        # Half open with every probe in flight: the probes decide within a call's time, so check back soon
+        return max(1, round(self._opened_at + self.open_seconds - time.monotonic()))
+
+    def call(self, fn, *args, **kwargs):
+        """Run fn through the breaker, raising CircuitOpenError instead while open."""
+        self._acquire()
+        start = time.monotonic()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            # Errors that say nothing about the provider's health (a bad request) count as answered calls
+            failed = self.is_failure is None or self.is_failure(e)
+            self._record(time.monotonic() - start, failed=failed)
+            raise
+        self._record(time.monotonic() - start, failed=False)
+        return result
+
+    def _maybe_half_open(self):
+        if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self.state = self.HALF_OPEN
+            self._probes = 0
+            self._probe_successes = 0
+
+    def _acquire(self):
+        with self._lock:
+            self._maybe_half_open()
+            if self.state == self.HALF_OPEN and self._probes < self.half_open_calls:
+                self._probes += 1
+                return
+            if self.state != self.CLOSED:
+                self.stats['rejected'] += 1
+                raise CircuitOpenError(self.name, self._retry_after())
+
+    def _record(self, duration, failed):
+        slow = duration >= self.slow_call_seconds
+        with self._lock:
+            self.stats['calls'] += 1
+            self.stats['failures'] += failed
+            self.stats['slow_calls'] += slow
+
+            if self.state == self.HALF_OPEN:
+                if failed or slow:
+                    self._trip()
+                else:
+                    self._probe_successes += 1
+                    if self._probe_successes >= self.half_open_calls:
+                        self.state = self.CLOSED
+                        self._window.clear()
+                        current_app.logger.info(f"Circuit {self.name} closed")
+                return
+
+            self._window.append((failed, slow))
+            if self.state == self.CLOSED and len(self._window) >= self.min_calls:
+                failures = sum(1 for f, _ in self._window if f) / len(self._window)
+                slow_calls = sum(1 for _, s in self._window if s) / len(self._window)
+                if failures >= self.failure_rate or slow_calls >= self.slow_call_rate:
+                    self._trip()
+
+    def _trip(self):
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._window.clear()
+        self.stats['opened'] += 1
+        current_app.logger.warning(f"Circuit {self.name} opened for {self.open_seconds}s")
+
+    def get_stats(self):
+        with self._lock:
+            self._maybe_half_open()
+            stats = dict(self.stats)
+            stats['state'] = self.state
+        return stats
+
+
+# Global breaker for the AI provider
+_ai_breaker = None
+_ai_breaker_lock = threading.Lock()
+
+def get_ai_breaker():
+    """Get the global AI provider circuit breaker, configured from the current app."""
+    global _ai_breaker
+    if _ai_breaker is None:
+        with _ai_breaker_lock:
+            if _ai_breaker is None:
+                from utils.insight_retry import is_transient_error
+                config = current_app.config
+                _ai_breaker = CircuitBreaker(
+                    'AI service',
+                    failure_rate=config.get('AI_CIRCUIT_FAILURE_RATE', 0.5),
+                    slow_call_seconds=config.get('AI_CIRCUIT_SLOW_CALL_SECONDS', 10.0),
+                    slow_call_rate=config.get('AI_CIRCUIT_SLOW_CALL_RATE', 0.5),
+                    window_size=config.get('AI_CIRCUIT_WINDOW', 20),
+                    min_calls=config.get('AI_CIRCUIT_MIN_CALLS', 5),
+                    open_seconds=config.get('AI_CIRCUIT_OPEN_SECONDS', 30.0),
+                    half_open_calls=config.get('AI_CIRCUIT_HALF_OPEN_CALLS', 2),
+                    # Only outages, timeouts, rate limits and 5xx trip it; one malformed prompt must not
+                    is_failure=is_transient_error,
+                )
+    return _ai_breaker
+
+def get_ai_breaker_stats():
+    """Breaker state and counters, or None if no AI call was made yet."""
+    return _ai_breaker.get_stats() if _ai_breaker else None
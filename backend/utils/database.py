@@ -0,0 +1,144 @@
+"""
+MongoDB client setup, connection pool warm-up and the cached readiness check.
+Pool size, timeouts, read preference and write concern come from the config,
+so they can be tuned per deployment without code changes.
+"""
+
+import threading
+import time
+from pymongo import ReadPreference
+from mongoengine import connect
+from mongoengine.base import _document_registry
+from mongoengine.connection import get_connection
+
+from utils.query_guard import query_listener
+
+
+READ_PREFERENCES = {
+    'primary': ReadPreference.PRIMARY,
+    'primaryPreferred': ReadPreference.PRIMARY_PREFERRED,
+    'secondary': ReadPreference.SECONDARY,
+    'secondaryPreferred': ReadPreference.SECONDARY_PREFERRED,
+    'nearest': ReadPreference.NEAREST,
+}
+
+
+def connection_settings(config):
+    """MongoClient keyword arguments for the pool, timeouts, read preference and write concern"""
+    read_preference = config.get('MONGODB_READ_PREFERENCE', 'primary')
+    if read_preference not in READ_PREFERENCES:
+        raise ValueError(f"Unknown MONGODB_READ_PREFERENCE {read_preference}, expected one of {', '.join(READ_PREFERENCES)}")
+
+    settings = {
+        'maxPoolSize': config.get('MONGODB_MAX_POOL_SIZE', 100),
+        'minPoolSize': config.get('MONGODB_MIN_POOL_SIZE', 0),
+        'maxIdleTimeMS': config.get('MONGODB_MAX_IDLE_TIME_MS') or None,
+        'connectTimeoutMS': config.get('MONGODB_CONNECT_TIMEOUT_MS', 5000),
+        'serverSelectionTimeoutMS': config.get('MONGODB_SERVER_SELECTION_TIMEOUT_MS', 5000),
+        'socketTimeoutMS': config.get('MONGODB_SOCKET_TIMEOUT_MS') or None,
+        'waitQueueTimeoutMS': config.get('MONGODB_WAIT_QUEUE_TIMEOUT_MS') or None,
+        'read_preference': READ_PREFERENCES[read_preference],
+        'event_listeners': [query_listener],
+    }
+    write_concern = config.get('MONGODB_WRITE_CONCERN')
+    if write_concern:
+        settings['w'] = int(write_concern) if write_concern.isdigit() else write_concern
+    if config.get('MONGODB_JOURNAL'):
+        settings['journal'] = True
+    return settings
+
+
+def set_auto_create_index(enabled):
+    """Turn mongoengine's per-process index build on first collection access on or off for every model"""
+    for document in _document_registry.values():
+        document._meta['auto_create_index'] = enabled
+
+
+def connect_database(app):
+    """Configure the default mongoengine connection without blocking on the server"""
+    # Indexes are built by `flask indexes sync` at deploy time unless MONGODB_AUTO_CREATE_INDEX is set
+    set_auto_create_index(app.config.get('MONGODB_AUTO_CREATE_INDEX', False))
+    # connect=False: the driver connects on first use instead of blocking worker boot
+    return connect(
+        host=app.config['MONGODB_URI'],
+        connect=False,
+        **connection_settings(app.config)
+    )
+
+
+def warm_up_pool(app, connections=None):
+    """
+    Open connections in the background so the first requests don't pay for the
+    TCP/TLS handshakes. Each concurrent ping checks out its own pooled socket.
+    """
+    connections = connections or app.config.get('MONGODB_WARMUP_CONNECTIONS', 0)
+    if connections <= 0:
+        return None
+    errors = []
+
+    def ping():
+        try:
+            get_connection().admin.command('ping')
+        except Exception as e:
+            errors.append(e)
+
+    def warm_up():
+        started = time.monotonic()
+        pings = [threading.Thread(target=ping, daemon=True) for _ in range(connections)]
+        for thread in pings:
+            thread.start()
+        for thread in pings:
+            thread.join()
+        if errors:
+            app.logger.warning(f"MongoDB pool warm-up failed: {errors[0]}")
+        else:
+            app.logger.info(f"MongoDB pool warmed up with {connections} connections in {time.monotonic() - started:.2f}s")
+
+    thread = threading.Thread(target=warm_up, daemon=True, name='mongo-warmup')
+    thread.start()
+    return thread
+
+
+class ReadinessCheck:
+    """
+    Cached MongoDB ping for readiness probes. A ping is a no-op command on the
+    admin database answered by the nearest member, so probes never touch the
+    application's collections or queue behind primary traffic.
+    """
+
+    def __init__(self, cache_seconds=5.0):
+        self.cache_seconds = cache_seconds
+        self._lock = threading.Lock()
+        self._result = None
+        self._checked_at = 0.0
+
+    def _ping(self):
+        started = time.monotonic()
+        try:
+            get_connection().admin.command('ping', read_preference=ReadPreference.NEAREST)
+            return {'ready': True, 'latency_ms': round((time.monotonic() - started) * 1000, 1)}
+        except Exception as e:
+            return {'ready': False, 'error': str(e)}
+
+    def check(self):
+        """Latest ping result, re-pinging at most once per cache_seconds"""
+        with self._lock:
+            now = time.monotonic()
+            if self._result is None or now - self._checked_at >= self.cache_seconds:
+                self._result = self._ping()
+                self._checked_at = now
+            return dict(self._result, age_seconds=round(now - self._checked_at, 1))
+
+
+# Global readiness check, shared by the request threads of a worker
+_readiness = None
+_readiness_lock = threading.Lock()
+
+def get_readiness_check(cache_seconds=5.0):
+    """Get or create the global readiness check."""
+    global _readiness
+    if _readiness is None:
+        with _readiness_lock:
+            if _readiness is None:
+                _readiness = ReadinessCheck(cache_seconds=cache_seconds)
+    return _readiness
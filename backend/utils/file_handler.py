@@ -1,11 +1,16 @@
-from ast import Import
 import datetime
+import hashlib
 import os 
+import time
 import uuid 
-from click import File
-import magic
 from werkzeug.utils import secure_filename
 from flask import current_app
+from mongoengine import NotUniqueError, Q
+from models.audio_model import AudioBlob
+from utils.storage import get_storage, get_temp_dir
+
+# Longest a blob delete is expected to take; older delete claims are treated as abandoned
+BLOB_DELETE_TIMEOUT = 30
 
 class FileUploadError(Exception):
     pass
@@ -15,6 +20,8 @@ class AudioFileHandler:
 
     ALLOWED_MIME_TYPES = {'audio/mpeg','audio/wav','audio/x-m4a','audio/ogg','audio/aac','audio/flac'}
 
+    HASH_CHUNK_SIZE = 64 * 1024
+
     @staticmethod
     def allowed_file(filename):
         return '.' in filename and filename.rsplit('.',1)[1].lower() in AudioFileHandler.ALLOWED_EXTENSIONS
@@ -41,6 +48,7 @@ class AudioFileHandler:
             file_content = file.read(1024)
             file.seek(0)
 
+            import magic  # libmagic is only loaded once an upload arrives
             mime_type = magic.from_buffer(file_content,mime = True)
 
             if mime_type not in AudioFileHandler.ALLOWED_MIME_TYPES:
@@ -53,24 +61,31 @@ class AudioFileHandler:
 
     @staticmethod
     def save_audio_file(file):
+        """
+        Store an uploaded audio file in the content-addressed store.
+        Identical uploads share one stored object; every upload still gets its own filename.
+        """
         AudioFileHandler.validate_audio_file(file)
         file_extension = file.filename.rsplit('.', 1)[1].lower()
         unique_filename = f"{uuid.uuid4().hex}.{file_extension}"
 
-        upload_path = current_app.config.get('UPLOAD_FOLDER', 'uploads')
-        audio_path = os.path.join(upload_path, 'audio')
-        os.makedirs(audio_path, exist_ok=True)
+        # Stream to a temp file while hashing, so the upload is read only once
+        temp_path = os.path.join(get_temp_dir(), f"{uuid.uuid4().hex}.part")
 
-        # Save file
-        file_path = os.path.join(audio_path, unique_filename)
-        file.save(file_path)
+        digest = hashlib.sha256()
+        file.stream.seek(0)
+        with open(temp_path, 'wb') as out:
+            for chunk in iter(lambda: file.stream.read(AudioFileHandler.HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+                out.write(chunk)
 
-        file_size = os.path.getsize(file_path)
+        content_hash = digest.hexdigest()
+        file_size = os.path.getsize(temp_path)
 
         duration=None
         try:
             from pydub import AudioSegment
-            audio_segment = AudioSegment.from_file(file_path)
+            audio_segment = AudioSegment.from_file(temp_path, format=file_extension)
             duration = len(audio_segment)/1000
         
         except ImportError:
@@ -79,24 +94,124 @@ class AudioFileHandler:
         except Exception as e:
             current_app.logger.warning(f"Could not calculate audio duration: {e}")
 
+        storage_key = AudioFileHandler.store_blob(temp_path, content_hash, file.content_type)
+
         return {
             'filename':unique_filename,
+            'content_hash':content_hash,
             'original_filename':file.filename,
-            'file_path':file_path,
+            'storage_key':storage_key,
             'file_size':file_size,
             'duration':duration,
             'content_type':file.content_type,
 
         }
 
+    @staticmethod
+    def store_blob(source_path, content_hash, content_type=None):
+        """
+        Move a file into the store under its content hash and take a reference to it.
+        If the content is already stored the source file is discarded.
+        """
+        storage = get_storage()
+        blob_key = AudioFileHandler.get_storage_key(content_hash, content_hash)
+
+        now = datetime.datetime.utcnow()
+        previous = AudioBlob.objects(id=content_hash).modify(
+            upsert=True,
+            new=False,
+            inc__ref_count=1,
+            set__referenced_at=now,
+            set_on_insert__file_size=os.path.getsize(source_path),
+            set_on_insert__created_at=now
+        )
+        try:
+            if previous is not None and previous.deleting_since:
+                # The last reference was just dropped and the object is being removed; store ours once it's gone
+                AudioFileHandler._wait_for_blob_delete(content_hash)
+                storage.put_file(blob_key, source_path, content_type)
+            elif previous is not None and storage.exists(blob_key):
+                current_app.logger.info(f"Deduplicated audio upload: {content_hash}")
+            else:
+                storage.put_file(blob_key, source_path, content_type)
+        except Exception:
+            AudioBlob.objects(id=content_hash).update_one(dec__ref_count=1, set__referenced_at=datetime.datetime.utcnow())
+            raise
+        finally:
+            if os.path.exists(source_path):
+                os.remove(source_path)
+        return blob_key
+
+    @staticmethod
+    def _wait_for_blob_delete(content_hash, timeout=BLOB_DELETE_TIMEOUT):
+        deadline = time.monotonic() + timeout
+        while AudioBlob.objects(id=content_hash, deleting_since__ne=None).count():
+            if time.monotonic() > deadline:
+                current_app.logger.warning(f"Gave up waiting for audio blob delete: {content_hash}")
+                return
+            time.sleep(0.05)
+
+    @staticmethod
+    def delete_unreferenced_blob(content_hash, delete_objects):
+        """
+        Call delete_objects() to remove a blob's stored objects if nothing references it.
+        The blob is claimed for the duration, so a store_blob racing the delete
+        re-stores its file afterwards instead of deduplicating against a vanishing object.
+        Returns False if the blob is referenced or already being deleted.
+        """
+        now = datetime.datetime.utcnow()
+        stale = now - datetime.timedelta(seconds=BLOB_DELETE_TIMEOUT)
+        claimed = AudioBlob.objects(Q(deleting_since=None) | Q(deleting_since__lt=stale), id=content_hash, ref_count__lte=0).modify(
+            set__deleting_since=now
+        )
+        if claimed is None:
+            if AudioBlob.objects(id=content_hash).count():
+                return False
+            # Stored before reference counting; the claim document stops a concurrent store_blob deduplicating
+            try:
+                AudioBlob(id=content_hash, ref_count=0, deleting_since=now).save(force_insert=True)
+            except NotUniqueError:
+                return False
+
+        try:
+            delete_objects()
+        finally:
+            if not AudioBlob.objects(id=content_hash, ref_count__lte=0).delete():
+                # Referenced again meanwhile; the new owner is waiting to store the file
+                AudioBlob.objects(id=content_hash).update_one(unset__deleting_since=True)
+        return True
+
+    @staticmethod
+    def release_blob(content_hash):
+        """
+        Drop one reference to a stored blob.
+        The object and its derived renditions are removed with the last reference.
+        """
+        blob = AudioBlob.objects(id=content_hash).modify(new=True, dec__ref_count=1, set__referenced_at=datetime.datetime.utcnow())
+        if blob is None:
+            current_app.logger.warning(f"Audio blob not found for release: {content_hash}")
+            return False
+        if blob.ref_count > 0:
+            return False
+
+        storage = get_storage()
+        blob_key = AudioFileHandler.get_storage_key(content_hash, content_hash)
+
+        def delete_objects():
+            for key in [blob_key] + list(storage.iter_keys(f"{blob_key}.")):
+                try:
+                    storage.delete(key)
+                except Exception as e:
+                    current_app.logger.error(f"Error deleting stored audio {key}: {e}")
+
+        # Only the releaser that claims the unreferenced blob removes the object
+        return AudioFileHandler.delete_unreferenced_blob(content_hash, delete_objects)
+
     @staticmethod
     def delete_audio_file(filename):
+        """Delete a file stored in the flat, pre-deduplication layout"""
         try:
-            upload_path = current_app.config.get('UPLOAD_FOLDER', 'uploads')
-            file_path = os.path.join(upload_path, 'audio', filename)
-            
-            if os.path.exists(file_path):
-                os.remove(file_path)
+            if get_storage().delete(AudioFileHandler.get_storage_key(filename)):
                 return True
             else:
                 current_app.logger.warning(f"File not found for deletion: {filename}")
@@ -107,13 +222,39 @@ class AudioFileHandler:
             return False
 
     @staticmethod
-    def get_audio_file_path(filename):
-        """Get full path to audio file"""
-        upload_path = current_app.config.get('UPLOAD_FOLDER', 'uploads')
-        return os.path.join(upload_path, 'audio', filename)
+    def delete_audio_renditions(audio_file):
+        """Release the stored audio of an AudioFile and any derived renditions"""
+        if audio_file.content_hash:
+            return AudioFileHandler.release_blob(audio_file.content_hash)
+
+        deleted = AudioFileHandler.delete_audio_file(audio_file.filename)
+        if audio_file.compact_filename:
+            AudioFileHandler.delete_audio_file(audio_file.compact_filename)
+        return deleted
+
+    @staticmethod
+    def get_storage_key(filename, content_hash=None):
+        """
+        Get the storage key of an audio file.
+        Content-addressed files live under two-level shard prefixes, e.g. ab/cd/abcd...
+        """
+        if content_hash:
+            return f"{content_hash[:2]}/{content_hash[2:4]}/{filename}"
+        return filename
+
+    @staticmethod
+    def get_stored_key(audio_file):
+        """Get the storage key of the original upload of an AudioFile"""
+        if audio_file.content_hash:
+            return AudioFileHandler.get_storage_key(audio_file.content_hash, audio_file.content_hash)
+        return AudioFileHandler.get_storage_key(audio_file.filename)
+
+    @staticmethod
+    def get_compact_key(audio_file):
+        """Get the storage key of the compact rendition of an AudioFile"""
+        return AudioFileHandler.get_storage_key(audio_file.compact_filename, audio_file.content_hash)
     
     @staticmethod
-    def file_exists(filename):
-        """Check if audio file exists on disk"""
-        file_path = AudioFileHandler.get_audio_file_path(filename)
-        return os.path.exists(file_path)
\ No newline at end of file
+    def file_exists(audio_file):
+        """Check if the original upload of an AudioFile is in storage"""
+        return get_storage().exists(AudioFileHandler.get_stored_key(audio_file))
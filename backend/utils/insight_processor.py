@@ -7,7 +7,11 @@ import threading
 import time
 from flask import current_app
 from models.mood_model import MoodEntry
-from utils.ai_service import MoodInsightAI, AIServiceError
+from utils.ai_service import MoodInsightAI, AIServiceError, AIServiceDegradedError, AIBudgetExceededError
+from utils.insight_templates import InsightCache, get_template_insight
+from utils.single_flight import get_single_flight
+from utils.insight_retry import record_insight_failure
+from utils.profiler import sampled_profile
 
 
 class InsightProcessor:
@@ -16,14 +20,19 @@ class InsightProcessor:
     def __init__(self, app=None):
         self.ai_service = MoodInsightAI()
         self.processing_thread = None
-        self.should_stop = False
+        self._stop_event = threading.Event()
         self.app = app
+        self.insight_cache = InsightCache(max_size=current_app.config.get('INSIGHT_CACHE_SIZE', 1000))
+        self.stats = {'template': 0, 'cache': 0, 'llm': 0, 'local': 0, 'failed': 0}
+        self._stats_lock = threading.Lock()
+        self.created_at = time.monotonic()
+        self.busy_seconds = 0.0
     
     def start_processing(self):
         """Start the background processing thread."""
         if self.processing_thread is None or not self.processing_thread.is_alive():
-            self.should_stop = False
-            self.processing_thread = threading.Thread(target=self._process_loop, daemon=True)
+            self._stop_event.clear()
+            self.processing_thread = threading.Thread(target=self.run, daemon=True)
             self.processing_thread.start()
             if self.app:
                 with self.app.app_context():
@@ -33,7 +42,7 @@ class InsightProcessor:
     
     def stop_processing(self):
         """Stop the background processing thread."""
-        self.should_stop = True
+        self.request_stop()
         if self.processing_thread:
             self.processing_thread.join(timeout=5)
             if self.app:
@@ -42,59 +51,171 @@ class InsightProcessor:
             else:
                 print("Insight processor stopped")
     
-    def _process_loop(self):
-        """Main processing loop that runs in background thread."""
+    @property
+    def should_stop(self):
+        return self._stop_event.is_set()
+
+    def request_stop(self):
+        """Ask the loop to exit once the entry in progress is finished."""
+        self._stop_event.set()
+
+    def run(self):
+        """Main processing loop; runs in the background thread or in a worker process until stopped."""
         while not self.should_stop:
             if self.app:
                 with self.app.app_context():
                     try:
+                        # Pause while the circuit breaker keeps OpenAI calls short-circuited
+                        if self.ai_service.is_degraded():
+                            self._stop_event.wait(min(30, self.ai_service.breaker.retry_after()))
+                            continue
+                        
                         # Get entries that need processing
-                        unprocessed_entries = MoodEntry.get_unprocessed_entries(limit=5)
+                        unprocessed_entries = MoodEntry.get_unprocessed_entries(
+                            limit=current_app.config.get('INSIGHT_BATCH_SIZE', 10),
+                            transcript_wait=current_app.config.get('TRANSCRIPTION_WAIT_TIMEOUT'),
+                            shares=current_app.config.get('INSIGHT_LANE_SHARES'),
+                            promote_after=current_app.config.get('INSIGHT_PROMOTE_AFTER')
+                        )
                         
                         if not unprocessed_entries:
                             # No entries to process, sleep and check again
-                            time.sleep(30)  # Wait 30 seconds before checking again
+                            self._stop_event.wait(current_app.config.get('INSIGHT_POLL_INTERVAL', 30))
                             continue
                         
                         # Process each entry
-                        for entry in unprocessed_entries:
-                            if self.should_stop:
-                                break
-                            
-                            try:
-                                self._process_single_entry(entry)
-                            except Exception as e:
-                                current_app.logger.error(f"Failed to process entry {entry.id}: {e}")
-                                entry.mark_ai_processing_failed(str(e))
+                        with sampled_profile('insight', f'batch of {len(unprocessed_entries)}', current_app.config.get('PROFILE_INSIGHT_SAMPLE_RATE', 0)):
+                            for entry in unprocessed_entries:
+                                if self.should_stop:
+                                    break
+                                
+                                try:
+                                    self.process_entry(entry)
+                                except AIServiceDegradedError:
+                                    # Leave the entry queued and stop the batch until the circuit recovers
+                                    current_app.logger.warning("AI service degraded, pausing insight processing")
+                                    break
+                                except Exception as e:
+                                    current_app.logger.error(f"Failed to process entry {entry.id}: {e}")
+                                    record_insight_failure(entry, e)
                         
                         # Short delay between batches
-                        time.sleep(10)
+                        self._stop_event.wait(current_app.config.get('INSIGHT_BATCH_DELAY', 10))
                         
                     except Exception as e:
                         current_app.logger.error(f"Error in insight processing loop: {e}")
-                        time.sleep(60)  # Wait longer if there's an error
+                        self._stop_event.wait(60)  # Wait longer if there's an error
             else:
                 print("No app context available, stopping processor")
                 break
     
+    def _count(self, source):
+        with self._stats_lock:
+            self.stats[source] += 1
+
+    def get_stats(self):
+        """Per-source counts of resolved insights."""
+        with self._stats_lock:
+            return dict(self.stats)
+
+    def get_utilization(self):
+        """Time spent processing entries against uptime, plus insight cache hit counts."""
+        with self._stats_lock:
+            busy_seconds = self.busy_seconds
+        return {
+            'busy_seconds': busy_seconds,
+            'uptime_seconds': time.monotonic() - self.created_at,
+            'cache': self.insight_cache.get_stats(),
+        }
+
+    def _triage(self, entry, emotion, audio_transcript):
+        """
+        Resolve an entry locally when possible.
+        Returns (insight, source, cache_key); insight is None if the LLM is needed.
+        """
+        min_words = current_app.config.get('INSIGHT_TRIAGE_MIN_WORDS', 3)
+        if not entry.has_content_for_ai() or entry.is_trivial_for_ai(min_words):
+            return get_template_insight(emotion, seed=str(entry.id)), 'template', None
+
+        cache_key = InsightCache.make_key(emotion, entry.text_note, audio_transcript)
+        cached = self.insight_cache.get(cache_key)
+        if cached:
+            return cached, 'cache', cache_key
+        return None, 'llm', cache_key
+
+    def process_entry(self, entry):
+        """
+        Generate the insight for one entry, skipping it if a request or another
+        worker is already generating it. Returns True if it was processed here.
+        """
+        started = time.monotonic()
+        try:
+            return get_single_flight().run(entry, lambda: self._process_single_entry(entry), wait=False)
+        finally:
+            with self._stats_lock:
+                self.busy_seconds += time.monotonic() - started
+
+    def resolve_locally(self, entry):
+        """
+        Resolve an entry from templates or the insight cache only, never calling the LLM.
+        Returns True if the entry now has an insight.
+        """
+        emotion = entry.mood.emotion if entry.mood else "neutral"
+        insight, source, _ = self._triage(entry, emotion, entry.get_audio_transcript())
+        if insight is None:
+            return False
+        if entry.mark_ai_processing_complete(insight, source=source):
+            self._count(source)
+        return entry.ai_processed
+
     def _process_single_entry(self, entry):
         """Process a single entry to generate AI insight."""
+        entry.reload(*MoodEntry.AI_FIELDS)
+        if entry.ai_processed:
+            return
         current_app.logger.info(f"Processing insight for entry: {entry.id}")
         
+        emotion = entry.mood.emotion if entry.mood else "neutral"
+        audio_transcript = entry.get_audio_transcript()
+        
+        # Resolve empty, trivial and repeated entries without a network call
+        insight, source, cache_key = self._triage(entry, emotion, audio_transcript)
+        if insight is not None:
+            if entry.mark_ai_processing_complete(insight, source=source):
+                self._count(source)
+                current_app.logger.info(f"Insight resolved from {source} for entry: {entry.id}")
+            return
+        
         # Check if AI service is available
         if not self.ai_service.is_available():
             raise AIServiceError("AI service not available")
         
         # Generate insight
-        insight = self.ai_service.generate_insight(
-            mood_emotion=entry.mood.emotion if entry.mood else "neutral",
-            mood_emoji=entry.mood.emoji if entry.mood else "😐",
-            text_note=entry.text_note
-        )
+        try:
+            insight = self.ai_service.generate_insight(
+                mood_emotion=emotion,
+                mood_emoji=entry.mood.emoji if entry.mood else "😐",
+                text_note=entry.text_note,
+                audio_transcript=audio_transcript,
+                user_id=entry.user.id
+            )
+            source = self.ai_service.last_source
+        except AIBudgetExceededError:
+            # The user's daily budget is spent; answer with a template rather than hold the entry
+            insight, source = get_template_insight(emotion, seed=str(entry.id)), 'template'
+        except AIServiceDegradedError:
+            raise
+        except AIServiceError:
+            self._count('failed')
+            raise
         
         # Save the insight
-        entry.mark_ai_processing_complete(insight)
-        current_app.logger.info(f"Insight generated for entry: {entry.id}")
+        if source != 'template':
+            self.insight_cache.put(cache_key, insight)
+        # Another worker may have finished (or a user regenerated) the entry meanwhile; theirs is kept
+        if entry.mark_ai_processing_complete(insight, source=source):
+            self._count(source)
+            current_app.logger.info(f"Insight generated for entry: {entry.id}")
 
 
 # Global processor instance
@@ -105,6 +226,8 @@ def get_processor(app=None):
     global _processor
     if _processor is None:
         _processor = InsightProcessor(app)
+    elif _processor.app is None and app is not None:
+        _processor.app = app
     return _processor
 
 def start_insight_processor(app=None):
@@ -112,6 +235,14 @@ def start_insight_processor(app=None):
     processor = get_processor(app)
     processor.start_processing()
 
+def get_processor_stats():
+    """Per-source insight counts, or None if the processor was never created."""
+    return _processor.get_stats() if _processor else None
+
+def get_processor_utilization():
+    """Processor busy time and cache hits, or None if the processor was never created."""
+    return _processor.get_utilization() if _processor else None
+
 def stop_insight_processor():
     """Stop the background insight processor."""
     processor = get_processor()
@@ -119,17 +250,16 @@ def stop_insight_processor():
 
 def queue_insight_generation(entry_id):
     """Queue an entry for insight generation (no-op since we use polling)."""
-    # For now, we use a polling approach where the processor checks for unprocessed entries
-    # In a production environment, you might want to use a proper task queue like Celery
+    # Unprocessed entries are the queue: `flask insights worker` polls them from the database
     try:
         current_app.logger.info(f"Entry {entry_id} queued for insight generation")
     except RuntimeError:
         print(f"Entry {entry_id} queued for insight generation")
+        return
     
-    # Ensure the processor is running
-    processor = get_processor()
-    if processor.processing_thread is None or not processor.processing_thread.is_alive():
-        processor.start_processing()
+    # Single-process setups can still run the processor inside the web process
+    if current_app.config.get('INSIGHT_EMBEDDED_WORKER', False):
+        start_insight_processor(current_app._get_current_object())
 
 def process_entry_insight_sync(entry_id, app=None):
     """Process a single entry insight synchronously (for testing/manual processing)."""
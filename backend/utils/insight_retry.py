@@ -0,0 +1,101 @@
+"""
+Retry scheduling and dead-lettering of failed insight generation.
+Transient failures (rate limits, timeouts, outages) are retried with
+exponential backoff; permanent ones and entries out of attempts are moved
+to the dead-letter collection, from where they can be requeued in bulk.
+"""
+
+import random
+import sys
+from datetime import datetime, timedelta
+from flask import current_app
+from pymongo.errors import ConnectionFailure
+
+from models.dead_letter_model import InsightDeadLetter
+from models.mood_model import MoodEntry
+from utils.ai_service import AIServiceError, AIServiceDegradedError, AIBudgetExceededError
+from utils.llm_providers import ProviderError
+
+# Errors worth retrying later, besides OpenAI's transient ones; anything else (bad request, auth, bad data) is permanent
+TRANSIENT_ERRORS = (
+    ProviderError,
+    ConnectionFailure,
+    TimeoutError,
+    ConnectionError,
+)
+
+
+def is_transient_error(error):
+    """Whether a failed generation may succeed if retried later"""
+    if isinstance(error, (AIServiceDegradedError, AIBudgetExceededError)):
+        return True
+    if isinstance(error, AIServiceError):
+        error = error.__cause__
+    if isinstance(error, TRANSIENT_ERRORS):
+        return True
+    # openai is imported lazily; if it isn't loaded yet the error cannot be one of its own
+    openai = sys.modules.get('openai')
+    return openai is not None and isinstance(error, (
+        openai.RateLimitError,
+        openai.APITimeoutError,
+        openai.APIConnectionError,
+        openai.InternalServerError,
+    ))
+
+
+def retry_delay(attempt, base_seconds=30, max_seconds=3600):
+    """Exponential backoff with jitter for the given (1-based) attempt"""
+    delay = min(max_seconds, base_seconds * 2 ** (attempt - 1))
+    return timedelta(seconds=random.uniform(delay / 2, delay))
+
+
+def record_insight_failure(entry, error):
+    """
+    Reschedule or dead-letter an entry whose insight generation raised error.
+    Returns 'retry' or 'dead', or 'done' if another writer completed the entry
+    meanwhile (a late failure never overwrites an insight).
+    """
+    config = current_app.config
+    attempts = (entry.ai_attempts or 0) + 1
+    transient = is_transient_error(error)
+
+    if transient and attempts < config.get('INSIGHT_MAX_ATTEMPTS', 5):
+        delay = retry_delay(attempts, config.get('INSIGHT_RETRY_BASE_SECONDS', 30), config.get('INSIGHT_RETRY_MAX_SECONDS', 3600))
+        if entry.schedule_ai_retry(str(error), delay):
+            current_app.logger.info(f"Insight for entry {entry.id} failed (attempt {attempts}), retrying in {delay.seconds}s: {error}")
+            return 'retry'
+        return 'done' if entry.ai_processed else 'dead'
+
+    if entry.mark_ai_processing_failed(str(error)):
+        InsightDeadLetter(
+            id=entry.id,
+            user_id=str(entry.user.id),
+            attempts=attempts,
+            error_type=type(error.__cause__ or error).__name__,
+            error_message=str(error),
+            transient=transient,
+            emotion=entry.mood.emotion if entry.mood else None,
+            has_text=bool(entry.text_note),
+            has_audio=entry.audio_file is not None,
+            created_at=datetime.utcnow()
+        ).save()
+        current_app.logger.warning(f"Insight for entry {entry.id} dead-lettered after {attempts} attempts: {error}")
+    return 'done' if entry.ai_processed else 'dead'
+
+
+def requeue_dead_letters(letters):
+    """Put the entries of a dead-letter queryset back in the retry lane. Returns the number requeued."""
+    entry_ids = [letter.id for letter in letters.only('id')]
+    if not entry_ids:
+        return 0
+    requeued = MoodEntry.objects(id__in=entry_ids, ai_processing_failed=True).update(
+        set__ai_processing_failed=False,
+        set__ai_attempts=0,
+        set__ai_priority=MoodEntry.PRIORITY_RETRY,
+        set__ai_queued_at=datetime.utcnow(),
+        unset__ai_error_message=True,
+        unset__ai_processed_at=True,
+        unset__ai_next_attempt_at=True
+    )
+    InsightDeadLetter.objects(id__in=entry_ids).delete()
+    return requeued
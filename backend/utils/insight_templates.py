@@ -0,0 +1,78 @@
+"""
+Local insight templates and cache used to resolve entries without calling the LLM.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+TEMPLATE_INSIGHTS = {
+    'happy': [
+        "It's wonderful that you're feeling happy today. Take a moment to notice what contributed to this feeling so you can return to it on harder days.",
+        "Your positive mood is worth celebrating. Sharing a bit of that energy with someone close to you can make it last even longer.",
+    ],
+    'sad': [
+        "It's okay to feel sad, and noticing it is a meaningful first step. Be gentle with yourself today and consider reaching out to someone you trust.",
+        "Sadness often signals that something matters to you. A short walk, some rest, or writing a few more words about it may help lighten the load.",
+    ],
+    'neutral': [
+        "A calm, balanced day is valuable in its own right. Use this steady moment to check in with what you need and plan something small you enjoy.",
+        "Feeling neutral can be a good time for reflection. Noticing small moments of gratitude may help you build on this sense of balance.",
+    ],
+    'angry': [
+        "Anger is a natural response when something feels unfair or out of control. Taking a few slow breaths or stepping away briefly can help you respond rather than react.",
+        "It sounds like something frustrated you today. Naming what triggered it, even privately, can make it easier to decide what you want to do next.",
+    ],
+    'anxious': [
+        "Anxiety can feel overwhelming, but you're taking a healthy step by acknowledging it. Try grounding yourself with slow breathing and focusing on one small thing you can control.",
+        "When worries pile up, writing them down can make them feel more manageable. Be kind to yourself and remember that this feeling will pass.",
+    ],
+}
+
+
+def get_template_insight(emotion, seed=''):
+    """Pick a template for an emotion, stable for the same seed (e.g. the entry id)"""
+    templates = TEMPLATE_INSIGHTS.get(emotion) or TEMPLATE_INSIGHTS['neutral']
+    index = int(hashlib.sha1(seed.encode('utf-8')).hexdigest(), 16) % len(templates)
+    return templates[index]
+
+
+class InsightCache:
+    """Small LRU cache of generated insights keyed by the normalized prompt content."""
+
+    def __init__(self, max_size=1000):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(emotion, text_note=None, audio_transcript=None):
+        # Case and spacing don't change the prompt's meaning, so they don't change the key
+        normalized = '|'.join(' '.join((part or '').lower().split()) for part in (emotion, text_note, audio_transcript))
+        return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._items:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, insight):
+        with self._lock:
+            self._items[key] = insight
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def get_stats(self):
+        with self._lock:
+            return {'size': len(self._items), 'hits': self.hits, 'misses': self.misses}
+
+    def __len__(self):
+        return len(self._items)
@@ -0,0 +1,153 @@
+"""
+Text generation backends used by MoodInsightAI.
+OpenAI chat completions, and a small quantized instruction model run on CPU
+with llama.cpp in a process pool, so insights can be generated offline.
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from importlib.util import find_spec
+from flask import current_app
+
+
+class ProviderError(Exception):
+    pass
+
+
+Completion = namedtuple('Completion', ['text', 'provider', 'prompt_tokens', 'completion_tokens', 'latency'])
+
+
+class OpenAIProvider:
+    """Chat completions against the OpenAI API."""
+
+    name = 'openai'
+
+    def __init__(self, client, model='gpt-3.5-turbo'):
+        self.client = client
+        self.model = model
+
+    def is_available(self):
+        return self.client is not None
+
+    def complete(self, messages, max_tokens, temperature=0.7):
+        started = time.monotonic()
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+        )
+        usage = response.usage
+        return Completion(
+            text=response.choices[0].message.content.strip(),
+            provider=self.name,
+            prompt_tokens=usage.prompt_tokens if usage else 0,
+            completion_tokens=usage.completion_tokens if usage else 0,
+            latency=time.monotonic() - started,
+        )
+
+
+# Model instance loaded once per worker process
+_worker_model = None
+
+def _init_worker(model_path, context_size, threads):
+    """Load the local model in a pool worker."""
+    global _worker_model
+    from llama_cpp import Llama
+    _worker_model = Llama(model_path=model_path, n_ctx=context_size, n_threads=threads, verbose=False)
+
+def _complete_in_worker(messages, max_tokens, temperature):
+    """Run a chat completion inside a pool worker."""
+    result = _worker_model.create_chat_completion(messages=messages, max_tokens=max_tokens, temperature=temperature)
+    usage = result.get('usage') or {}
+    return (
+        result['choices'][0]['message']['content'].strip(),
+        usage.get('prompt_tokens', 0),
+        usage.get('completion_tokens', 0),
+    )
+
+
+class LocalModelProvider:
+    """Quantized GGUF instruction model served by llama.cpp on a CPU process pool."""
+
+    name = 'local'
+
+    def __init__(self, model_path, workers=1, context_size=2048, threads=2, timeout=60):
+        self.model_path = model_path
+        self.workers = workers
+        self.context_size = context_size
+        self.threads = threads
+        self.timeout = timeout
+        self.executor = None
+        self._lock = threading.Lock()
+
+    def is_available(self):
+        return bool(self.model_path) and os.path.exists(self.model_path) and find_spec('llama_cpp') is not None
+
+    def _get_executor(self):
+        # Started on first use so the model is only loaded by processes that need it
+        with self._lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                    initargs=(self.model_path, self.context_size, self.threads),
+                )
+            return self.executor
+
+    def complete(self, messages, max_tokens, temperature=0.7):
+        if not self.is_available():
+            raise ProviderError("Local model is not configured")
+        started = time.monotonic()
+        future = self._get_executor().submit(_complete_in_worker, messages, max_tokens, temperature)
+        try:
+            text, prompt_tokens, completion_tokens = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise ProviderError(f"Local model did not answer within {self.timeout}s")
+        return Completion(text, self.name, prompt_tokens, completion_tokens, time.monotonic() - started)
+
+    def shutdown(self):
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Shared providers, so requests reuse the OpenAI connection pool and the local workers
+_openai_clients = {}
+_local_provider = None
+_providers_lock = threading.Lock()
+
+def get_openai_provider():
+    """OpenAI provider configured from the current app (client is None without an API key)."""
+    config = current_app.config
+    api_key = config.get('OPENAI_API_KEY')
+    client = None
+    if api_key:
+        key = (api_key, config.get('OPENAI_TIMEOUT', 15.0), config.get('OPENAI_MAX_RETRIES', 0), config.get('OPENAI_BASE_URL'))
+        with _providers_lock:
+            if key not in _openai_clients:
+                import openai  # Heavy (httpx, pydantic); only loaded once a client is needed
+                _openai_clients[key] = openai.OpenAI(api_key=key[0], timeout=key[1], max_retries=key[2], base_url=key[3])
+            client = _openai_clients[key]
+    return OpenAIProvider(client, model=config.get('OPENAI_MODEL', 'gpt-3.5-turbo'))
+
+def get_local_provider():
+    """Local model provider, or None if no model file is configured."""
+    global _local_provider
+    config = current_app.config
+    if not config.get('LOCAL_MODEL_PATH'):
+        return None
+    with _providers_lock:
+        if _local_provider is None:
+            _local_provider = LocalModelProvider(
+                config['LOCAL_MODEL_PATH'],
+                workers=config.get('LOCAL_MODEL_WORKERS', 1),
+                context_size=config.get('LOCAL_MODEL_CONTEXT', 2048),
+                threads=config.get('LOCAL_MODEL_THREADS', 2),
+                timeout=config.get('LOCAL_MODEL_TIMEOUT', 60),
+            )
+    return _local_provider
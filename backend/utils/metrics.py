@@ -0,0 +1,330 @@
+"""
+Prometheus metrics for the API.
+Request middleware records per-endpoint latency, status codes, in-flight
+requests and the time each request spent in MongoDB and in AI calls. The
+/metrics endpoint renders them, together with the insight queue, worker and
+cache gauges collected at scrape time, in the Prometheus text format; it only
+answers METRICS_TOKEN bearers and METRICS_ALLOWED_IPS.
+Values are per process; scrape every worker (or run one worker per pod).
+"""
+
+import hmac
+import ipaddress
+import threading
+import time
+from datetime import datetime
+from flask import Response, current_app, g, has_request_context, jsonify, request
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+AI_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """A metric family with one value per label combination."""
+
+    type = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def samples(self):
+        """[(sample name, labels dict, value)]"""
+        with self._lock:
+            return [(self.name, dict(zip(self.labelnames, key)), value) for key, value in self._values.items()]
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, observations = self._values.get(key, ((0,) * len(self.buckets), 0.0, 0))
+            counts = tuple(count + (value <= bound) for count, bound in zip(counts, self.buckets))
+            self._values[key] = (counts, total + value, observations + 1)
+
+    def samples(self):
+        samples = []
+        for name, labels, (counts, total, observations) in super().samples():
+            for bound, count in zip(self.buckets, counts):
+                samples.append((f'{name}_bucket', dict(labels, le=repr(float(bound))), count))
+            samples.append((f'{name}_bucket', dict(labels, le='+Inf'), observations))
+            samples.append((f'{name}_sum', labels, total))
+            samples.append((f'{name}_count', labels, observations))
+        return samples
+
+
+class MetricsRegistry:
+    """Metrics of this process plus collectors that report gauges at scrape time."""
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+        self._collected = []
+        self._collected_at = None
+        self._collect_lock = threading.Lock()
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=()):
+        return self.register(Gauge(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def collector(self, collect):
+        """Register collect(), which returns metrics built fresh for each scrape"""
+        self.collectors.append(collect)
+        return collect
+
+    def _collect(self, cache_seconds):
+        # Collectors query the database, so concurrent or frequent scrapes share one run
+        with self._collect_lock:
+            now = time.monotonic()
+            if self._collected_at is not None and now - self._collected_at < cache_seconds:
+                return self._collected
+            collected = []
+            for collect in self.collectors:
+                try:
+                    collected.extend(collect())
+                except Exception as e:
+                    current_app.logger.warning(f"Metrics collector {collect.__name__} failed: {e}")
+            self._collected, self._collected_at = collected, now
+            return collected
+
+    def render(self, cache_seconds=0):
+        metrics = list(self.metrics) + self._collect(cache_seconds)
+
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+REQUEST_LATENCY = registry.histogram('http_request_duration_seconds', 'Request latency by endpoint.', ['method', 'endpoint'])
+REQUESTS = registry.counter('http_requests_total', 'Requests by endpoint and status code.', ['method', 'endpoint', 'status'])
+IN_FLIGHT = registry.gauge('http_requests_in_flight', 'Requests being served.')
+REQUEST_MONGO_TIME = registry.histogram('http_request_mongo_seconds', 'Time a request spent waiting on MongoDB.', ['endpoint'])
+REQUEST_MONGO_QUERIES = registry.counter('http_request_mongo_queries_total', 'MongoDB commands sent by requests.', ['endpoint'])
+REQUEST_AI_TIME = registry.histogram('http_request_ai_seconds', 'Time a request spent waiting on AI completions.', ['endpoint'], AI_BUCKETS)
+AI_COMPLETIONS = registry.histogram('ai_completion_seconds', 'AI completion latency by provider.', ['provider'], AI_BUCKETS)
+
+
+def record_ai_time(seconds):
+    """Add time spent on an AI call (successful or not) to the current request"""
+    if has_request_context():
+        g.ai_seconds = g.get('ai_seconds', 0.0) + seconds
+
+
+def observe_ai_completion(completion):
+    AI_COMPLETIONS.observe(completion.latency, provider=completion.provider)
+
+
+@registry.collector
+def collect_insight_metrics():
+    """Insight queue depth per lane, dead letters and generations in progress on all workers"""
+    from models.dead_letter_model import InsightDeadLetter
+    from models.mood_model import MoodEntry
+
+    queue = Gauge('insight_queue_depth', 'Entries waiting for an insight, by lane.', ['lane'])
+    pending = MoodEntry.objects(ai_processed=False, ai_processing_failed=False).aggregate([
+        {'$group': {'_id': '$ai_priority', 'count': {'$sum': 1}}}
+    ])
+    for lane in MoodEntry.PRIORITY_NAMES.values():
+        queue.set(0, lane=lane)
+    for row in pending:
+        # Entries queued before lanes existed have no priority and are in the new lane
+        queue.inc(row['count'], lane=MoodEntry.PRIORITY_NAMES.get(row['_id'], MoodEntry.PRIORITY_NAMES[MoodEntry.PRIORITY_NEW]))
+
+    in_progress = Gauge('insight_generations_in_progress', 'Insights being generated right now by any worker (live leases).')
+    in_progress.set(MoodEntry.objects(ai_processed=False, ai_lease_expires_at__gt=datetime.utcnow()).count())
+
+    dead_letters = Gauge('insight_dead_letters', 'Entries whose insight generation was given up on.')
+    dead_letters.set(InsightDeadLetter._get_collection().estimated_document_count())
+    return [queue, in_progress, dead_letters]
+
+
+@registry.collector
+def collect_ai_budget_metrics():
+    """Site-wide AI token consumption against the global daily budget"""
+    from utils.token_budget import get_token_budget
+
+    budget = get_token_budget()
+    used = Gauge('ai_global_tokens_used_today', 'AI tokens used by all users today (UTC).')
+    used.set(budget.global_used_tokens())
+    metrics = [used]
+    if budget.global_daily:
+        limit = Gauge('ai_global_token_budget', 'Daily AI token budget shared by all users.')
+        limit.set(budget.global_daily)
+        metrics.append(limit)
+    return metrics
+
+
+@registry.collector
+def collect_worker_metrics():
+    """Utilization and cache hit ratios of the insight processor in this process, if it runs here"""
+    from utils.circuit_breaker import get_ai_breaker_stats
+    from utils.insight_processor import get_processor_stats, get_processor_utilization
+    from utils.single_flight import get_single_flight_stats
+
+    metrics = []
+    stats = get_processor_stats()
+    if stats:
+        resolved = Counter('insight_resolved_total', 'Insights resolved in this process, by source.', ['source'])
+        for source, count in stats.items():
+            resolved.inc(count, source=source)
+        metrics.append(resolved)
+
+    utilization = get_processor_utilization()
+    if utilization:
+        busy = Counter('insight_worker_busy_seconds_total', 'Time the insight processor spent processing entries.')
+        busy.inc(utilization['busy_seconds'])
+        busy_ratio = Gauge('insight_worker_utilization', 'Share of its uptime the insight processor was busy.')
+        busy_ratio.set(utilization['busy_seconds'] / utilization['uptime_seconds'] if utilization['uptime_seconds'] else 0.0)
+
+        cache_stats = utilization['cache']
+        lookups = cache_stats['hits'] + cache_stats['misses']
+        cache = Counter('insight_cache_lookups_total', 'Insight cache lookups, by result.', ['result'])
+        cache.inc(cache_stats['hits'], result='hit')
+        cache.inc(cache_stats['misses'], result='miss')
+        hit_ratio = Gauge('insight_cache_hit_ratio', 'Share of insight cache lookups that were hits.')
+        hit_ratio.set(cache_stats['hits'] / lookups if lookups else 0.0)
+        metrics += [busy, busy_ratio, cache, hit_ratio]
+
+    flights = get_single_flight_stats()
+    if flights:
+        calls = Counter('insight_single_flight_total', 'Insight generations run or coalesced with one in flight.', ['outcome'])
+        for outcome in ('leaders', 'coalesced_local', 'coalesced_remote'):
+            calls.inc(flights[outcome], outcome=outcome)
+        total = flights['leaders'] + flights['coalesced']
+        ratio = Gauge('insight_single_flight_coalesced_ratio', 'Share of insight generations served by one already in flight.')
+        ratio.set(flights['coalesced'] / total if total else 0.0)
+        metrics += [calls, ratio]
+
+    circuit = get_ai_breaker_stats()
+    if circuit:
+        circuit_open = Gauge('ai_circuit_open', 'Whether the AI circuit breaker is open (1) or half open (0.5).')
+        circuit_open.set({'open': 1, 'half_open': 0.5}.get(circuit['state'], 0))
+        metrics.append(circuit_open)
+    return metrics
+
+
+def _may_scrape(config):
+    token = config.get('METRICS_TOKEN')
+    if token and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return True
+    try:
+        address = ipaddress.ip_address(request.remote_addr or '')
+    except ValueError:
+        return False
+    for allowed in config.get('METRICS_ALLOWED_IPS') or ():
+        try:
+            if address in ipaddress.ip_network(allowed, strict=False):
+                return True
+        except ValueError:
+            continue
+    return False
+
+
+def _endpoint():
+    # The route pattern, not the path, so ids don't explode the label cardinality
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+
+def init_metrics(app):
+    """Time every request and serve the metrics at /metrics"""
+    if not app.config.get('METRICS_ENABLED', True):
+        return
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+        IN_FLIGHT.inc()
+
+    @app.after_request
+    def record_request_metrics(response):
+        started = g.get('request_started')
+        if started is None:
+            return response
+        endpoint = _endpoint()
+        REQUEST_LATENCY.observe(time.perf_counter() - started, method=request.method, endpoint=endpoint)
+        REQUESTS.inc(method=request.method, endpoint=endpoint, status=response.status_code)
+        trace = g.get('query_trace')
+        if trace is not None:
+            REQUEST_MONGO_TIME.observe(trace.total_ms / 1000, endpoint=endpoint)
+            REQUEST_MONGO_QUERIES.inc(trace.count, endpoint=endpoint)
+        if g.get('ai_seconds'):
+            REQUEST_AI_TIME.observe(g.ai_seconds, endpoint=endpoint)
+        return response
+
+    @app.teardown_request
+    def end_request_timer(error=None):
+        if g.pop('request_started', None) is not None:
+            IN_FLIGHT.dec()
+
+    @app.route('/metrics')
+    def metrics():
+        if not _may_scrape(app.config):
+            return jsonify({
+                'error': 'Forbidden',
+                'message': 'Metrics are only available to configured scrapers'
+            }), 403
+        return Response(registry.render(app.config.get('METRICS_COLLECT_CACHE_SECONDS', 5)), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,113 @@
+"""
+Password hashing on a dedicated, size-bounded process pool.
+Keeps the deliberately expensive KDF off the request threads, and sheds load
+with a 503 instead of queueing without limit when the pool is saturated.
+"""
+
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class HashingBusyError(Exception):
+    """Raised when the hashing pool has no room for another request"""
+
+    def __init__(self, retry_after=1):
+        super().__init__("Password hashing is saturated, retry later")
+        self.retry_after = retry_after
+
+
+# Parameters werkzeug fills in when a method is given without them
+DEFAULT_METHOD_PARAMS = {
+    'scrypt': 'scrypt:32768:8:1',
+    'pbkdf2': 'pbkdf2:sha256:600000',
+    'pbkdf2:sha256': 'pbkdf2:sha256:600000',
+    'pbkdf2:sha512': 'pbkdf2:sha512:600000',
+}
+
+def normalize_method(method):
+    """Expand a werkzeug hash method to the form stored in the hash prefix"""
+    return DEFAULT_METHOD_PARAMS.get(method, method)
+
+
+class PasswordHasher:
+    """Runs password hashing and verification on a bounded worker pool."""
+
+    def __init__(self, method='scrypt', workers=2, max_pending=16, queue_timeout=0.5, task_timeout=10):
+        self.method = normalize_method(method)
+        self.workers = workers
+        self.queue_timeout = queue_timeout
+        self.task_timeout = task_timeout
+        self.executor = None
+        if workers > 0:
+            self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self.max_pending = max_pending
+        self.rejected = 0
+        self._stats_lock = threading.Lock()
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            with self._stats_lock:
+                self.rejected += 1
+            raise HashingBusyError(retry_after=max(1, round(self.task_timeout / 2)))
+        if self.executor is None:
+            try:
+                return fn(*args)
+            finally:
+                self._slots.release()
+
+        try:
+            future = self.executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        # The slot is freed when the task ends, not when we stop waiting, so abandoned tasks still count
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.task_timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise HashingBusyError(retry_after=max(1, round(self.task_timeout)))
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """Check if a stored hash was made with other parameters than the configured ones"""
+        return not password_hash or password_hash.split('$', 1)[0] != self.method
+
+    def get_stats(self):
+        with self._stats_lock:
+            rejected = self.rejected
+        return {
+            'workers': self.workers,
+            'max_pending': self.max_pending,
+            'rejected': rejected,
+        }
+
+
+# Global hasher instance
+_hasher = None
+_hasher_lock = threading.Lock()
+
+def get_password_hasher():
+    """Get the global password hasher, configured from the current app."""
+    global _hasher
+    if _hasher is None:
+        with _hasher_lock:
+            if _hasher is None:
+                config = current_app.config
+                _hasher = PasswordHasher(
+                    method=config.get('PASSWORD_HASH_METHOD', 'scrypt'),
+                    workers=config.get('PASSWORD_HASH_WORKERS', 2),
+                    max_pending=config.get('PASSWORD_HASH_MAX_PENDING', 16),
+                    queue_timeout=config.get('PASSWORD_HASH_QUEUE_TIMEOUT', 0.5),
+                    task_timeout=config.get('PASSWORD_HASH_TASK_TIMEOUT', 10),
+                )
+    return _hasher
@@ -0,0 +1,187 @@
+"""
+On-demand sampling profiler for live requests and insight processing.
+A background thread samples the profiled thread's stack every few
+milliseconds; the stacks are written in the folded format that flamegraph.pl,
+speedscope and inferno read. Profiling is triggered per request by a signed
+X-Profile header, for whole endpoints by PROFILE_ENDPOINTS, or for a random
+1 in PROFILE_SAMPLE_RATE requests, and the output directory is pruned to
+PROFILE_MAX_FILES / PROFILE_MAX_AGE_HOURS.
+"""
+
+import hashlib
+import hmac
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from flask import current_app, g, request
+
+
+class SamplingProfiler:
+    """Statistical profiler of one thread, sampled from a background thread."""
+
+    def __init__(self, thread_id=None, interval=0.005):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.samples = Counter()  # stack tuple (root first) -> samples
+        self._stop = threading.Event()
+        self._thread = None
+        self.started_at = None
+        self.duration = 0.0
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.samples[tuple(reversed(stack))] += 1
+
+    def start(self):
+        self.started_at = time.monotonic()
+        self._thread = threading.Thread(target=self._sample, daemon=True, name='profiler')
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            self.duration = time.monotonic() - self.started_at
+        return self
+
+    def folded(self):
+        """Folded stacks, one 'frame;frame;frame count' line per distinct stack"""
+        return '\n'.join(f"{';'.join(stack)} {count}" for stack, count in self.samples.most_common()) + '\n'
+
+
+class ProfileStore:
+    """Directory of folded profiles, pruned by count and age after each write."""
+
+    def __init__(self, directory, max_files=100, max_age_hours=24):
+        self.directory = directory
+        self.max_files = max_files
+        self.max_age_hours = max_age_hours
+
+    def write(self, kind, name, profiler):
+        os.makedirs(self.directory, exist_ok=True)
+        slug = re.sub(r'[^A-Za-z0-9]+', '_', name).strip('_')[:80] or 'root'
+        filename = f"{datetime.utcnow():%Y%m%dT%H%M%S%f}-{kind}-{slug}-{profiler.duration * 1000:.0f}ms.folded"
+        with open(os.path.join(self.directory, filename), 'w') as f:
+            f.write(profiler.folded())
+        self.prune()
+        return filename
+
+    def prune(self):
+        # Names start with the UTC timestamp, so reverse name order is newest first
+        names = sorted((name for name in os.listdir(self.directory) if name.endswith('.folded')), reverse=True)
+        paths = [os.path.join(self.directory, name) for name in names]
+        cutoff = time.time() - self.max_age_hours * 3600
+        for index, path in enumerate(paths):
+            if index >= self.max_files or os.path.getmtime(path) < cutoff:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+def get_profile_store():
+    """Profile store configured from the current app."""
+    config = current_app.config
+    return ProfileStore(
+        config.get('PROFILE_DIR') or os.path.join(tempfile.gettempdir(), 'mood-journal-profiles'),
+        max_files=config.get('PROFILE_MAX_FILES', 100),
+        max_age_hours=config.get('PROFILE_MAX_AGE_HOURS', 24),
+    )
+
+
+def _signature(secret, method, path, expires):
+    return hmac.new(secret.encode('utf-8'), f"{method} {path} {expires}".encode('utf-8'), hashlib.sha256).hexdigest()
+
+def make_profile_token(secret, method, path, ttl_seconds=600):
+    """X-Profile header value that profiles requests to method + path until it expires"""
+    expires = int(time.time()) + ttl_seconds
+    return f"{expires}.{_signature(secret, method.upper(), path, expires)}"
+
+def verify_profile_token(secret, token, method, path):
+    try:
+        expires, signature = token.split('.', 1)
+        if int(expires) < time.time():
+            return False
+    except ValueError:
+        return False
+    return hmac.compare_digest(signature, _signature(secret, method.upper(), path, expires))
+
+
+def _sampled(rate):
+    return bool(rate) and random.randrange(rate) == 0
+
+
+@contextmanager
+def sampled_profile(kind, name, sample_rate):
+    """Profile the block for 1 in sample_rate calls (0 = never) and store the result"""
+    if not _sampled(sample_rate):
+        yield None
+        return
+    profiler = SamplingProfiler(interval=current_app.config.get('PROFILE_INTERVAL_MS', 5) / 1000).start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        try:
+            get_profile_store().write(kind, name, profiler)
+        except OSError as e:
+            current_app.logger.warning(f"Could not write {kind} profile: {e}")
+
+
+def _wants_profile(config):
+    secret = config.get('PROFILE_SECRET')
+    token = request.headers.get('X-Profile')
+    if token and secret and verify_profile_token(secret, token, request.method, request.path):
+        return True
+    endpoints = config.get('PROFILE_ENDPOINTS') or ()
+    if request.url_rule and ('*' in endpoints or request.url_rule.rule in endpoints):
+        return True
+    return _sampled(config.get('PROFILE_SAMPLE_RATE', 0))
+
+
+def init_profiling(app):
+    """Profile the requests selected by header, endpoint or sampling"""
+    config = app.config
+    if not (config.get('PROFILE_SECRET') or config.get('PROFILE_ENDPOINTS') or config.get('PROFILE_SAMPLE_RATE')):
+        return
+
+    @app.before_request
+    def start_profiler():
+        if _wants_profile(config):
+            g.profiler = SamplingProfiler(interval=config.get('PROFILE_INTERVAL_MS', 5) / 1000).start()
+
+    @app.after_request
+    def write_profile(response):
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return response
+        profiler.stop()
+        try:
+            name = f"{request.method} {request.url_rule.rule if request.url_rule else request.path}"
+            response.headers['X-Profile-Id'] = get_profile_store().write('request', name, profiler)
+        except OSError as e:
+            current_app.logger.warning(f"Could not write request profile: {e}")
+        return response
+
+    @app.teardown_request
+    def stop_profiler(error=None):
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.stop()
@@ -0,0 +1,178 @@
+"""
+Per-request MongoDB query instrumentation.
+A pymongo CommandListener records every command a thread sends while a trace
+is active. Each request is traced to log its query count and slow queries,
+and tests use record_queries() to assert a query budget and that no query
+falls back to a collection scan (checked with explain, on demand).
+"""
+
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from flask import current_app, g, request
+from pymongo import monitoring
+from mongoengine.connection import get_connection
+
+
+# Handshake, auth and session housekeeping, plus our own explains
+IGNORED_COMMANDS = {'isMaster', 'ismaster', 'hello', 'ping', 'buildInfo', 'saslStart', 'saslContinue', 'endSessions', 'explain'}
+
+# Commands that have a query plan worth checking
+EXPLAINABLE_COMMANDS = {'find', 'aggregate', 'count', 'distinct', 'update', 'delete', 'findAndModify'}
+
+# Fields the driver adds to a command that the explain command rejects
+DRIVER_FIELDS = {'lsid', '$db', '$clusterTime', '$readPreference', 'txnNumber', 'readConcern', 'writeConcern'}
+
+Query = namedtuple('Query', ['command_name', 'database', 'collection', 'command', 'duration_ms', 'failed'])
+
+
+def plan_stages(explain_result):
+    """Every stage name in the winning plan(s) of an explain result, whatever its shape"""
+    stages = []
+
+    def walk(node, in_plan):
+        if isinstance(node, dict):
+            if in_plan and 'stage' in node:
+                stages.append(node['stage'])
+            for key, value in node.items():
+                walk(value, in_plan or key == 'winningPlan')
+        elif isinstance(node, list):
+            for item in node:
+                walk(item, in_plan)
+
+    walk(explain_result, False)
+    return stages
+
+
+class QueryTrace:
+    """Queries sent by one thread between start and end of a trace."""
+
+    def __init__(self):
+        self.queries = []
+        self._plans = None
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def total_ms(self):
+        return sum(query.duration_ms for query in self.queries)
+
+    def slow_queries(self, threshold_ms):
+        return [query for query in self.queries if query.duration_ms >= threshold_ms]
+
+    def plans(self):
+        """[(query, winning plan stages)] for the explainable queries, explained once"""
+        if self._plans is None:
+            self._plans = []
+            for query in self.queries:
+                if query.command is None or query.failed:
+                    continue
+                command = {key: value for key, value in query.command.items() if key not in DRIVER_FIELDS}
+                result = get_connection()[query.database].command('explain', command, verbosity='queryPlanner')
+                self._plans.append((query, plan_stages(result)))
+        return self._plans
+
+    def collscans(self):
+        return [query for query, stages in self.plans() if 'COLLSCAN' in stages]
+
+    def assert_no_collscan(self):
+        scans = self.collscans()
+        assert not scans, "Collection scan in: " + '; '.join(f"{query.command_name} on {query.collection}" for query in scans)
+
+    def assert_max_queries(self, limit):
+        assert self.count <= limit, f"{self.count} queries, expected at most {limit}: " + ', '.join(
+            f"{query.command_name} {query.collection}" for query in self.queries)
+
+
+class QueryListener(monitoring.CommandListener):
+    """Feeds commands to the traces active on the sending thread. Events fire on that thread."""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def _traces(self):
+        if not hasattr(self._local, 'traces'):
+            self._local.traces = []
+            self._local.pending = {}
+        return self._local.traces
+
+    def start_trace(self):
+        trace = QueryTrace()
+        self._traces().append(trace)
+        return trace
+
+    def end_trace(self, trace):
+        traces = self._traces()
+        if trace in traces:
+            traces.remove(trace)
+        if not traces:
+            self._local.pending.clear()
+
+    def started(self, event):
+        if not self._traces() or event.command_name in IGNORED_COMMANDS:
+            return
+        command = event.command
+        collection = command.get('collection') if event.command_name == 'getMore' else command.get(event.command_name)
+        self._local.pending[event.request_id] = (
+            event.database_name,
+            collection if isinstance(collection, str) else None,
+            dict(command) if event.command_name in EXPLAINABLE_COMMANDS else None,
+        )
+
+    def _finished(self, event, failed):
+        pending = getattr(self._local, 'pending', None)
+        if not pending or event.request_id not in pending:
+            return
+        database, collection, command = pending.pop(event.request_id)
+        query = Query(event.command_name, database, collection, command, event.duration_micros / 1000, failed)
+        for trace in self._local.traces:
+            trace.queries.append(query)
+
+    def succeeded(self, event):
+        self._finished(event, False)
+
+    def failed(self, event):
+        self._finished(event, True)
+
+
+# Registered on the MongoClient by utils.database.connection_settings
+query_listener = QueryListener()
+
+
+@contextmanager
+def record_queries():
+    """Trace the queries this thread sends inside the block, including those of test client requests"""
+    trace = query_listener.start_trace()
+    try:
+        yield trace
+    finally:
+        query_listener.end_trace(trace)
+
+
+def init_query_guard(app):
+    """Trace every request; log its query count, slow queries and (if QUERY_EXPLAIN) collection scans"""
+
+    @app.before_request
+    def start_query_trace():
+        g.query_trace = query_listener.start_trace()
+
+    @app.teardown_request
+    def end_query_trace(error=None):
+        trace = g.pop('query_trace', None)
+        if trace is None:
+            return
+        query_listener.end_trace(trace)
+
+        config = current_app.config
+        if config.get('QUERY_LOG_REQUESTS', True) and trace.count:
+            current_app.logger.info(f"{request.method} {request.path}: {trace.count} queries in {trace.total_ms:.1f} ms")
+        for query in trace.slow_queries(config.get('MONGODB_SLOW_QUERY_MS', 100)):
+            current_app.logger.warning(f"Slow query on {request.method} {request.path}: {query.command_name} {query.collection} took {query.duration_ms:.1f} ms")
+        if config.get('QUERY_EXPLAIN'):
+            try:
+                for query in trace.collscans():
+                    current_app.logger.warning(f"Collection scan on {request.method} {request.path}: {query.command_name} {query.collection} {query.command}")
+            except Exception as e:
+                current_app.logger.warning(f"Could not explain queries of {request.path}: {e}")
@@ -0,0 +1,116 @@
+"""
+Single-flight insight generation.
+Concurrent requests for the same entry share one in-flight generation:
+threads of this process wait on the leader, other processes are kept out
+by a short lease stored on the MoodEntry.
+"""
+
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from flask import current_app
+
+from models.mood_model import MoodEntry
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class InsightSingleFlight:
+    """Deduplicates concurrent insight generation per entry."""
+
+    def __init__(self, lease_ttl=timedelta(seconds=60), wait_timeout=30.0, poll_interval=0.5):
+        self.lease_ttl = lease_ttl
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.stats = {'leaders': 0, 'coalesced_local': 0, 'coalesced_remote': 0}
+
+    def _bump(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['in_flight'] = len(self._calls)
+        stats['coalesced'] = stats['coalesced_local'] + stats['coalesced_remote']
+        return stats
+
+    def run(self, entry, generate, wait=True):
+        """
+        Run generate() for the entry unless a generation is already in flight.
+        Followers wait for the leader (if wait is True) and read the outcome from
+        the entry; only the leader sees, and records, a failed generation.
+        Returns True if this call ran generate().
+        """
+        with self._lock:
+            call = self._calls.get(entry.id)
+            leader = call is None
+            if leader:
+                call = self._calls[entry.id] = _Call()
+
+        if not leader:
+            self._bump('coalesced_local')
+            if wait:
+                call.done.wait(self.wait_timeout)
+            return False
+
+        try:
+            owner = uuid.uuid4().hex
+            if not entry.acquire_ai_lease(owner, self.lease_ttl):
+                # Another process is generating this insight
+                self._bump('coalesced_remote')
+                if wait:
+                    self._wait_for_remote(entry)
+                return False
+
+            self._bump('leaders')
+            try:
+                generate()
+                return True
+            finally:
+                entry.release_ai_lease(owner)
+        finally:
+            with self._lock:
+                self._calls.pop(entry.id, None)
+            call.done.set()
+
+    def _wait_for_remote(self, entry):
+        """Poll until the other process finishes or its lease lapses"""
+        deadline = time.monotonic() + self.wait_timeout
+        while time.monotonic() < deadline:
+            state = MoodEntry.objects(id=entry.id).only(
+                'ai_processed', 'ai_processing_failed', 'ai_lease_expires_at'
+            ).first()
+            if state is None or state.ai_processed or state.ai_processing_failed:
+                return
+            if state.ai_lease_expires_at is None or state.ai_lease_expires_at < datetime.utcnow():
+                return
+            time.sleep(self.poll_interval)
+
+
+# Global single-flight instance
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+def get_single_flight():
+    """Get the global single-flight coordinator, configured from the current app."""
+    global _single_flight
+    if _single_flight is None:
+        with _single_flight_lock:
+            if _single_flight is None:
+                config = current_app.config
+                _single_flight = InsightSingleFlight(
+                    lease_ttl=config.get('INSIGHT_LEASE_TTL', timedelta(seconds=60)),
+                    wait_timeout=config.get('INSIGHT_SINGLE_FLIGHT_WAIT', 30.0),
+                )
+    return _single_flight
+
+def get_single_flight_stats():
+    """Coalescing counters, or None if nothing has been generated yet."""
+    return _single_flight.get_stats() if _single_flight else None
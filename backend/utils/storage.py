@@ -0,0 +1,270 @@
+"""
+Storage backends for audio files.
+A backend stores opaque keys such as "ab/cd/<sha256>" either on local disk
+or in an S3-compatible bucket, so several nodes can share the same audio.
+"""
+
+import os
+import shutil
+import tempfile
+from abc import ABC, abstractmethod
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from flask import current_app, Response
+
+
+StoredObject = namedtuple('StoredObject', ['key', 'size', 'modified_at'])
+
+
+class StorageError(Exception):
+    pass
+
+
+class StorageBackend(ABC):
+    """Interface shared by all storage drivers."""
+
+    supports_presigned_urls = False
+
+    @abstractmethod
+    def put_file(self, key, source_path, content_type=None):
+        """Store a local file under key. The source file is consumed."""
+
+    @abstractmethod
+    def open(self, key):
+        """Open a stored object as a readable binary stream."""
+
+    @abstractmethod
+    def get_range(self, key, start, end):
+        """Read bytes [start, end) of a stored object."""
+
+    @abstractmethod
+    def size(self, key):
+        """Size of a stored object in bytes."""
+
+    @abstractmethod
+    def exists(self, key):
+        """Check if an object is stored under key."""
+
+    @abstractmethod
+    def delete(self, key):
+        """Delete a stored object. Returns False if it did not exist."""
+
+    @abstractmethod
+    def iter_objects(self, prefix=''):
+        """Yield a StoredObject for every stored key starting with prefix."""
+
+    def iter_keys(self, prefix=''):
+        """Yield every stored key starting with prefix."""
+        for obj in self.iter_objects(prefix):
+            yield obj.key
+
+    def presigned_url(self, key, expires_in=900, content_type=None, filename=None):
+        """Time-limited URL clients can fetch directly, or None if unsupported."""
+        return None
+
+    def local_path(self, key):
+        """Path of the object on local disk, or None for remote backends."""
+        return None
+
+    @contextmanager
+    def local_copy(self, key):
+        """Yield a local file path with the object's content, downloading it if needed."""
+        path = self.local_path(key)
+        if path:
+            yield path
+            return
+
+        fd, temp_path = tempfile.mkstemp(prefix='audio-', dir=get_temp_dir())
+        try:
+            with os.fdopen(fd, 'wb') as out, self.open(key) as src:
+                shutil.copyfileobj(src, out)
+            yield temp_path
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+
+class LocalStorage(StorageBackend):
+    """Stores objects as files below a root directory."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, key):
+        path = os.path.normpath(os.path.join(self.root, key))
+        if not path.startswith(os.path.normpath(self.root) + os.sep):
+            raise StorageError(f"Invalid storage key: {key}")
+        return path
+
+    def put_file(self, key, source_path, content_type=None):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(source_path, path)
+
+    def open(self, key):
+        return open(self._path(key), 'rb')
+
+    def get_range(self, key, start, end):
+        with self.open(key) as f:
+            f.seek(start)
+            return f.read(end - start)
+
+    def size(self, key):
+        return os.path.getsize(self._path(key))
+
+    def exists(self, key):
+        return os.path.exists(self._path(key))
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def iter_objects(self, prefix=''):
+        # Walk only the directory that can contain the prefix
+        base = os.path.dirname(prefix)
+        start = os.path.join(self.root, base) if base else self.root
+        for dirpath, dirnames, filenames in os.walk(start):
+            dirnames.sort()
+            for name in sorted(filenames):
+                path = os.path.join(dirpath, name)
+                key = os.path.relpath(path, self.root).replace(os.sep, '/')
+                if not key.startswith(prefix):
+                    continue
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield StoredObject(key, stat.st_size, datetime.fromtimestamp(stat.st_mtime, timezone.utc))
+
+    def local_path(self, key):
+        return self._path(key)
+
+
+class S3Storage(StorageBackend):
+    """Stores objects in an S3-compatible bucket (AWS S3, MinIO, ...)."""
+
+    supports_presigned_urls = True
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, region=None, client=None):
+        if client is None:
+            try:
+                import boto3
+            except ImportError:
+                raise StorageError("boto3 is required for the S3 storage backend")
+            client = boto3.client('s3', endpoint_url=endpoint_url, region_name=region)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def _key(self, key):
+        return f"{self.prefix}{key}"
+
+    def _is_missing(self, error):
+        return error.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound')
+
+    def put_file(self, key, source_path, content_type=None):
+        extra = {'ContentType': content_type} if content_type else None
+        self.client.upload_file(source_path, self.bucket, self._key(key), ExtraArgs=extra)
+        os.remove(source_path)
+
+    def open(self, key):
+        return self.client.get_object(Bucket=self.bucket, Key=self._key(key))['Body']
+
+    def get_range(self, key, start, end):
+        response = self.client.get_object(Bucket=self.bucket, Key=self._key(key), Range=f"bytes={start}-{end - 1}")
+        return response['Body'].read()
+
+    def size(self, key):
+        return self.client.head_object(Bucket=self.bucket, Key=self._key(key))['ContentLength']
+
+    def exists(self, key):
+        from botocore.exceptions import ClientError
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+            return True
+        except ClientError as e:
+            if self._is_missing(e):
+                return False
+            raise
+
+    def delete(self, key):
+        if not self.exists(key):
+            return False
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+        return True
+
+    def iter_objects(self, prefix=''):
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix)):
+            for obj in page.get('Contents', []):
+                yield StoredObject(obj['Key'][len(self.prefix):], obj['Size'], obj['LastModified'])
+
+    def presigned_url(self, key, expires_in=900, content_type=None, filename=None):
+        params = {'Bucket': self.bucket, 'Key': self._key(key)}
+        if content_type:
+            params['ResponseContentType'] = content_type
+        if filename:
+            params['ResponseContentDisposition'] = f'inline; filename="{filename}"'
+        return self.client.generate_presigned_url('get_object', Params=params, ExpiresIn=expires_in)
+
+
+def get_temp_dir():
+    """Local scratch directory for uploads and downloads in progress"""
+    temp_dir = os.path.join(current_app.config.get('UPLOAD_FOLDER', 'uploads'), 'tmp')
+    os.makedirs(temp_dir, exist_ok=True)
+    return temp_dir
+
+
+def create_storage(config):
+    """Build the storage backend selected by AUDIO_STORAGE_BACKEND"""
+    backend = config.get('AUDIO_STORAGE_BACKEND', 'local')
+    if backend == 'local':
+        return LocalStorage(os.path.join(config.get('UPLOAD_FOLDER', 'uploads'), 'audio'))
+    if backend == 's3':
+        if not config.get('S3_BUCKET'):
+            raise StorageError("S3_BUCKET must be set for the S3 storage backend")
+        return S3Storage(
+            bucket=config['S3_BUCKET'],
+            prefix=config.get('S3_PREFIX', 'audio/'),
+            endpoint_url=config.get('S3_ENDPOINT_URL'),
+            region=config.get('S3_REGION'),
+        )
+    raise StorageError(f"Unknown storage backend: {backend}")
+
+
+def get_storage():
+    """Get the storage backend of the current app, creating it on first use"""
+    storage = current_app.extensions.get('audio_storage')
+    if storage is None:
+        storage = create_storage(current_app.config)
+        current_app.extensions['audio_storage'] = storage
+    return storage
+
+
+def stream_response(storage, key, mimetype, range_header=None, chunk_size=64 * 1024):
+    """Stream a stored object through Flask, honouring a single byte range"""
+    total = storage.size(key)
+
+    if range_header and range_header.units == 'bytes' and len(range_header.ranges) == 1:
+        content_range = range_header.make_content_range(total)
+        if content_range is None:
+            return Response(status=416, headers={'Content-Range': f'bytes */{total}'})
+        data = storage.get_range(key, content_range.start, content_range.stop)
+        return Response(data, status=206, mimetype=mimetype, headers={
+            'Content-Range': content_range.to_header(),
+            'Accept-Ranges': 'bytes',
+        })
+
+    def generate():
+        with storage.open(key) as body:
+            for chunk in iter(lambda: body.read(chunk_size), b''):
+                yield chunk
+
+    return Response(generate(), mimetype=mimetype, headers={
+        'Content-Length': str(total),
+        'Accept-Ranges': 'bytes',
+    })
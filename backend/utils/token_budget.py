@@ -0,0 +1,92 @@
+"""
+Token usage ledger and daily budgets for AI calls.
+Every completion is recorded per user and globally; as a budget runs low the
+requested max_tokens and the prompt detail shrink, and once it is spent only
+the local model (if any) is used.
+"""
+
+from collections import namedtuple
+from datetime import datetime
+from flask import current_app
+
+from models.usage_model import TokenUsage, GLOBAL_SCOPE
+
+
+# detail is 'full', 'brief' or 'minimal'; exhausted means OpenAI must not be called
+BudgetPlan = namedtuple('BudgetPlan', ['max_tokens', 'detail', 'exhausted'])
+
+
+def today():
+    return datetime.utcnow().strftime('%Y-%m-%d')
+
+
+class TokenBudget:
+    """Daily per-user and global token budgets backed by the TokenUsage ledger."""
+
+    def __init__(self, user_daily=20000, global_daily=1000000, shrink_below=0.2):
+        self.user_daily = user_daily
+        self.global_daily = global_daily
+        self.shrink_below = shrink_below
+
+    def _usage(self, scope, day=None):
+        return TokenUsage.objects(id=f"{day or today()}:{scope}").first()
+
+    def _remaining_fraction(self, scope, budget):
+        if not budget:
+            return 1.0
+        usage = self._usage(scope)
+        used = usage.total_tokens if usage else 0
+        return max(0.0, 1.0 - used / budget)
+
+    def remaining_fraction(self, user_id=None):
+        """Share of today's tightest applicable budget that is left (1.0 when unlimited)"""
+        fraction = self._remaining_fraction(GLOBAL_SCOPE, self.global_daily)
+        if user_id:
+            fraction = min(fraction, self._remaining_fraction(str(user_id), self.user_daily))
+        return fraction
+
+    def plan(self, user_id, max_tokens):
+        """Scale a call's max_tokens and prompt detail to the budget left"""
+        fraction = self.remaining_fraction(user_id)
+        if fraction <= 0:
+            return BudgetPlan(max_tokens, 'brief', True)
+        if fraction < self.shrink_below / 4:
+            return BudgetPlan(max(32, max_tokens // 4), 'minimal', False)
+        if fraction < self.shrink_below:
+            return BudgetPlan(max(32, max_tokens // 2), 'brief', False)
+        return BudgetPlan(max_tokens, 'full', False)
+
+    def record(self, user_id, completion):
+        """Add a completion to the user's and the global ledger for today"""
+        day = today()
+        TokenUsage.record(day, GLOBAL_SCOPE, completion)
+        if user_id:
+            TokenUsage.record(day, str(user_id), completion)
+
+    def report(self, user_id, days=7):
+        """The user's consumption today against their budget plus their recent history"""
+        usage = self._usage(str(user_id))
+        used = usage.total_tokens if usage else 0
+        history = TokenUsage.objects(scope=str(user_id)).order_by('-day').limit(days)
+        return {
+            'day': today(),
+            'used_tokens': used,
+            'budget': self.user_daily or None,
+            'remaining_tokens': max(0, self.user_daily - used) if self.user_daily else None,
+            'history': [day.to_dict() for day in history],
+        }
+
+    def global_used_tokens(self):
+        """Tokens used by everyone today; operators only, exported through /metrics"""
+        usage = self._usage(GLOBAL_SCOPE)
+        return usage.total_tokens if usage else 0
+
+
+def get_token_budget():
+    """Token budget configured from the current app."""
+    config = current_app.config
+    return TokenBudget(
+        user_daily=config.get('AI_USER_DAILY_TOKEN_BUDGET', 20000),
+        global_daily=config.get('AI_GLOBAL_DAILY_TOKEN_BUDGET', 1000000),
+        shrink_below=config.get('AI_BUDGET_SHRINK_BELOW', 0.2),
+    )
@@ -0,0 +1,276 @@
+"""
+Local speech-to-text transcription of voice notes.
+Uploads are marked pending by the web tier; the insight worker polls for them
+and runs a CPU speech recognition model (faster-whisper) in a process pool so
+transcription never holds the GIL of the insight processor.
+"""
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from flask import current_app
+
+from models.mood_model import MoodEntry
+from utils.file_handler import AudioFileHandler
+from utils.storage import get_storage, get_temp_dir
+
+
+class TranscriptionError(Exception):
+    pass
+
+
+class TranscriptionUnavailable(TranscriptionError):
+    pass
+
+
+# Model instance loaded once per worker process
+_worker_model = None
+
+def _init_worker(model_name, compute_type, cpu_threads):
+    """Load the speech recognition model in a pool worker."""
+    global _worker_model
+    try:
+        from faster_whisper import WhisperModel
+    except ImportError:
+        _worker_model = None
+        return
+    _worker_model = WhisperModel(model_name, device='cpu', compute_type=compute_type, cpu_threads=cpu_threads)
+
+def _transcribe_in_worker(file_path, language=None):
+    """Transcribe an audio file inside a pool worker."""
+    if _worker_model is None:
+        raise TranscriptionUnavailable("faster-whisper not installed")
+
+    started = time.monotonic()
+    segments, info = _worker_model.transcribe(file_path, language=language, vad_filter=True)
+    text = ' '.join(segment.text.strip() for segment in segments).strip()
+    return {
+        'text': text,
+        'language': info.language,
+        'audio_seconds': info.duration,
+        'processing_seconds': time.monotonic() - started,
+    }
+
+
+class TranscriptionService:
+    """Claims pending voice notes, queues them onto a transcription process pool and records results."""
+
+    def __init__(self, app, max_workers=1, poll_interval=5.0):
+        self.app = app
+        self.max_workers = max_workers
+        self.poll_interval = poll_interval
+        self.executor = ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(
+                app.config.get('TRANSCRIPTION_MODEL', 'base'),
+                app.config.get('TRANSCRIPTION_COMPUTE_TYPE', 'int8'),
+                app.config.get('TRANSCRIPTION_CPU_THREADS', 2),
+            ),
+        )
+        self.stats = {
+            'queued': 0,
+            'completed': 0,
+            'failed': 0,
+            'unavailable': 0,
+            'audio_seconds': 0.0,
+            'processing_seconds': 0.0,
+        }
+        self.fetcher = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='transcription-fetch')
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start polling for pending voice notes in a background thread."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._poll, daemon=True, name='transcription')
+            self._thread.start()
+
+    def stop(self):
+        """Stop polling; voice notes already in the pool are still finished."""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _poll(self):
+        while not self._stop_event.is_set():
+            with self.app.app_context():
+                try:
+                    wait = current_app.config.get('TRANSCRIPTION_WAIT_TIMEOUT')
+                    fail_stale_transcriptions(wait)
+                    self.queue_pending(wait)
+                except Exception as e:
+                    current_app.logger.error(f"Error in transcription loop: {e}")
+            self._stop_event.wait(self.poll_interval)
+
+    def queue_pending(self, wait=None):
+        """
+        Claim pending voice notes uploaded within wait (a timedelta) and queue them,
+        keeping at most two per pool worker in flight. Returns how many were queued.
+        """
+        with self._lock:
+            free = self.max_workers * 2 - self.in_flight
+        if free <= 0:
+            return 0
+
+        now = datetime.utcnow()
+        pending = MoodEntry.objects(audio_file__transcript_status='pending', audio_file__transcript_claimed_at=None)
+        if wait:
+            pending = pending.filter(audio_file__uploaded_timestamp__gte=now - wait)
+
+        queued = 0
+        for entry in pending.only('audio_file').order_by('audio_file.uploaded_timestamp').limit(free):
+            # Worker processes poll concurrently; only the one whose claim lands transcribes the note
+            claimed = MoodEntry.objects(
+                id=entry.id, audio_file__filename=entry.audio_file.filename, audio_file__transcript_claimed_at=None
+            ).update_one(set__audio_file__transcript_claimed_at=now)
+            if claimed:
+                self.queue(entry.id, entry.audio_file)
+                queued += 1
+        return queued
+
+    def queue(self, entry_id, audio_file):
+        """Schedule transcription of an entry's voice note."""
+        filename = audio_file.filename
+        key = AudioFileHandler.get_stored_key(audio_file)
+        with self._lock:
+            self.stats['queued'] += 1
+            self.in_flight += 1
+
+        file_path = get_storage().local_path(key)
+        if file_path is not None:
+            return self._submit(entry_id, filename, file_path)
+        # Remote backends need a local copy the worker process can read; fetch it off the request thread
+        return self.fetcher.submit(self._fetch_and_submit, entry_id, filename, key)
+
+    def _fetch_and_submit(self, entry_id, filename, key):
+        with self.app.app_context():
+            fd, temp_path = tempfile.mkstemp(prefix='transcribe-', dir=get_temp_dir())
+            try:
+                with os.fdopen(fd, 'wb') as out, get_storage().open(key) as src:
+                    shutil.copyfileobj(src, out)
+            except Exception as e:
+                os.remove(temp_path)
+                current_app.logger.warning(f"Could not fetch audio for transcription of entry {entry_id}: {e}")
+                with self._lock:
+                    self.in_flight -= 1
+                self._record('failed')
+                self._update_entry(entry_id, filename, transcript_status='failed', transcript_error=str(e))
+                return None
+        return self._submit(entry_id, filename, temp_path, temp_path)
+
+    def _submit(self, entry_id, filename, file_path, temp_path=None):
+        future = self.executor.submit(_transcribe_in_worker, os.path.abspath(file_path), self.app.config.get('TRANSCRIPTION_LANGUAGE'))
+        future.add_done_callback(lambda f: self._on_done(f, entry_id, filename, temp_path))
+        return future
+
+    def get_stats(self):
+        """Throughput and queue depth metrics for sizing the pool per node."""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['queue_depth'] = self.in_flight
+        stats['workers'] = self.max_workers
+        stats['realtime_factor'] = round(stats['audio_seconds'] / stats['processing_seconds'], 2) if stats['processing_seconds'] else None
+        return stats
+
+    def _on_done(self, future, entry_id, filename, temp_path=None):
+        with self._lock:
+            self.in_flight -= 1
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+        with self.app.app_context():
+            try:
+                result = future.result()
+            except TranscriptionUnavailable as e:
+                self._record('unavailable')
+                self._update_entry(entry_id, filename, transcript_status='unavailable', transcript_error=str(e))
+                return
+            except Exception as e:
+                current_app.logger.warning(f"Transcription failed for entry {entry_id}: {e}")
+                self._record('failed')
+                self._update_entry(entry_id, filename, transcript_status='failed', transcript_error=str(e))
+                return
+
+            self._record('completed', result['audio_seconds'], result['processing_seconds'])
+            self._update_entry(
+                entry_id, filename,
+                transcript=result['text'],
+                transcript_language=result['language'],
+                transcript_status='done',
+            )
+            current_app.logger.info(
+                f"Voice note transcribed for entry {entry_id}: "
+                f"{result['audio_seconds']:.1f}s audio in {result['processing_seconds']:.1f}s"
+            )
+
+    def _record(self, outcome, audio_seconds=0.0, processing_seconds=0.0):
+        with self._lock:
+            self.stats[outcome] += 1
+            self.stats['audio_seconds'] += audio_seconds
+            self.stats['processing_seconds'] += processing_seconds
+
+    def _update_entry(self, entry_id, filename, **fields):
+        """Store the transcript only if the entry still references the same audio file."""
+        updates = {f'set__audio_file__{key}': value for key, value in fields.items()}
+        updates['set__audio_file__transcribed_at'] = datetime.utcnow()
+        return MoodEntry.objects(id=entry_id, audio_file__filename=filename).update_one(**updates)
+
+
+# Global transcription service instance
+_service = None
+
+def get_transcription_service(app=None):
+    """Get the global transcription service instance."""
+    global _service
+    if _service is None:
+        app = app or current_app._get_current_object()
+        _service = TranscriptionService(
+            app,
+            max_workers=app.config.get('TRANSCRIPTION_WORKERS', 1),
+            poll_interval=app.config.get('TRANSCRIPTION_POLL_INTERVAL', 5.0)
+        )
+    return _service
+
+def start_transcription_worker(app):
+    """Transcribe pending voice notes in this process; for the insight worker, never the web tier."""
+    if not app.config.get('TRANSCRIPTION_ENABLED', False):
+        return None
+    service = get_transcription_service(app)
+    service.start()
+    app.logger.info("Transcription worker started")
+    return service
+
+def stop_transcription_worker():
+    """Stop polling for voice notes, if the worker was started."""
+    if _service:
+        _service.stop()
+
+def fail_stale_transcriptions(wait):
+    """
+    Mark transcripts pending for longer than wait (a timedelta) as failed.
+    Claimed transcriptions live in one process's pool and are lost when it exits,
+    so this runs at startup and on every poll to stop such entries waiting forever.
+    """
+    cutoff = datetime.utcnow() - wait
+    failed = MoodEntry.objects(audio_file__transcript_status='pending', audio_file__uploaded_timestamp__lt=cutoff).update(
+        set__audio_file__transcript_status='failed',
+        set__audio_file__transcript_error='Transcription was interrupted',
+        set__audio_file__transcribed_at=datetime.utcnow()
+    )
+    if failed:
+        current_app.logger.warning(f"Marked {failed} interrupted transcriptions as failed")
+    return failed
+
+def get_transcription_stats():
+    """Metrics of the transcription pool, or None if it was never started."""
+    return _service.get_stats() if _service else None
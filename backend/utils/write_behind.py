@@ -0,0 +1,108 @@
+"""
+Write-behind buffer for low-value bookkeeping fields (e.g. User.last_login).
+Updates are coalesced per document in memory and flushed periodically as a
+single unordered bulk_write of $set operations.
+"""
+
+import atexit
+import threading
+from flask import current_app
+from pymongo import UpdateOne
+
+
+class WriteBehindBuffer:
+    """Coalesces field updates per document and flushes them in bulk."""
+
+    def __init__(self, flush_interval=5.0, max_pending=1000, logger=None):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.logger = logger
+        self._pending = {}  # (document class, id) -> {field: value}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self.stats = {'buffered': 0, 'flushed_ops': 0, 'flushes': 0, 'errors': 0}
+
+    def set(self, document_cls, doc_id, **fields):
+        """Buffer a $set of fields on one document; later values replace earlier ones."""
+        with self._lock:
+            self._pending.setdefault((document_cls, doc_id), {}).update(fields)
+            self.stats['buffered'] += 1
+            pending = len(self._pending)
+        self._ensure_running()
+        if pending >= self.max_pending:
+            self._wakeup.set()
+
+    def flush(self):
+        """Write all buffered updates now. Returns the number of operations written."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        by_class = {}
+        for (document_cls, doc_id), fields in pending.items():
+            db_fields = {document_cls._fields[name].db_field: value for name, value in fields.items()}
+            by_class.setdefault(document_cls, []).append(UpdateOne({'_id': doc_id}, {'$set': db_fields}))
+
+        written = 0
+        for document_cls, operations in by_class.items():
+            try:
+                document_cls._get_collection().bulk_write(operations, ordered=False)
+                written += len(operations)
+            except Exception as e:
+                self.stats['errors'] += 1
+                if self.logger:
+                    self.logger.error(f"Write-behind flush failed for {document_cls.__name__}: {e}")
+                self._requeue(document_cls, pending)
+
+        self.stats['flushes'] += 1
+        self.stats['flushed_ops'] += written
+        return written
+
+    def _requeue(self, document_cls, pending):
+        """Put failed updates back without overwriting newer buffered values"""
+        with self._lock:
+            for (cls, doc_id), fields in pending.items():
+                if cls is document_cls:
+                    merged = dict(fields)
+                    merged.update(self._pending.get((cls, doc_id), {}))
+                    self._pending[(cls, doc_id)] = merged
+
+    def _ensure_running(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._loop, daemon=True, name='write-behind')
+                    self._thread.start()
+
+    def _loop(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+        self.flush()
+
+
+# Global buffer instance
+_buffer = None
+_buffer_lock = threading.Lock()
+
+def get_write_buffer():
+    """Get the global write-behind buffer, configured from the current app."""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = WriteBehindBuffer(
+                    flush_interval=current_app.config.get('WRITE_BEHIND_FLUSH_INTERVAL', 5.0),
+                    max_pending=current_app.config.get('WRITE_BEHIND_MAX_PENDING', 1000),
+                    logger=current_app.logger
+                )
+                atexit.register(_buffer.stop)
+    return _buffer